@@ -12,51 +12,243 @@ import argparse
 import time
 import os
 import logging
+import threading
+import concurrent.futures
 from eib_aws_utils.dynamo_utils import FloatSerializer, FloatDeserializer
+from record_cache import RecordCache
+from single_table import Single_Table, TTL_ATTRIBUTE
 
 from dotenv import load_dotenv, find_dotenv
 
 from unittest.mock import patch
 
-class DDB_Single_Table():
+# how often (seconds) the shared object re-checks the table existence, 0 = once per process
+DEFAULT_VERIFY_INTERVAL = 0
+# how often (seconds) to re-check an index which is not yet active (being created by migration)
+PENDING_INDEX_RECHECK = 60
+
+# BatchWriteItem limit
+BATCH_WRITE_SIZE = 25
+# retries of unprocessed batch items, backoff starts at BATCH_RETRY_DELAY and doubles up to BATCH_RETRY_MAX_DELAY
+BATCH_RETRIES = 8
+BATCH_RETRY_DELAY = 0.05
+BATCH_RETRY_MAX_DELAY = 2
+# max. number of keys in one BatchGetItem request
+BATCH_GET_SIZE = 100
+# retries of a transaction cancelled because of a conflict with another transaction
+TRANSACTION_RETRIES = 5
+# threads of the parallel batch writes, the executor (and the threads' boto3 resources) is reused
+BATCH_WRITE_WORKERS = 8
+
+# sk -> pvalue, used for "secondary key" lookups
+GSI_SK_PVALUE = "gsi_1"
+# pk -> pvalue, used for "all items under pk with pvalue" queries
+GSI_PK_PVALUE = "gsi_2"
+
+GSI_DEFINITIONS = {
+    GSI_SK_PVALUE: {
+        'IndexName': GSI_SK_PVALUE,
+        'KeySchema': [
+                {
+                    'AttributeName': 'sk',
+                    'KeyType': 'HASH'
+                },
+                {
+                    'AttributeName': 'pvalue',
+                    'KeyType': 'RANGE'
+                },
+                ],
+                'Projection': {
+                    'ProjectionType': 'ALL'
+                },
+                # 'ProvisionedThroughput': {
+                #     'ReadCapacityUnits': 10,
+                #     'WriteCapacityUnits': 10
+                # }        
+        },
+    GSI_PK_PVALUE: {
+        'IndexName': GSI_PK_PVALUE,
+        'KeySchema': [
+                {
+                    'AttributeName': 'pk',
+                    'KeyType': 'HASH'
+                },
+                {
+                    'AttributeName': 'pvalue',
+                    'KeyType': 'RANGE'
+                },
+                ],
+                'Projection': {
+                    'ProjectionType': 'ALL'
+                },
+        },
+}
+
+ATTRIBUTE_DEFINITIONS = [
+    {
+        'AttributeName': 'pk',
+        'AttributeType': 'S'
+    },
+    {
+        'AttributeName': 'sk',
+        'AttributeType': 'S'
+    },
+    {
+    'AttributeName': 'pvalue',
+    'AttributeType': 'S'
+    }
+]
+
+class DDB_Single_Table(Single_Table):
+    """DynamoDB single table access
+    
+    The object is thread-safe. boto3 resources are not, so each thread gets its own
+    session, resource and client (created on first use and then reused).
+    Use DDB_Single_Table.shared() to get a process-wide instance which verifies
+    the table only once (or every verify_interval seconds) instead of on every request.
+    
+    Optional read-through cache (DYNAMODB_CACHE_SIZE > 0) serves get_db_record() for the
+    sk types with a TTL in record_cache.DEFAULT_CACHE_TTLS (or cache_ttls argument).
+    """
     
-    db = None
-    db_client = None
     table_name = None
     endpoint_url = None
-    table = None
+    verify_interval = DEFAULT_VERIFY_INTERVAL
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.DEBUG)
+    
+    _shared_tables = {}
+    _shared_lock = threading.Lock()
 
 # allow to work with Float
 # see: https://github.com/boto/boto3/issues/665    
     # @patch("boto3.dynamodb.types.TypeSerializer", new=FloatSerializer)
     # @patch("boto3.dynamodb.types.TypeDeserializer", new=FloatDeserializer)
-    def __init__(self, table_name = None, endpoint_url = None):
+    def __init__(self, table_name = None, endpoint_url = None, verify_interval = None, cache_size = None, cache_ttls = None):
         if table_name is None:
             table_name = os.getenv("DYNAMODB_TABLE_NAME")
         if endpoint_url is None:
             endpoint_url = os.getenv("DYNAMODB_ENDPOINT_URL")
+        if verify_interval is None:
+            verify_interval = int(os.getenv("DYNAMODB_VERIFY_INTERVAL", DEFAULT_VERIFY_INTERVAL))
+        
+        if cache_size is None:
+            cache_size = int(os.getenv("DYNAMODB_CACHE_SIZE", 0))
         
         self.table_name = table_name
         self.endpoint_url = endpoint_url
+        self.verify_interval = verify_interval
+        self.cache = RecordCache(max_size = cache_size, ttls = cache_ttls) if cache_size > 0 else None
+        
+        self._local = threading.local()
+        self._verify_lock = threading.Lock()
+        self._verified_at = None
+        self._active_indexes = set()
+        self._batch_executor = None
+        self._batch_executor_lock = threading.Lock()
         
-        self.db = boto3.resource('dynamodb', endpoint_url=endpoint_url)
-        self.db_client = boto3.client("dynamodb", endpoint_url=endpoint_url)
-        # self.table = self.initialize_table()
-        self.table = self.setup_table()
+        self.verify_table()
         self.logger.debug("initialized for table {}, endpoint {}".format(self.table_name, self.endpoint_url))
-
+        
+    @classmethod
+    def shared(cls, table_name = None, endpoint_url = None):
+        """return a process-wide instance for the table/endpoint pair
+        
+        The instance is created on the first call and reused afterwards (across Flask threads
+        and warm Zappa invocations). The table existence is re-checked only if the verify_interval expired.
+        
+        arguments:
+        table_name -- DynamoDB table name, default is DYNAMODB_TABLE_NAME env variable
+        endpoint_url -- DynamoDB endpoint, default is DYNAMODB_ENDPOINT_URL env variable
+        """
+        if table_name is None:
+            table_name = os.getenv("DYNAMODB_TABLE_NAME")
+        if endpoint_url is None:
+            endpoint_url = os.getenv("DYNAMODB_ENDPOINT_URL")
+            
+        key = (table_name, endpoint_url)
+        with cls._shared_lock:
+            ddb = cls._shared_tables.get(key)
+            if ddb is None:
+                ddb = cls(table_name = table_name, endpoint_url = endpoint_url)
+                cls._shared_tables[key] = ddb
+                return ddb
+                
+        ddb.verify_table()
+        return ddb
+        
+    def _thread_resources(self):
+        local = self._local
+        if getattr(local, "db", None) is None:
+            session = boto3.session.Session()
+            local.db = session.resource("dynamodb", endpoint_url=self.endpoint_url)
+            local.db_client = session.client("dynamodb", endpoint_url=self.endpoint_url)
+            local.table = local.db.Table(self.table_name)
+        return local
+        
+    def _get_batch_executor(self):
+        # created on the first parallel batch and kept for the object lifetime,
+        # so the worker threads keep their boto3 sessions (see _thread_resources)
+        with self._batch_executor_lock:
+            if self._batch_executor is None:
+                self._batch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=BATCH_WRITE_WORKERS, thread_name_prefix="ddb_batch")
+            return self._batch_executor
+        
+    @property
+    def db(self):
+        return self._thread_resources().db
+        
+    @property
+    def db_client(self):
+        return self._thread_resources().db_client
+        
+    @property
+    def table(self):
+        return self._thread_resources().table
+        
+    def verify_table(self, force = False):
+        """make sure the table exists, create it if needed
+        
+        the check is done once per object lifetime or after verify_interval seconds
+        
+        arguments:
+        force -- check the table even if the verify_interval didn't expire
+        """
+        if not force and not self._verification_expired():
+            return
+            
+        with self._verify_lock:
+            if not force and not self._verification_expired():
+                return
+            self.setup_table()
+            self._verified_at = time.monotonic()
+            
+    def _verification_expired(self):
+        if self._verified_at is None:
+            return True
+        elapsed = time.monotonic() - self._verified_at
+        if GSI_PK_PVALUE not in self._active_indexes and elapsed > PENDING_INDEX_RECHECK:
+            return True # index migration may have finished meanwhile
+        if self.verify_interval <= 0:
+            return False
+        return elapsed > self.verify_interval
+        
+    def _update_active_indexes(self, table_description):
+        indexes = table_description.get("GlobalSecondaryIndexes", [])
+        self._active_indexes = set([idx["IndexName"] for idx in indexes if idx.get("IndexStatus", "ACTIVE") == "ACTIVE"])
+        if GSI_PK_PVALUE not in self._active_indexes:
+            self.logger.warning("index {} not active in table {}, run the migration (-m) to create it. Falling back to scan.".format(GSI_PK_PVALUE, self.table_name))
 
     def setup_table(self):
-        existing_tables = self.db_client.list_tables()['TableNames']
-        if self.table_name not in existing_tables:
-            self.logger.info("table {} not found, creating new...".format(self.table_name))
-            return self.initialize_table()
-        else:
+        # describe_table instead of list_tables - one call no matter how many tables are in the account
+        try:
             response = self.db_client.describe_table(TableName=self.table_name)
             self.logger.info("table {} already exists.".format(self.table_name))
-            return self.db.Table(self.table_name)
+            self._update_active_indexes(response["Table"])
+            return self.table
+        except self.db_client.exceptions.ResourceNotFoundException:
+            self.logger.info("table {} not found, creating new...".format(self.table_name))
+            return self.initialize_table()
                 
     def initialize_table(self):
         try:
@@ -71,42 +263,8 @@ class DDB_Single_Table():
                         'KeyType': 'RANGE'
                     },
                 ],
-                AttributeDefinitions=[
-                    {
-                        'AttributeName': 'pk',
-                        'AttributeType': 'S'
-                    },
-                    {
-                        'AttributeName': 'sk',
-                        'AttributeType': 'S'
-                    },
-                    {
-                    'AttributeName': 'pvalue',
-                    'AttributeType': 'S'
-                    }
-                ],
-                GlobalSecondaryIndexes=[
-                {
-                    'IndexName': 'gsi_1',
-                    'KeySchema': [
-                            {
-                                'AttributeName': 'sk',
-                                'KeyType': 'HASH'
-                            },
-                            {
-                                'AttributeName': 'pvalue',
-                                'KeyType': 'RANGE'
-                            },
-                            ],
-                            'Projection': {
-                                'ProjectionType': 'ALL'
-                            },
-                            # 'ProvisionedThroughput': {
-                            #     'ReadCapacityUnits': 10,
-                            #     'WriteCapacityUnits': 10
-                            # }        
-                    },
-                ],
+                AttributeDefinitions=ATTRIBUTE_DEFINITIONS,
+                GlobalSecondaryIndexes=list(GSI_DEFINITIONS.values()),
                 # ProvisionedThroughput={
                 #     'ReadCapacityUnits': 10,
                 #     'WriteCapacityUnits': 10
@@ -116,9 +274,55 @@ class DDB_Single_Table():
             )
             self.logger.info("Waiting for table to create...")
             table.meta.client.get_waiter('table_exists').wait(TableName=self.table_name)
+            self._active_indexes = set(GSI_DEFINITIONS.keys())
+            self.enable_ttl()
             return table
         except Exception as e:
             self.logger.info("Create table exception: {}".format(e))
+            
+    def migrate_table(self, wait = True):
+        """add secondary indexes missing in an existing table
+        
+        DynamoDB allows to create only one index per update_table call.
+        
+        arguments:
+        wait -- wait until the new index is active (backfill may take a while on a large table)
+        """
+        response = self.db_client.describe_table(TableName=self.table_name)
+        existing = [idx["IndexName"] for idx in response["Table"].get("GlobalSecondaryIndexes", [])]
+        for index_name, index_definition in GSI_DEFINITIONS.items():
+            if index_name in existing:
+                continue
+            self.logger.info("creating index {} in table {}".format(index_name, self.table_name))
+            self.db_client.update_table(TableName=self.table_name,
+                AttributeDefinitions=ATTRIBUTE_DEFINITIONS,
+                GlobalSecondaryIndexUpdates=[{"Create": index_definition}]
+            )
+            while wait:
+                time.sleep(5)
+                response = self.db_client.describe_table(TableName=self.table_name)
+                status = [idx.get("IndexStatus") for idx in response["Table"].get("GlobalSecondaryIndexes", []) if idx["IndexName"] == index_name]
+                self.logger.info("index {} status: {}".format(index_name, status))
+                if status == ["ACTIVE"]:
+                    break
+                    
+        self.enable_ttl()
+        self.verify_table(force = True)
+        
+    def enable_ttl(self):
+        """let DynamoDB delete the expired records, see single_table.TTL_ATTRIBUTE"""
+        try:
+            response = self.db_client.describe_time_to_live(TableName=self.table_name)
+            ttl_description = response.get("TimeToLiveDescription", {})
+            if ttl_description.get("TimeToLiveStatus") in ["ENABLED", "ENABLING"]:
+                self.logger.info("TTL already enabled in table {} on {}".format(self.table_name, ttl_description.get("AttributeName")))
+                return
+            self.db_client.update_time_to_live(TableName=self.table_name,
+                TimeToLiveSpecification={"Enabled": True, "AttributeName": TTL_ATTRIBUTE}
+            )
+            self.logger.info("TTL enabled in table {} on {}".format(self.table_name, TTL_ATTRIBUTE))
+        except Exception as e:
+            self.logger.error("Enable TTL exception: {}".format(e))
     
     def teardown(self):
         self.logger.info("Deleting the {} table...".format(self.table_name))
@@ -127,92 +331,418 @@ class DDB_Single_Table():
         except Exception as e:
             self.logger.error("Delete table exception: {}".format(e))
 
-    def save_db_record(self, pk, sk, pvalue, **items):
+    def _fix_empty_strings(self, pvalue, items):
         if pvalue == "":
             pvalue = " "
         if isinstance(items, dict):
             for (key, value) in items.items():  # fix 'empty string' problem in DynamoDB
                 if value == "":                 # https://forums.aws.amazon.com/thread.jspa?threadID=90137
                     items[key] = " "
+        return pvalue, items
+
+    def save_db_record(self, pk, sk, pvalue, **items):
+        pvalue, items = self._fix_empty_strings(pvalue, items)
         try:
             table_item = {"pk": pk, "sk": sk, "pvalue": pvalue, **items}
             self.logger.debug("About to store: {}".format(table_item))
             db_response = self.table.put_item(Item=table_item)
+            self._cache_put(pk, sk, table_item)
             return db_response
         except Exception as e:
+            self._cache_invalidate(pk, sk)
             self.logger.error("Save DB record exception: {}".format(e))
             
     def delete_db_record(self, pk, sk):
         try:
             self.logger.debug("About to delete: {} - {}".format(pk, sk))
             db_response = self.table.delete_item(Key={"pk": pk, "sk": sk})
+            self._cache_put(pk, sk, None)
             return db_response
         except Exception as e:
+            self._cache_invalidate(pk, sk)
             self.logger.error("Delete DB record exception: {}".format(e))
             
+    def _cache_put(self, pk, sk, record):
+        if self.cache is not None:
+            self.cache.put(pk, sk, record)
+            
+    def _cache_invalidate(self, pk, sk):
+        if self.cache is not None:
+            self.cache.invalidate(pk, sk)
+            
+    def _cache_invalidate_keys(self, keys):
+        if self.cache is not None:
+            for (pk, sk) in keys:
+                self.cache.invalidate(pk, sk)
+            
+    def cache_stats(self):
+        """hit/miss counters of the read-through cache, None if the cache is disabled"""
+        if self.cache is not None:
+            return self.cache.stats()
+            
+    def _paged_read(self, read_function, page_size, projection, consistent_read, params):
+        """call query or scan repeatedly following the LastEvaluatedKey, yield items one by one"""
+        params = dict(params)
+        if page_size is not None:
+            params["Limit"] = page_size
+        if projection:
+            names = {"#p{}".format(i): attr for (i, attr) in enumerate(projection)}
+            params["ProjectionExpression"] = ", ".join(names.keys())
+            params["ExpressionAttributeNames"] = {**params.get("ExpressionAttributeNames", {}), **names}
+        if consistent_read:
+            params["ConsistentRead"] = True
+            
+        while True:
+            page = read_function(**params)
+            for item in page.get("Items", []):
+                yield item
+            last_key = page.get("LastEvaluatedKey")
+            if last_key is None:
+                break
+            params["ExclusiveStartKey"] = last_key
+            
+    def iter_query(self, page_size=None, projection=None, consistent_read=False, **params):
+        """lazy paginated query, items are fetched page by page as the caller consumes them
+        
+        arguments:
+        page_size -- max. number of items read per request (Limit)
+        projection -- list of attribute names to be returned, default all
+        consistent_read -- strongly consistent read (not available for global secondary indexes)
+        params -- table.query() parameters (KeyConditionExpression, IndexName, FilterExpression, ...)
+        """
+        return self._paged_read(self.table.query, page_size, projection, consistent_read, params)
+        
+    def iter_scan(self, page_size=None, projection=None, consistent_read=False, **params):
+        """lazy paginated scan, see iter_query()
+        
+        arguments:
+        params -- table.scan() parameters (IndexName, FilterExpression, ...)
+        """
+        return self._paged_read(self.table.scan, page_size, projection, consistent_read, params)
+        
+    def iter_db_records(self, pk, pvalue_condition=None, sk_from=None, sk_to=None, reverse=False, page_size=None, projection=None, consistent_read=False):
+        """lazy iteration over records with the primary key
+        
+        If pvalue_condition is used and the table is migrated, the (pk, pvalue) index is used and the records
+        are not ordered by sk. Otherwise the records come ordered by sk.
+        
+        arguments:
+        pk -- primary key
+        pvalue_condition -- return only records with this pvalue
+        sk_from -- return only records with sk >= sk_from
+        sk_to -- return only records with sk < sk_to
+        reverse -- descending order by sk
+        page_size, projection, consistent_read -- see iter_query()
+        """
+        # only one sort key condition is allowed in KeyConditionExpression,
+        # "between" is inclusive, so the upper bound is excluded by a filter
+        sk_key_condition = None
+        filter_conditions = []
+        if sk_from is not None and sk_to is not None:
+            sk_key_condition = Key("sk").between(sk_from, sk_to)
+            filter_conditions.append(Attr("sk").lt(sk_to))
+        elif sk_from is not None:
+            sk_key_condition = Key("sk").gte(sk_from)
+        elif sk_to is not None:
+            sk_key_condition = Key("sk").lt(sk_to)
+            
+        params = {"ScanIndexForward": not reverse}
+        if pvalue_condition is not None and GSI_PK_PVALUE in self._active_indexes:
+            params["IndexName"] = GSI_PK_PVALUE
+            params["KeyConditionExpression"] = Key("pk").eq(pk) & Key("pvalue").eq(pvalue_condition)
+            filter_conditions = [Attr("sk").gte(sk_from)] if sk_from is not None else []
+            if sk_to is not None:
+                filter_conditions.append(Attr("sk").lt(sk_to))
+            consistent_read = False
+        else:
+            params["KeyConditionExpression"] = Key("pk").eq(pk)
+            if sk_key_condition is not None:
+                params["KeyConditionExpression"] &= sk_key_condition
+            if pvalue_condition is not None: # table not migrated yet
+                filter_conditions.append(Attr("pvalue").eq(pvalue_condition))
+                
+        if filter_conditions:
+            params["FilterExpression"] = filter_conditions[0]
+            for filter_condition in filter_conditions[1:]:
+                params["FilterExpression"] &= filter_condition
+                    
+        try:
+            for item in self.iter_query(page_size=page_size, projection=projection, consistent_read=consistent_read, **params):
+                yield item
+        except Exception as e:
+            self.logger.error("Iterate DB records exception: {}".format(e))
+            
+    def save_db_records_batch(self, records, parallel=False):
+        """save multiple records using BatchWriteItem
+        
+        arguments:
+        records -- list of dicts, each has to contain "pk", "sk" and "pvalue", other keys are saved as items
+        parallel -- write the 25-item chunks in parallel
+        
+        returns True if all records were saved
+        """
+        requests = []
+        for record in records:
+            record = dict(record)
+            pvalue, items = self._fix_empty_strings(record.pop("pvalue"), record)
+            requests.append({"PutRequest": {"Item": {**items, "pvalue": pvalue}}})
+        self.logger.debug("About to store {} records in batch".format(len(requests)))
+        return self._batch_write(requests, parallel)
+        
+    def delete_db_records_batch(self, keys, parallel=False):
+        """delete multiple records using BatchWriteItem
+        
+        arguments:
+        keys -- list of (pk, sk) tuples
+        parallel -- delete the 25-item chunks in parallel
+        
+        returns True if all records were deleted
+        """
+        requests = [{"DeleteRequest": {"Key": {"pk": pk, "sk": sk}}} for (pk, sk) in keys]
+        self.logger.debug("About to delete {} records in batch".format(len(requests)))
+        return self._batch_write(requests, parallel)
+        
+    def _batch_write(self, requests, parallel):
+        # BatchWriteItem refuses duplicate keys in one request, the last one wins
+        unique_requests = {}
+        for request in requests:
+            item = request.get("PutRequest", {}).get("Item") or request["DeleteRequest"]["Key"]
+            unique_requests[(item["pk"], item["sk"])] = request
+        requests = list(unique_requests.values())
+        
+        # a record read (and cached) while the batch is being written may be stale, invalidate also after the write
+        self._cache_invalidate_keys(unique_requests.keys())
+        try:
+            chunks = [requests[i:i + BATCH_WRITE_SIZE] for i in range(0, len(requests), BATCH_WRITE_SIZE)]
+            if parallel and len(chunks) > 1:
+                results = list(self._get_batch_executor().map(self._batch_write_chunk, chunks))
+            else:
+                results = [self._batch_write_chunk(chunk) for chunk in chunks]
+        finally:
+            self._cache_invalidate_keys(unique_requests.keys())
+            
+        return all(results)
+        
+    def _batch_write_chunk(self, chunk):
+        request_items = {self.table_name: chunk}
+        delay = BATCH_RETRY_DELAY
+        try:
+            for attempt in range(BATCH_RETRIES + 1):
+                db_response = self.db.batch_write_item(RequestItems=request_items)
+                request_items = db_response.get("UnprocessedItems", {})
+                if not request_items.get(self.table_name):
+                    return True
+                if attempt < BATCH_RETRIES:
+                    self.logger.debug("{} unprocessed batch items, retry in {}s".format(len(request_items[self.table_name]), delay))
+                    time.sleep(delay)
+                    delay = min(delay * 2, BATCH_RETRY_MAX_DELAY)
+            self.logger.error("Batch write failed, {} items unprocessed".format(len(request_items[self.table_name])))
+        except Exception as e:
+            self.logger.error("Batch write exception: {}".format(e))
+        return False
+            
+    def iter_all_db_records(self, page_size=None):
+        try:
+            for item in self.iter_scan(page_size=page_size):
+                yield item
+        except Exception as e:
+            self.logger.error("Iterate all DB records exception: {}".format(e))
+            
+    def _write_request(self, operation, serializer):
+        """build a low-level Put/Update/Delete request from a transact_write_db_records() operation"""
+        names = {}
+        values = {}
+        def name(attr):
+            placeholder = "#a{}".format(len(names))
+            names[placeholder] = attr
+            return placeholder
+        def value(val):
+            placeholder = ":v{}".format(len(values))
+            values[placeholder] = serializer.serialize(val)
+            return placeholder
+            
+        pk, sk = self.operation_key(operation)
+        key = {"pk": serializer.serialize(pk), "sk": serializer.serialize(sk)}
+        if "put" in operation:
+            record = dict(operation["put"])
+            pvalue, items = self._fix_empty_strings(record.pop("pvalue"), record)
+            request_type = "Put"
+            request = {"Item": {attr: serializer.serialize(val) for (attr, val) in {**items, "pvalue": pvalue}.items()}}
+        elif "update" in operation:
+            request_type = "Update"
+            set_items = operation.get("set", {})
+            if "pvalue" in set_items:
+                set_items = {**set_items, "pvalue": self._fix_empty_strings(set_items["pvalue"], {})[0]}
+            expression = []
+            if set_items:
+                expression.append("SET " + ", ".join(["{} = {}".format(name(attr), value(val)) for (attr, val) in set_items.items()]))
+            if operation.get("add"):
+                expression.append("ADD " + ", ".join(["{} {}".format(name(attr), value(val)) for (attr, val) in operation["add"].items()]))
+            request = {"Key": key, "UpdateExpression": " ".join(expression)}
+        else:
+            request_type = "Delete"
+            request = {"Key": key}
+            
+        conditions = []
+        for (attr, val) in operation.get("expected", {}).items():
+            if val is None:
+                conditions.append("attribute_not_exists({})".format(name(attr)))
+            else:
+                conditions.append("{} = {}".format(name(attr), value(val)))
+        if conditions:
+            request["ConditionExpression"] = " AND ".join(conditions)
+        if names:
+            request["ExpressionAttributeNames"] = names
+        if values:
+            request["ExpressionAttributeValues"] = values
+        request["TableName"] = self.table_name
+        
+        return request_type, request
+        
+    def transact_write_db_records(self, operations):
+        serializer = types.TypeSerializer()
+        requests = [self._write_request(operation, serializer) for operation in operations]
+        keys = [self.operation_key(operation) for operation in operations]
+        self._cache_invalidate_keys(keys)
+        try:
+            return self._transact_write(operations, requests)
+        finally:
+            # a record read (and cached) while the write was in progress may be stale
+            self._cache_invalidate_keys(keys)
+            
+    def _transact_write(self, operations, requests):
+        client = self.db_client
+        delay = BATCH_RETRY_DELAY
+        try:
+            for attempt in range(TRANSACTION_RETRIES + 1):
+                try:
+                    if len(requests) == 1:
+                        # single conditional write is cheaper than a transaction
+                        request_type, request = requests[0]
+                        write_function = {"Put": client.put_item, "Update": client.update_item, "Delete": client.delete_item}[request_type]
+                        write_function(**request)
+                    else:
+                        client.transact_write_items(TransactItems=[{request_type: request} for (request_type, request) in requests])
+                    return True
+                except client.exceptions.ConditionalCheckFailedException:
+                    self.logger.debug("Conditional write failed: {}".format(operations))
+                    return False
+                except client.exceptions.TransactionCanceledException as e:
+                    reasons = [reason.get("Code") for reason in e.response.get("CancellationReasons", [])]
+                    if "ConditionalCheckFailed" in reasons:
+                        self.logger.debug("Transaction condition failed: {}, {}".format(reasons, operations))
+                        return False
+                    if attempt < TRANSACTION_RETRIES:
+                        self.logger.debug("Transaction cancelled: {}, retry in {}s".format(reasons, delay))
+                        time.sleep(delay)
+                        delay = min(delay * 2, BATCH_RETRY_MAX_DELAY)
+                    else:
+                        self.logger.error("Transaction cancelled: {}".format(reasons))
+        except Exception as e:
+            self.logger.error("Transact write exception: {}".format(e))
+        return False
+        
     def get_db_records_by_secondary_key(self, sk, pvalue_condition=None):
         params = {
-            "IndexName": "gsi_1",
+            "IndexName": GSI_SK_PVALUE,
             "KeyConditionExpression": Key("sk").eq(sk)
         }
         if pvalue_condition is not None:
             params ["KeyConditionExpression"] &= Key("pvalue").eq(pvalue_condition)
         try:
-            self.logger.error("query params: {}".format(params))
-            db_record = self.table.query(**params)
-            db_response = db_record.get("Items", [])
+            self.logger.debug("query params: {}".format(params))
+            db_response = list(self.iter_query(**params))
             return db_response
         except Exception as e:
             self.logger.error("Get DB record by secondary key exception: {}".format(e))
                     
-    def get_db_record(self, pk, sk):
+    def get_db_record(self, pk, sk, consistent_read=False):
+        if self.cache is not None and not consistent_read:
+            found, record = self.cache.get(pk, sk)
+            if found:
+                return record
         try:
-            db_record = self.table.get_item(Key={"pk": str(pk), "sk": sk})
+            db_record = self.table.get_item(Key={"pk": str(pk), "sk": sk}, ConsistentRead=consistent_read)
             if "Item" in db_record:
                 ## TODO: check if token is not expired, generate new using refresh token if needed
+                self._cache_put(pk, sk, db_record["Item"])
                 return db_record["Item"]
             else:
+                self._cache_put(pk, sk, None)
                 return None    
         except Exception as e:
             self.logger.error("Get DB record exception: {}".format(e))
 
+    def get_db_records_batch(self, keys, consistent_read=False):
+        records = {}
+        missing = []
+        for (pk, sk) in dict.fromkeys((str(pk), sk) for (pk, sk) in keys):
+            if self.cache is not None and not consistent_read:
+                found, record = self.cache.get(pk, sk)
+                if found:
+                    if record is not None:
+                        records[(pk, sk)] = record
+                    continue
+            missing.append((pk, sk))
+            
+        for start in range(0, len(missing), BATCH_GET_SIZE):
+            chunk = missing[start:start + BATCH_GET_SIZE]
+            request_items = {self.table_name: {"Keys": [{"pk": pk, "sk": sk} for (pk, sk) in chunk], "ConsistentRead": consistent_read}}
+            delay = BATCH_RETRY_DELAY
+            try:
+                for attempt in range(BATCH_RETRIES + 1):
+                    db_response = self.db.batch_get_item(RequestItems=request_items)
+                    for item in db_response.get("Responses", {}).get(self.table_name, []):
+                        records[(item["pk"], item["sk"])] = item
+                    request_items = db_response.get("UnprocessedKeys", {})
+                    if not request_items.get(self.table_name):
+                        break
+                    if attempt < BATCH_RETRIES:
+                        self.logger.debug("{} unprocessed batch keys, retry in {}s".format(len(request_items[self.table_name]["Keys"]), delay))
+                        time.sleep(delay)
+                        delay = min(delay * 2, BATCH_RETRY_MAX_DELAY)
+                else:
+                    self.logger.error("Batch get failed, {} keys unprocessed".format(len(request_items[self.table_name]["Keys"])))
+                    continue
+                for (pk, sk) in chunk:
+                    self._cache_put(pk, sk, records.get((pk, sk)))
+            except Exception as e:
+                self.logger.error("Batch get exception: {}".format(e))
+                
+        return records
+
     def query_db_record(self, pk, pvalue_condition=None):
+        """list of all records with the primary key (and pvalue), see iter_db_records()"""
         try:
-            if pvalue_condition is None:
-                db_record = self.table.query(
-                    KeyConditionExpression=Key("pk").eq(pk)
-                )
-            else:
-                db_record = self.table.scan(
-                    IndexName="gsi_1",
-                    # KeyConditionExpression=Key("pk").eq(pk),
-                    FilterExpression=Key("pk").eq(pk) & Attr("pvalue").eq(pvalue_condition)
-                    # ExpressionAttributeValues={
-                    #     ":pvalue": {'S': pvalue_condition},
-                    # }
-                )
-            db_response = db_record.get("Items", [])
+            db_response = list(self.iter_db_records(pk, pvalue_condition))
             return db_response
         except Exception as e:
             self.logger.error("Query DB record list exception: {}".format(e))
 
+    def purge_expired_db_records(self, now=None):
+        # DynamoDB deletes the expired records by itself once TTL is enabled
+        return 0
+        
     def delete_db_records_by_secondary_key(self, sk):
         try:
-            for record in self.get_db_records_by_secondary_key(sk):
-                db_response = self.delete_db_record(record["pk"], sk)
-                self.logger.debug("delete DB record {}: {}".format(record["pk"], db_response))
+            keys = [(record["pk"], sk) for record in self.get_db_records_by_secondary_key(sk)]
+            db_response = self.delete_db_records_batch(keys)
+            self.logger.debug("delete DB records {}: {}".format(keys, db_response))
         except Exception as e:
             self.logger.error("Delete DB record by secondary key exception: {}".format(e))
 
 def handler():
     parser = argparse.ArgumentParser()
     parser.add_argument("-t", "--teardown", help="delete DynamoDB table", action='store_true')
+    parser.add_argument("-m", "--migrate", help="add missing secondary indexes to an existing table and enable TTL", action='store_true')
     args = parser.parse_args()
     
     ddb = DDB_Single_Table()
     
     if args.teardown:
         ddb.teardown()
+    elif args.migrate:
+        ddb.migrate_table()
         
     return ddb
     
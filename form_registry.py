@@ -0,0 +1,72 @@
+"""
+Registry of the Bot's forms (message id -> form type)
+A form is registered when the Bot sends it, so a click on the form is routed without a database
+read. Forms sent by another process (or before a restart) are looked up by the loader function
+(FORM_INFO record, see read_form_type()) and cached. A form which is not found is looked up again
+on the next click, its form info may be just being saved by another process. The loader has to read
+past the storage read cache (it caches misses too).
+"""
+
+import logging
+import os
+
+from record_cache import RecordCache
+
+DEFAULT_FORM_REGISTRY_SIZE = 10000
+# seconds to keep a form type looked up by the loader
+DEFAULT_FORM_REGISTRY_TTL = 300
+
+def read_form_type(table, form_id):
+    """return form type of the message from its FORM_INFO record, None if not found
+
+    the record is read consistently, a cached miss would hide a form just saved by another process
+
+    arguments:
+    table -- storage object
+    form_id -- message id of the form
+    """
+    form_info = table.get_db_record(form_id, "FORM_INFO", consistent_read = True)
+    return form_info.get("pvalue") if form_info is not None else None
+
+class FormRegistry():
+    """form type lookups
+
+    arguments:
+    loader -- function returning form type of the message id, None if it's not a form
+    max_size -- max. number of forms in the registry, default FORM_REGISTRY_SIZE env variable
+    ttl -- seconds to keep a loaded form type, default FORM_REGISTRY_TTL env variable
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, loader, max_size = None, ttl = None):
+        if max_size is None:
+            max_size = int(os.getenv("FORM_REGISTRY_SIZE", DEFAULT_FORM_REGISTRY_SIZE))
+        if ttl is None:
+            ttl = int(os.getenv("FORM_REGISTRY_TTL", DEFAULT_FORM_REGISTRY_TTL))
+        self.loader = loader
+        self.cache = RecordCache(max_size = max_size, ttls = {"FORM": ttl})
+        self.loads = 0
+
+    def register(self, form_id, form_type):
+        self.cache.put(form_id, "FORM", {"form_type": form_type})
+
+    def remove(self, form_id):
+        self.cache.invalidate(form_id, "FORM")
+
+    def get_cached(self, form_id):
+        """return form type of the message id if registered, no database read"""
+        found, record = self.cache.get(form_id, "FORM")
+        return record["form_type"] if found and record is not None else None
+
+    def get(self, form_id):
+        """return form type of the message id, None if it's not a form"""
+        form_type = self.get_cached(form_id)
+        if form_type is None:
+            form_type = self.loader(form_id)
+            self.loads += 1
+            if form_type is not None:
+                self.register(form_id, form_type)
+        return form_type
+
+    def stats(self):
+        return {**self.cache.stats(), "loads": self.loads}
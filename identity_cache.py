@@ -0,0 +1,86 @@
+"""
+Cache of values which are static per deployment (Bot's identity, webhook target URL)
+A value is loaded on first use, then served from the cache. After the refresh interval
+the cached value is still returned and a background thread loads a new one.
+invalidate() drops the values, for example when the access token was rejected.
+"""
+
+import logging
+import threading
+import time
+
+DEFAULT_IDENTITY_REFRESH = 6 * 3600
+
+class IdentityCache():
+    """values loaded by registered loader functions
+
+    arguments:
+    refresh -- seconds after which a value is reloaded in the background
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, refresh = DEFAULT_IDENTITY_REFRESH):
+        self.refresh = refresh
+        self._loaders = {}
+        self._values = {} # name -> (load time, value)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def register(self, name, loader):
+        """set the loader function of the value, the function returns the value or None if it cannot be loaded"""
+        self._loaders[name] = loader
+
+    def get(self, name):
+        """return the value, it's loaded if not yet cached"""
+        entry = self._values.get(name)
+        if entry is None:
+            with self._lock:
+                entry = self._values.get(name)
+                if entry is None:
+                    return self._load(name)
+        if time.monotonic() - entry[0] >= self.refresh:
+            self._refresh_in_background(name)
+        return entry[1]
+
+    def invalidate(self, name = None):
+        """drop the value (all values if name is None), next get() loads it again"""
+        with self._lock:
+            if name is None:
+                self._values.clear()
+            else:
+                self._values.pop(name, None)
+        self.logger.debug("invalidated {}".format(name or "all values"))
+
+    def invalidate_on_auth_error(self, api_error):
+        """drop all values if the Webex API rejected the access token"""
+        if getattr(api_error, "status_code", None) == 401:
+            self.invalidate()
+
+    def _load(self, name):
+        value = self._loaders[name]()
+        self.loads += 1
+        if value is not None:
+            self._values[name] = (time.monotonic(), value)
+        return value
+
+    def _refresh_in_background(self, name):
+        with self._lock:
+            if name in self._refreshing:
+                return
+            self._refreshing.add(name)
+
+        def refresh():
+            try:
+                value = self._loaders[name]()
+                self.loads += 1
+                if value is not None:
+                    with self._lock:
+                        self._values[name] = (time.monotonic(), value)
+            except Exception as e:
+                self.logger.error("refresh of {} failed: {}".format(name, e))
+            finally:
+                with self._lock:
+                    self._refreshing.discard(name)
+
+        threading.Thread(target = refresh, daemon = True).start()
@@ -0,0 +1,121 @@
+"""
+Executor of ordered work per key
+Each key (Space id) is hashed to one of the lanes. A lane is a bounded queue served by a single
+thread, so the work of one Space runs strictly in the submission order, while the lanes run in
+parallel. A Space whose lane backlog is full gets its work rejected, other lanes are not affected.
+stats() reports backlog and latency (time from submission to the end of the work) per lane.
+"""
+
+import logging
+import queue
+import threading
+import time
+import zlib
+
+DEFAULT_LANES = 16
+DEFAULT_LANE_BACKLOG = 100
+
+class Lane():
+    def __init__(self, backlog):
+        self.queue = queue.Queue(maxsize = backlog)
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_backlog = 0
+        self.wait_time = 0.0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+class LaneExecutor():
+    """lanes of serialized work, see the module description
+
+    arguments:
+    lanes -- number of lanes (threads)
+    backlog -- maximum number of waiting work items per lane
+    name -- name prefix of the lane threads
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, lanes = DEFAULT_LANES, backlog = DEFAULT_LANE_BACKLOG, name = "lane"):
+        self.backlog = backlog
+        self.name = name
+        self._lanes = [Lane(backlog) for i in range(lanes)]
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def lane_index(self, key):
+        """lane of the key, the same key always goes to the same lane"""
+        return zlib.crc32(str(key).encode("utf-8")) % len(self._lanes)
+
+    def start(self):
+        """start the lane threads, called on first submit()"""
+        with self._lock:
+            if self._threads:
+                return
+            for (index, lane) in enumerate(self._lanes):
+                thread = threading.Thread(target = self._work, args = (lane,), name = "{}_{}".format(self.name, index), daemon = True)
+                thread.start()
+                self._threads.append(thread)
+        self.logger.debug("started {} lanes, backlog {}".format(len(self._lanes), self.backlog))
+
+    def submit(self, key, func, *args, **kwargs):
+        """queue func(*args, **kwargs) to the lane of the key, return False if the lane backlog is full"""
+        self.start()
+        lane = self._lanes[self.lane_index(key)]
+        try:
+            lane.queue.put_nowait((time.monotonic(), func, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                lane.dropped += 1
+            return False
+
+        with self._lock:
+            lane.submitted += 1
+            lane.max_backlog = max(lane.max_backlog, lane.queue.qsize())
+        return True
+
+    def join(self):
+        """wait until all submitted work is done"""
+        for lane in self._lanes:
+            lane.queue.join()
+
+    def _work(self, lane):
+        while True:
+            submitted, func, args, kwargs = lane.queue.get()
+            started = time.monotonic()
+            failed = False
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                failed = True
+                self.logger.exception("{} work failed: {}".format(self.name, e))
+            finally:
+                latency = time.monotonic() - submitted
+                with self._lock:
+                    lane.processed += 1
+                    lane.failed += int(failed)
+                    lane.wait_time += started - submitted
+                    lane.latency += latency
+                    lane.max_latency = max(lane.max_latency, latency)
+                lane.queue.task_done()
+
+    def stats(self):
+        """totals and per-lane backlog and latency"""
+        with self._lock:
+            lanes = [{
+                "backlog": lane.queue.qsize(),
+                "max_backlog": lane.max_backlog,
+                "submitted": lane.submitted,
+                "processed": lane.processed,
+                "failed": lane.failed,
+                "dropped": lane.dropped,
+                "avg_wait": round(lane.wait_time / lane.processed, 4) if lane.processed else 0.0,
+                "avg_latency": round(lane.latency / lane.processed, 4) if lane.processed else 0.0,
+                "max_latency": round(lane.max_latency, 4)
+            } for lane in self._lanes]
+
+        totals = {key: sum(lane[key] for lane in lanes) for key in ["backlog", "submitted", "processed", "failed", "dropped"]}
+        totals["max_backlog"] = max(lane["max_backlog"] for lane in lanes)
+        totals["max_latency"] = max(lane["max_latency"] for lane in lanes)
+        return {**totals, "lane_backlog": self.backlog, "lanes": lanes}
@@ -0,0 +1,279 @@
+"""
+Data lifecycle of the Bot's records
+1. Ephemeral records (votes, poll tally, poll form info) get an expiration time (single_table.TTL_ATTRIBUTE)
+when they are written. DynamoDB deletes them by its TTL, the other backends by purge_expired_db_records().
+Info of the other forms (welcome, meeting control) doesn't expire, the forms stay in the Space for good.
+The records archived with a meeting are kept at least ARCHIVE_AFTER_DAYS + ARCHIVE_GRACE_DAYS.
+2. Finished meetings older than ARCHIVE_AFTER_DAYS are moved from the table to gzipped JSON lines files
+in ARCHIVE_LOCATION - a local directory or s3://bucket/prefix (ARCHIVE_S3_ENDPOINT_URL for S3-compatible storage).
+The meeting archive contains MEETING_START, MEETING_END records of the Space, RESULTS records of the meeting
+and all records of the poll forms (votes, tally, form info).
+
+Run as a script:
+    python lifecycle.py archive -d 90
+    python lifecycle.py list
+    python lifecycle.py rehydrate <archive name>
+    python lifecycle.py purge
+"""
+
+import argparse
+import gzip
+import io
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from single_table import record_to_json, record_from_json, TTL_ATTRIBUTE
+from storage import get_shared_table, import_records, STORAGE_BACKENDS
+from timestamp import create_timestamp
+from results_codec import results_key
+
+DAY = 24 * 3600
+
+# record type -> days to keep, 0 = keep forever
+DEFAULT_RECORD_TTL_DAYS = {
+    "POLL_DATA": 120,
+    "POLL_TALLY": 120,
+    "FORM_INFO": 120,
+    "PERSON": 30,
+    "DELIVERY": 1
+}
+# forms whose FORM_INFO record expires
+EXPIRING_FORM_TYPES = ["POLL_FORM"]
+DEFAULT_ARCHIVE_AFTER_DAYS = 90
+# record types archived with the meeting, they must not expire before the meeting is archived
+ARCHIVED_RECORD_TYPES = ["POLL_DATA", "POLL_TALLY", "FORM_INFO"]
+# days for the periodic archive job to pick up a meeting
+ARCHIVE_GRACE_DAYS = 30
+DEFAULT_ARCHIVE_LOCATION = "archive"
+# days to keep the rehydrated records in the table
+REHYDRATE_TTL_DAYS = 7
+ARCHIVE_SUFFIX = ".jsonl.gz"
+
+logger = logging.getLogger(__name__)
+
+def archive_after_days():
+    return int(os.getenv("ARCHIVE_AFTER_DAYS", DEFAULT_ARCHIVE_AFTER_DAYS))
+
+def record_ttl_days(record_type):
+    """days to keep the record type, can be set by <record type>_TTL_DAYS env variable (for example POLL_DATA_TTL_DAYS)
+
+    the archived record types are kept at least until the meeting is archived
+    """
+    days = int(os.getenv("{}_TTL_DAYS".format(record_type), DEFAULT_RECORD_TTL_DAYS.get(record_type, 0)))
+    if days > 0 and record_type in ARCHIVED_RECORD_TYPES:
+        days = max(days, archive_after_days() + ARCHIVE_GRACE_DAYS)
+    return days
+
+def ttl_items(record_type, now = None):
+    """return items to be added to a record to make it expire, empty dict if the record type is kept forever
+
+    arguments:
+    record_type -- "POLL_DATA", "POLL_TALLY", "FORM_INFO", "PERSON", "DELIVERY"
+    now -- current time (seconds since epoch), default time.time()
+    """
+    days = record_ttl_days(record_type)
+    if days <= 0:
+        return {}
+    if now is None:
+        now = time.time()
+    return {TTL_ATTRIBUTE: int(now) + days * DAY}
+
+def form_info_ttl_items(form_type, now = None):
+    """ttl_items() of the FORM_INFO record, empty dict if the form type doesn't expire (see EXPIRING_FORM_TYPES)"""
+    if form_type not in EXPIRING_FORM_TYPES:
+        return {}
+    return ttl_items("FORM_INFO", now)
+
+class DirectoryArchive():
+    """archive files in a local directory"""
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path):
+        self.path = path
+
+    def put(self, name, data):
+        file_name = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        tmp_name = file_name + ".tmp"
+        with open(tmp_name, "wb") as archive_file:
+            archive_file.write(data)
+        os.replace(tmp_name, file_name)
+
+    def get(self, name):
+        with open(os.path.join(self.path, name), "rb") as archive_file:
+            return archive_file.read()
+
+    def list(self, prefix = ""):
+        names = []
+        for (dir_path, dir_names, file_names) in os.walk(self.path):
+            for file_name in file_names:
+                name = os.path.relpath(os.path.join(dir_path, file_name), self.path).replace(os.sep, "/")
+                if name.endswith(ARCHIVE_SUFFIX) and name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+class S3Archive():
+    """archive objects in an S3 (or S3-compatible) bucket"""
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, bucket, prefix = "", endpoint_url = None):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.s3 = boto3.client("s3", endpoint_url = endpoint_url)
+
+    def put(self, name, data):
+        self.s3.put_object(Bucket=self.bucket, Key=self.prefix + name, Body=data)
+
+    def get(self, name):
+        return self.s3.get_object(Bucket=self.bucket, Key=self.prefix + name)["Body"].read()
+
+    def list(self, prefix = ""):
+        names = []
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for obj in page.get("Contents", []):
+                names.append(obj["Key"][len(self.prefix):])
+        return sorted(names)
+
+def get_archive(location = None):
+    """return archive object for the location (directory or s3://bucket/prefix), default ARCHIVE_LOCATION env variable"""
+    if location is None:
+        location = os.getenv("ARCHIVE_LOCATION", DEFAULT_ARCHIVE_LOCATION)
+    if location.startswith("s3://"):
+        bucket, _, prefix = location[len("s3://"):].partition("/")
+        return S3Archive(bucket, prefix, endpoint_url = os.getenv("ARCHIVE_S3_ENDPOINT_URL"))
+    return DirectoryArchive(location)
+
+def find_finished_meetings(table, ended_before):
+    """return list of (room_id, meeting start, meeting end) of the meetings ended before the timestamp
+
+    the whole table is scanned, it's meant for maintenance jobs only
+    """
+    starts = {}
+    ends = {}
+    for record in table.iter_all_db_records():
+        if record["pvalue"] == "MEETING_START":
+            starts.setdefault(record["pk"], []).append(record["sk"])
+        elif record["pvalue"] == "MEETING_END":
+            ends.setdefault(record["pk"], []).append(record["sk"])
+
+    meetings = []
+    for (room_id, room_starts) in starts.items():
+        room_starts.sort()
+        room_ends = sorted(ends.get(room_id, []))
+        for (index, meeting_start) in enumerate(room_starts):
+            next_start = room_starts[index + 1] if index + 1 < len(room_starts) else None
+            meeting_end = next((end for end in room_ends if end > meeting_start and (next_start is None or end < next_start)), None)
+            if meeting_end is not None and meeting_end < ended_before:
+                meetings.append((room_id, meeting_start, meeting_end))
+
+    return meetings
+
+def collect_meeting_records(table, room_id, meeting_start, meeting_end):
+    """return all records belonging to the meeting"""
+    records = [record for record in table.iter_db_records(room_id, sk_from=meeting_start, sk_to=meeting_end + "~")
+        if record["pvalue"] in ["MEETING_START", "MEETING_END"]]
+    meeting_results = list(table.iter_db_records(results_key(room_id, meeting_start), "RESULTS"))
+    # legacy results saved under the Space id
+    meeting_results.extend(results for results in table.iter_db_records(room_id, "RESULTS") if meeting_start <= results.get("timestamp", "") <= meeting_end)
+    for results in meeting_results:
+        records.append(results)
+        records.extend(table.iter_db_records(results["sk"]))
+
+    return records
+
+def archive_name(room_id, meeting_start):
+    return "meetings/{}/{}{}".format(room_id, meeting_start.replace(":", ""), ARCHIVE_SUFFIX)
+
+def encode_archive(records):
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as gzip_file:
+        for record in records:
+            gzip_file.write((record_to_json(record) + "\n").encode("utf-8"))
+    return buffer.getvalue()
+
+def decode_archive(data):
+    with gzip.GzipFile(fileobj=io.BytesIO(data), mode="rb") as gzip_file:
+        for line in io.TextIOWrapper(gzip_file, encoding="utf-8"):
+            if line.strip():
+                yield record_from_json(line)
+
+def archive_meeting(table, archive, room_id, meeting_start, meeting_end, delete = True):
+    """write the meeting records to the archive and delete them from the table, return (archive name, number of records)
+
+    the records are deleted only after the archive was written and read back successfully
+    """
+    records = collect_meeting_records(table, room_id, meeting_start, meeting_end)
+    name = archive_name(room_id, meeting_start)
+    archive.put(name, encode_archive(records))
+    archived_count = sum(1 for record in decode_archive(archive.get(name)))
+    if archived_count != len(records):
+        logger.error("archive {} verification failed, {} records written, {} read".format(name, len(records), archived_count))
+        return name, 0
+
+    if delete:
+        table.delete_db_records_batch([(record["pk"], record["sk"]) for record in records], parallel=True)
+    logger.info("meeting archived to {}, {} records".format(name, len(records)))
+
+    return name, len(records)
+
+def archive_meetings(table, archive, older_than_days = None, delete = True):
+    """archive all meetings which ended more than older_than_days ago, return list of (archive name, number of records)"""
+    if older_than_days is None:
+        older_than_days = archive_after_days()
+    ended_before = create_timestamp(datetime.utcnow() - timedelta(days = older_than_days))
+    return [archive_meeting(table, archive, room_id, meeting_start, meeting_end, delete = delete)
+        for (room_id, meeting_start, meeting_end) in find_finished_meetings(table, ended_before)]
+
+def rehydrate_meeting(table, archive, name, keep_days = REHYDRATE_TTL_DAYS):
+    """load the archived meeting back to the table, return number of records
+
+    arguments:
+    keep_days -- the records expire after the number of days, 0 = keep forever
+    """
+    def with_expiration(records):
+        expires_at = int(time.time()) + keep_days * DAY
+        for record in records:
+            if keep_days > 0:
+                record[TTL_ATTRIBUTE] = expires_at
+            else:
+                record.pop(TTL_ATTRIBUTE, None)
+            yield record
+
+    return import_records(table, with_expiration(decode_archive(archive.get(name))))
+
+def handler():
+    parser = argparse.ArgumentParser(description="expire and archive records of the Bot's storage")
+    parser.add_argument("command", choices=["archive", "list", "rehydrate", "purge"])
+    parser.add_argument("name", nargs="?", help="archive name for rehydrate, name prefix for list")
+    parser.add_argument("-b", "--backend", help="storage backend, default STORAGE_BACKEND env variable", choices=STORAGE_BACKENDS)
+    parser.add_argument("-a", "--archive", help="archive directory or s3://bucket/prefix, default ARCHIVE_LOCATION env variable")
+    parser.add_argument("-d", "--days", type=int, help="archive meetings ended more than DAYS ago, default ARCHIVE_AFTER_DAYS env variable")
+    parser.add_argument("-k", "--keep", type=int, default=REHYDRATE_TTL_DAYS, help="days to keep the rehydrated records, 0 = forever")
+    args = parser.parse_args()
+
+    archive = get_archive(args.archive)
+    if args.command == "list":
+        for name in archive.list(args.name or ""):
+            print(name)
+        return
+
+    table = get_shared_table(args.backend)
+    if args.command == "archive":
+        archived = archive_meetings(table, archive, args.days)
+        print("archive: {} meetings, {} records".format(len(archived), sum(count for (name, count) in archived)), file=sys.stderr)
+    elif args.command == "rehydrate":
+        if args.name is None:
+            parser.error("rehydrate requires archive name")
+        print("rehydrate: {} records".format(rehydrate_meeting(table, archive, args.name, args.keep)), file=sys.stderr)
+    else:
+        print("purge: {} records".format(table.purge_expired_db_records()), file=sys.stderr)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    handler()
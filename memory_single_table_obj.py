@@ -0,0 +1,131 @@
+"""
+In-memory single table implementation
+Thread-safe and indexed the same way as the DynamoDB table: by (pk, sk), by sk (gsi_1)
+and by (pk, pvalue) (gsi_2). Data live only as long as the process.
+Useful for tests and for benchmarking the Bot logic without a database.
+"""
+
+import bisect
+import copy
+import logging
+import threading
+
+from single_table import Single_Table
+
+class Memory_Single_Table(Single_Table):
+    """in-memory storage backend, see single_table.Single_Table for the method descriptions"""
+
+    logger = logging.getLogger(__name__)
+
+    _shared_table = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._records = {}          # pk -> {sk: record}
+        self._sorted_sks = {}       # pk -> sorted list of sk
+        self._sk_index = {}         # sk -> set of pk
+        self._pk_pvalue_index = {}  # (pk, pvalue) -> set of sk
+
+    @classmethod
+    def shared(cls):
+        """return a process-wide instance"""
+        with cls._shared_lock:
+            if cls._shared_table is None:
+                cls._shared_table = cls()
+            return cls._shared_table
+
+    def save_db_record(self, pk, sk, pvalue, **items):
+        record = copy.deepcopy({"pk": pk, "sk": sk, "pvalue": pvalue, **items})
+        with self._lock:
+            self._remove(pk, sk)
+            self._records.setdefault(pk, {})[sk] = record
+            bisect.insort(self._sorted_sks.setdefault(pk, []), sk)
+            self._sk_index.setdefault(sk, set()).add(pk)
+            self._pk_pvalue_index.setdefault((pk, pvalue), set()).add(sk)
+
+    def get_db_record(self, pk, sk, consistent_read=False):
+        with self._lock:
+            record = self._records.get(str(pk), {}).get(sk)
+            return copy.deepcopy(record)
+
+    def delete_db_record(self, pk, sk):
+        with self._lock:
+            self._remove(pk, sk)
+
+    def _remove(self, pk, sk):
+        record = self._records.get(pk, {}).pop(sk, None)
+        if record is None:
+            return
+        sks = self._sorted_sks[pk]
+        del(sks[bisect.bisect_left(sks, sk)])
+        if not sks:
+            del(self._sorted_sks[pk])
+            del(self._records[pk])
+        self._discard(self._sk_index, sk, pk)
+        self._discard(self._pk_pvalue_index, (pk, record["pvalue"]), sk)
+
+    def _discard(self, index, key, value):
+        values = index.get(key)
+        if values is not None:
+            values.discard(value)
+            if not values:
+                del(index[key])
+
+    def iter_db_records(self, pk, pvalue_condition=None, sk_from=None, sk_to=None, reverse=False, page_size=None, projection=None, consistent_read=False):
+        with self._lock:
+            if pvalue_condition is None:
+                sks = self._sorted_sks.get(pk, [])
+                start = 0 if sk_from is None else bisect.bisect_left(sks, sk_from)
+                end = len(sks) if sk_to is None else bisect.bisect_left(sks, sk_to)
+                sks = sks[start:end]
+            else:
+                sks = sorted(sk for sk in self._pk_pvalue_index.get((pk, pvalue_condition), set())
+                    if (sk_from is None or sk >= sk_from) and (sk_to is None or sk < sk_to))
+            if reverse:
+                sks = sks[::-1]
+            records = [self._project(self._records[pk][sk], projection) for sk in sks]
+
+        for record in records:
+            yield record
+
+    def _project(self, record, projection):
+        if projection:
+            record = {key: value for (key, value) in record.items() if key in projection}
+        return copy.deepcopy(record)
+
+    def get_db_records_by_secondary_key(self, sk, pvalue_condition=None):
+        with self._lock:
+            records = [self._records[pk][sk] for pk in sorted(self._sk_index.get(sk, set()))]
+            return [copy.deepcopy(record) for record in records if pvalue_condition is None or record["pvalue"] == pvalue_condition]
+
+    def iter_all_db_records(self, page_size=None):
+        with self._lock:
+            records = [copy.deepcopy(record) for pk in sorted(self._records.keys()) for record in self._records[pk].values()]
+
+        for record in records:
+            yield record
+
+    def transact_write_db_records(self, operations):
+        with self._lock:
+            keys = [self.operation_key(operation) for operation in operations]
+            for (key, operation) in zip(keys, operations):
+                record = self._records.get(key[0], {}).get(key[1])
+                if not self.matches_expected(record, operation.get("expected", {})):
+                    return False
+            for (key, operation) in zip(keys, operations):
+                record = self.apply_operation(self._records.get(key[0], {}).get(key[1]), operation)
+                if record is None:
+                    self._remove(*key)
+                else:
+                    items = dict(record)
+                    self.save_db_record(items.pop("pk"), items.pop("sk"), items.pop("pvalue", None), **items)
+        return True
+
+    def save_db_records_batch(self, records, parallel=False):
+        with self._lock:
+            return super().save_db_records_batch(records, parallel)
+
+    def delete_db_records_batch(self, keys, parallel=False):
+        with self._lock:
+            return super().delete_db_records_batch(keys, parallel)
@@ -0,0 +1,138 @@
+"""
+Directory of Webex users' display names
+Names are looked up in an in-process LRU cache, then in the Bot's table (optional persistent tier,
+records pk = person id, sk = "PERSON") and the rest is fetched from Webex by people.list(id=...)
+in batches of PEOPLE_LIST_MAX_IDS ids, the batches are fetched in parallel.
+A name older than the refresh time is fetched again.
+"""
+
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+
+from webexteamssdk import ApiError
+
+from record_cache import RecordCache
+import lifecycle
+
+# max. number of ids in one people.list() request
+PEOPLE_LIST_MAX_IDS = 85
+# parallel people.list() requests
+PEOPLE_LIST_WORKERS = 4
+DEFAULT_PERSON_CACHE_SIZE = 10000
+# seconds after which the display name is fetched again
+DEFAULT_PERSON_REFRESH = 24 * 3600
+
+class PersonDirectory():
+    """person id -> display name lookups
+
+    arguments:
+    webex_api -- WebexTeamsAPI object
+    table -- storage object for the persistent tier, None = in-process cache only
+    cache_size -- max. number of names in the in-process cache, default PERSON_CACHE_SIZE env variable
+    refresh -- seconds after which a name is fetched again, default PERSON_REFRESH env variable
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, webex_api, table = None, cache_size = None, refresh = None):
+        if cache_size is None:
+            cache_size = int(os.getenv("PERSON_CACHE_SIZE", DEFAULT_PERSON_CACHE_SIZE))
+        if refresh is None:
+            refresh = int(os.getenv("PERSON_REFRESH", DEFAULT_PERSON_REFRESH))
+
+        self.webex_api = webex_api
+        self.table = table
+        self.refresh = refresh
+        self.cache = RecordCache(max_size = cache_size, ttls = {"PERSON": refresh})
+        self._stats_lock = threading.Lock()
+        self.fetched = 0
+        self.requests = 0
+
+    def get_display_name(self, person_id):
+        """return display name of the person, None if not found"""
+        return self.get_display_names([person_id]).get(person_id)
+
+    def get_display_names(self, person_ids):
+        """return dict {person id: display name}, persons not found in Webex are left out"""
+        names = {}
+        missing = []
+        for person_id in dict.fromkeys(person_ids):
+            found, record = self.cache.get(person_id, "PERSON")
+            if found and record is not None:
+                names[person_id] = record["display_name"]
+            else:
+                missing.append(person_id)
+
+        if missing and self.table is not None:
+            missing = self._load_stored(missing, names)
+
+        if missing:
+            fetched = self._fetch(missing)
+            names.update(fetched)
+            self._store(fetched)
+
+        return names
+
+    def invalidate(self, person_id):
+        self.cache.invalidate(person_id, "PERSON")
+
+    def stats(self):
+        with self._stats_lock:
+            counters = {"fetched": self.fetched, "requests": self.requests}
+        return {**self.cache.stats(), **counters}
+
+    def _load_stored(self, person_ids, names):
+        """fill names from the table, return person ids not found or to be refreshed"""
+        now = time.time()
+        records = self.table.get_db_records_batch([(person_id, "PERSON") for person_id in person_ids])
+        missing = []
+        for person_id in person_ids:
+            record = records.get((person_id, "PERSON"))
+            if record is None:
+                missing.append(person_id)
+                continue
+            names[person_id] = record["display_name"]
+            age = now - float(record.get("refreshed_at", 0))
+            if age >= self.refresh:
+                missing.append(person_id)
+            else:
+                # keep in memory only for the rest of the refresh period
+                self.cache.put(person_id, "PERSON", {"display_name": record["display_name"]})
+        return missing
+
+    def _fetch_batch(self, person_ids):
+        # runs in the executor threads and in parallel lookups, the counters are shared
+        try:
+            names = {person.id: person.displayName for person in self.webex_api.people.list(id = ",".join(person_ids))}
+        except ApiError as e:
+            self.logger.error("people list failed for {} ids: {}".format(len(person_ids), e))
+            names = {}
+        with self._stats_lock:
+            self.requests += 1
+            self.fetched += len(names)
+        return names
+
+    def _fetch(self, person_ids):
+        batches = [person_ids[start:start + PEOPLE_LIST_MAX_IDS] for start in range(0, len(person_ids), PEOPLE_LIST_MAX_IDS)]
+        fetched = {}
+        if len(batches) == 1:
+            fetched.update(self._fetch_batch(batches[0]))
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers = min(PEOPLE_LIST_WORKERS, len(batches))) as executor:
+                for batch_names in executor.map(self._fetch_batch, batches):
+                    fetched.update(batch_names)
+
+        self.logger.debug("fetched {} of {} display names in {} requests".format(len(fetched), len(person_ids), len(batches)))
+        for (person_id, display_name) in fetched.items():
+            self.cache.put(person_id, "PERSON", {"display_name": display_name})
+        return fetched
+
+    def _store(self, names):
+        if self.table is None or not names:
+            return
+        now = int(time.time())
+        records = [{"pk": person_id, "sk": "PERSON", "pvalue": "PERSON", "display_name": display_name, "refreshed_at": now, **lifecycle.ttl_items("PERSON", now)}
+            for (person_id, display_name) in names.items()]
+        self.table.save_db_records_batch(records, parallel = True)
@@ -64,12 +64,28 @@ from urllib.parse import urlparse, urlunparse, quote, parse_qsl, urlencode
 
 from distutils.util import strtobool
 
-from webexteamssdk import WebexTeamsAPI, ApiError, AccessToken
-webex_api = WebexTeamsAPI()
-
-from ddb_single_table_obj import DDB_Single_Table
+from webexteamssdk import WebexTeamsAPI, ApiError, AccessToken, RateLimitError
+from webex_transport import install_transport
+from webex_scheduler import install_scheduler, PRIORITY_HIGH, PRIORITY_LOW
+webex_api = WebexTeamsAPI(access_token = os.getenv("WEBEX_TEAMS_ACCESS_TOKEN"))
+webex_transport = install_transport(webex_api)
+webex_scheduler = install_scheduler(webex_api)
+from webex_async import AsyncWebexClient
+webex_async = AsyncWebexClient(scheduler = webex_scheduler)
+
+from storage import get_shared_table
+from person_directory import PersonDirectory
+from identity_cache import IdentityCache, DEFAULT_IDENTITY_REFRESH
+import roster
 from settings import BotSettings
 from timestamp import create_timestamp, parse_timestamp
+from results_codec import encode_vote_results, iter_vote_results, results_key
+import lifecycle
+from webhook_queue import WebhookQueue, is_valid_webhook
+from webhook_dedup import WebhookDedup
+from webhooks import reconcile_webhooks, early_drop_reason, InboundStats
+from form_registry import FormRegistry, read_form_type
+from vote_ingest import VoteIngest, VOTE_FALLBACK
 
 import json, requests
 from requests_toolbelt.multipart.encoder import MultipartEncoder
@@ -85,12 +101,10 @@ from zappa.asynchronous import task
 
 import concurrent.futures
 import signal
+import threading
 
 import bot_buttons_cards as bc
 
-from boto3.dynamodb.conditions import Key, Attr
-from boto3.dynamodb import types
-
 DEFAULT_AVATAR_URL= "http://bit.ly/SparkBot-512x512"
 # identification mapping in DB between form and submitted data
 DEFAULT_POLL_LIMIT = 20
@@ -109,16 +123,38 @@ FORM_DATA_MAP = {
 # type of form data to be saved in database
 FORM_DATA_TO_SAVE = ["START_MEETING_DATA", "POLL_DATA"]
 
+# vote choices counted in the poll tally record
+VOTE_CHOICES = ["yea", "nay", "abstain"]
+# localization of the votes in the results
+VOTE_LABELS = {
+    "yea": "{{loc_publish_poll_results_2}}",
+    "nay": "{{loc_publish_poll_results_3}}",
+    "abstain": "{{loc_publish_poll_results_4}}"
+}
+# attempts to update the roster if another membership event changed it meanwhile
+ROSTER_UPDATE_RETRIES = 5
+# attempts to commit an FSM transition if another event changed the state meanwhile
+FSM_TRANSITION_RETRIES = 5
+
 flask_app = Flask(__name__)
 flask_app.config["DEBUG"] = True
 requests.packages.urllib3.disable_warnings()
 
 # threading part
 thread_executor = concurrent.futures.ThreadPoolExecutor()
+# on AWS Lambda the process is frozen after the response, background work runs in separate invocations (@task)
+RUNNING_ON_LAMBDA = os.getenv("AWS_LAMBDA_FUNCTION_NAME") is not None
 
 logger = logging.getLogger()
 
 ddb = None
+person_directory = None
+webhook_dedup = None
+vote_ingest = None
+# Bot's identity and URL, loaded on first use and refreshed every IDENTITY_REFRESH seconds
+identity = IdentityCache(int(os.getenv("IDENTITY_REFRESH", DEFAULT_IDENTITY_REFRESH)))
+# form types of the Bot's messages, forms sent by this process are registered, others are loaded from form info
+form_registry = FormRegistry(lambda form_id: load_form_type(form_id))
 
 """
 bot flow/events
@@ -163,6 +199,11 @@ def fsm_handle_event(room_id, event_name, args_dict={}):
     the action function can return a new state, in that case the "target state" from the FSM
     definition is ignored and the new state is set instead
     
+    The FSM state record carries a version number. The transition is committed by a conditional
+    write which succeeds only if the state was not changed by a parallel event (another thread
+    or Lambda invocation). Otherwise the state is re-read and the transition re-evaluated,
+    so each transition happens exactly once.
+    
     arguments:
     room_id -- room id to which the state is related
     event_name -- name of the event
@@ -170,26 +211,50 @@ def fsm_handle_event(room_id, event_name, args_dict={}):
     """
     flask_app.logger.debug("FSM event {}, roomId: {}".format(event_name, room_id))
     init_globals()
-    current_state = get_current_state(room_id)
     
     settings = load_settings(room_id, event_name, args_dict)
     flask_app.logger.debug("Active settings: {}".format(settings.settings))
     
-    for fsm_state, fsm_event, fsm_action, fsm_target_state in MEETING_FSM:
-        if (fsm_state == current_state or fsm_state == "any_state") and fsm_event == event_name:
-            if fsm_target_state == "same_state":
-                fsm_target_state = current_state
-            flask_app.logger.debug("FSM transition {} -> {}, event: {}, function: {}".format(current_state, fsm_target_state, event_name, fsm_action.__name__))
-
-            # event state is saved before the action to avoid duplicate events in case the action takes a long time (includes time.sleep())
-            save_current_state(room_id, fsm_target_state)
-            new_state = fsm_action(room_id, event_name, settings, args_dict)
-            if new_state is not None:
-                save_current_state(room_id, new_state)
-                flask_app.logger.debug("FSM transition {} -> {}, event: {}, function: {}".format(current_state, new_state, event_name, fsm_action.__name__))
+    for attempt in range(FSM_TRANSITION_RETRIES):
+        current_state, version = get_current_state_version(room_id, consistent_read = attempt > 0)
+        transition = find_fsm_transition(current_state, event_name)
+        if transition is None:
+            flask_app.logger.debug("Unhandled FSM event \"{}\" in state {}".format(event_name, current_state))
+            return
+            
+        fsm_action, fsm_target_state = transition
+        if fsm_target_state == "same_state":
+            fsm_target_state = current_state
+        flask_app.logger.debug("FSM transition {} -> {}, event: {}, function: {}".format(current_state, fsm_target_state, event_name, fsm_action.__name__))
+        
+        # event state is saved before the action to avoid duplicate events in case the action takes a long time (includes time.sleep())
+        if fsm_target_state == current_state:
+            break # nothing to commit
+        if save_current_state(room_id, fsm_target_state, version):
+            version += 1
             break
+        flask_app.logger.debug("FSM state changed meanwhile, retry {}, event: {}, roomId: {}".format(attempt, event_name, room_id))
     else:
-        flask_app.logger.debug("Unhandled FSM event \"{}\"".format(event_name))
+        flask_app.logger.error("FSM transition failed, event: {}, roomId: {}".format(event_name, room_id))
+        return
+        
+    new_state = fsm_action(room_id, event_name, settings, args_dict)
+    if new_state is not None and new_state != fsm_target_state:
+        if save_current_state(room_id, new_state, version):
+            flask_app.logger.debug("FSM transition {} -> {}, event: {}, function: {}".format(current_state, new_state, event_name, fsm_action.__name__))
+        else:
+            flask_app.logger.info("FSM state changed during action {}, state {} not saved, roomId: {}".format(fsm_action.__name__, new_state, room_id))
+            
+def find_fsm_transition(current_state, event_name):
+    """return (action, target state) of the MEETING_FSM transition for the event, None if there is none
+    
+    arguments:
+    current_state -- current FSM state
+    event_name -- name of the event
+    """
+    for fsm_state, fsm_event, fsm_action, fsm_target_state in MEETING_FSM:
+        if (fsm_state == current_state or fsm_state == "any_state") and fsm_event == event_name:
+            return fsm_action, fsm_target_state
             
 def get_current_state(room_id):
     """get current FSM state
@@ -197,22 +262,48 @@ def get_current_state(room_id):
     arguments:
     room_id -- room id to which the state is related
     """
+    state, version = get_current_state_version(room_id)
+    return state
+    
+def get_current_state_version(room_id, consistent_read = False):
+    """get current FSM state and its version, (None, 0) if there is no state
+    
+    arguments:
+    room_id -- room id to which the state is related
+    consistent_read -- read the latest state (used after a failed conditional write)
+    """
     state = None
-    state_res = ddb.get_db_record(room_id, "FSM_STATE")
+    version = 0
+    state_res = ddb.get_db_record(room_id, "FSM_STATE", consistent_read = consistent_read)
     if state_res:
         state = state_res.get("pvalue")
-    flask_app.logger.debug("FSM current state: {}, roomId: {}".format(state, room_id))
-    return state
+        version = int(state_res.get("version", 0))
+    flask_app.logger.debug("FSM current state: {}, version: {}, roomId: {}".format(state, version, room_id))
+    return state, version
     
-def save_current_state(room_id, state):
+def save_current_state(room_id, state, version = None):
     """save current FSM state
     
     arguments:
     room_id -- room id to which the state is related
     state -- state value
+    version -- version of the state which is being replaced, the state is saved only if the stored version
+        still matches (0 - no state or state without version). If None, the state is saved unconditionally.
+        
+    returns True if saved
     """
-    ddb.save_db_record(room_id, "FSM_STATE", state)
-    flask_app.logger.debug("FSM save state: {}, roomId".format(state, room_id))
+    if version is None:
+        ddb.save_db_record(room_id, "FSM_STATE", state)
+        flask_app.logger.debug("FSM save state: {}, roomId: {}".format(state, room_id))
+        return True
+        
+    operation = {
+        "put": {"pk": room_id, "sk": "FSM_STATE", "pvalue": state, "version": version + 1},
+        "expected": {"version": version if version > 0 else None}
+    }
+    saved = ddb.transact_write_db_records([operation])
+    flask_app.logger.debug("FSM save state: {}, version: {}, saved: {}, roomId: {}".format(state, version + 1, saved, room_id))
+    return saved
     
 def clear_current_state(room_id):
     """clear FSM state
@@ -260,22 +351,24 @@ def act_added_to_space(room_id, event_name, settings, args_dict):
     flask_app.logger.debug("Room settings {}stored, value: {}".format("not " if not room_settings.stored else "", room_settings.settings))
 
     room_settings_available = False
+    settings_forms = [] # room and user settings cards are independent, sent concurrently
 
     person_id = args_dict["actorId"]
     person_settings = BotSettings(db = ddb, settings_id = person_id)
     flask_app.logger.debug("Person settings {}stored, value: {}".format("not " if not person_settings.stored else "", person_settings.settings))
     if not (room_settings.stored and person_settings.stored): # no user and room settings, let's ask in the space
-        attach = [bc.wrap_form(bc.localize(bc.ROOM_SETTINGS_TEMPLATE, settings.settings["language"]))]
-        form_type = "ROOM_SETTINGS_FORM"
-        send_message({"roomId": room_id}, "settings form", attachments=attach, form_type=form_type)
+        room_attach = [bc.wrap_form(bc.localize(bc.ROOM_SETTINGS_TEMPLATE, settings.settings["language"]))]
+        settings_forms.append(lambda: send_message({"roomId": room_id}, "settings form", attachments=room_attach, form_type="ROOM_SETTINGS_FORM"))
         room_settings_available = True
     else:
         active_settings = load_settings(room_id, event_name, args_dict)
 
     if not person_settings.settings["user_1_1"]: # user not yet in 1-1 communcation with the Bot
-        attach = [bc.wrap_form(bc.localize(bc.USER_SETTINGS_TEMPLATE, settings.settings["language"]))]
-        form_type = "USER_SETTINGS_FORM"
-        send_message({"toPersonId": person_id}, "settings form", attachments=attach, form_type=form_type)
+        user_attach = [bc.wrap_form(bc.localize(bc.USER_SETTINGS_TEMPLATE, settings.settings["language"]))]
+        settings_forms.append(lambda: send_message({"toPersonId": person_id}, "settings form", attachments=user_attach, form_type="USER_SETTINGS_FORM"))
+        
+    webex_async.run_concurrently(*settings_forms)
+    if not person_settings.settings["user_1_1"]:
         person_settings.settings = {"user_1_1": True}
         person_settings.save()
         
@@ -356,7 +449,12 @@ def act_start_end_meeting(room_id, event_name, settings, args_dict):
         
         # TODO remove previous start/end meeting form
         
-        moderators = get_moderators(room_id)
+        person_id = args_dict.get("personId")
+        if event_name == "ev_start_meeting":
+            members = take_roster_snapshot(room_id)
+            moderators = roster.get_moderators(members)
+        else:
+            moderators = get_moderators(room_id)
                 
         # only moderators (if there are any) are allowed to start/end meeting
         if moderators:
@@ -393,49 +491,142 @@ def act_start_end_meeting(room_id, event_name, settings, args_dict):
         
         flask_app.logger.debug("Saving meeting \"{}\"status {}, timestamp {}".format(meeting_info["subject"], meeting_status, timestamp))
         ddb.save_db_record(room_id, timestamp, meeting_status, **meeting_info)
+        save_last_meeting(room_id, meeting_status, timestamp, meeting_info["subject"])
             
-        user_info = webex_api.people.get(args_dict["personId"])
-        form = bc.nested_replace(template, "display_name", user_info.displayName)
+        display_name = person_directory.get_display_name(args_dict["personId"]) or ""
+        form = bc.nested_replace(template, "display_name", display_name)
         form = bc.nested_replace(form, "meeting_subject", meeting_info["subject"])
         attach = [bc.wrap_form(bc.localize(form, settings.settings["language"]))]
-        msg_id = send_message({"roomId": room_id}, "{} meeting form".format(event_name), attachments=attach, form_type=form_type)
+        send_form = lambda: send_message({"roomId": room_id}, "{} meeting form".format(event_name), attachments=attach, form_type=form_type)
         
         # send meeting summary in XLSX format
         if event_name == "ev_end_meeting":
-            results_items, meeting_name = get_last_meeting_results(room_id)
-            if len(results_items) > 0:
-                my_url = get_my_url()
-                if my_url:
-                    now = datetime.now()
-                    file_name = now.strftime("%Y_%m_%d_%H_%M_")
-
-                    complete_results, header_list = create_results(results_items, settings)
-                    xls_stream = create_xls_stream(complete_results, header_list)
-                    
-                    msg_data = {
-                        "roomId": room_id,
-                        "parentId": msg_id,
-                        "markdown": bc.localize("{{loc_act_start_end_meeting_4}}", settings.settings["language"])
-                    }
-                    
-                    send_file_stream(msg_data, file_name + meeting_name + ".xlsx", XLSX_CONTENT_TYPE, xls_stream)
+            # the summary is created while the form is being sent, it's posted as a reply to the form
+            msg_id, (xls_stream, meeting_name) = webex_async.run_concurrently(send_form, lambda: create_meeting_summary(room_id, settings))
+            if xls_stream is not None:
+                now = datetime.now()
+                file_name = now.strftime("%Y_%m_%d_%H_%M_")
+                
+                msg_data = {
+                    "roomId": room_id,
+                    "parentId": msg_id,
+                    "markdown": bc.localize("{{loc_act_start_end_meeting_4}}", settings.settings["language"])
+                }
+                
+                send_file_stream(msg_data, file_name + meeting_name + ".xlsx", XLSX_CONTENT_TYPE, xls_stream)
+        else:
+            send_form()
     
     except ApiError as e:
         flask_app.logger.error("{} meeting form create failed: {}.".format(event_name, e))
+        identity.invalidate_on_auth_error(e)
+        
+def create_meeting_summary(room_id, settings):
+    """return (XLSX stream, meeting name) of the last meeting results, XLSX stream is None if there is nothing to send
+    
+    arguments:
+    room_id -- id of the Space
+    settings -- current active settings (user- or space-level)
+    """
+    results_items, meeting_name = get_last_meeting_results(room_id)
+    complete_results, header_list = create_results(results_items, settings)
+    if len(header_list) > 1 and get_my_url(): # at least one poll in the meeting
+        return create_xls_stream(complete_results, header_list), meeting_name
+        
+    return None, meeting_name
         
 def get_moderators(room_id):
     """return a list of Space moderators
     
+    the roster snapshot is used if available, otherwise the memberships are listed
+    
     arguments:
     room_id -- id of the Space
     """
-    members = webex_api.memberships.list(roomId = room_id)
-    moderators = []
-    for member in members:
-        if member.isModerator:
-            moderators.append(member.personId)
+    members = get_roster(room_id)
+    if members is None:
+        members = roster.members_from_memberships(webex_api.memberships.list(roomId = room_id))
             
-    return moderators
+    return roster.get_moderators(members)
+    
+def get_roster(room_id, consistent_read = False):
+    """return the roster snapshot of the Space as a dict {person id: (display name, is moderator)}, None if there is no snapshot
+    
+    arguments:
+    room_id -- id of the Space
+    consistent_read -- read the latest version (used before an update)
+    """
+    members, version = get_roster_version(room_id, consistent_read = consistent_read)
+    return members
+    
+def get_roster_version(room_id, consistent_read = False):
+    """return (roster members, version), (None, 0) if there is no snapshot, see get_roster()
+    
+    members are None also if the snapshot has an unsupported format version, it's replaced by the next snapshot (same version check)
+    """
+    roster_record = ddb.get_db_record(room_id, "ROSTER", consistent_read = consistent_read)
+    if roster_record is None:
+        return None, 0
+    return roster.decode_roster(roster_record), int(roster_record.get("version", 0))
+    
+def save_roster(room_id, members, version):
+    """save the roster snapshot of the Space
+    
+    arguments:
+    room_id -- id of the Space
+    members -- dict {person id: (display name, is moderator)}
+    version -- version of the roster which is being replaced, the roster is saved only if the stored version
+        still matches (0 - no roster)
+        
+    returns True if saved
+    """
+    operation = {
+        "put": {"pk": room_id, "sk": "ROSTER", "pvalue": "ROSTER", "version": version + 1, "taken_at": create_timestamp(), **roster.encode_roster(members)},
+        "expected": {"version": version if version > 0 else None}
+    }
+    return ddb.transact_write_db_records([operation])
+    
+def take_roster_snapshot(room_id):
+    """list the Space memberships and save them as the roster snapshot, return the members
+    
+    arguments:
+    room_id -- id of the Space
+    """
+    members = roster.members_from_memberships(webex_api.memberships.list(roomId = room_id))
+    for attempt in range(ROSTER_UPDATE_RETRIES):
+        old_members, version = get_roster_version(room_id, consistent_read = True)
+        if save_roster(room_id, members, version):
+            flask_app.logger.debug("Roster snapshot of {} members saved, roomId: {}".format(len(members), room_id))
+            break
+    else:
+        flask_app.logger.error("Roster snapshot save failed, roomId: {}".format(room_id))
+    return members
+    
+def update_roster(room_id, membership, removed = False):
+    """apply a membership webhook to the roster snapshot, nothing is done if the Space has no snapshot
+    
+    arguments:
+    room_id -- id of the Space
+    membership -- "data" of the memberships webhook
+    removed -- the membership was deleted
+    """
+    person_id = membership["personId"]
+    for attempt in range(ROSTER_UPDATE_RETRIES):
+        members, version = get_roster_version(room_id, consistent_read = attempt > 0)
+        if members is None:
+            return False
+        if removed:
+            if members.pop(person_id, None) is None:
+                return True
+        else:
+            members[person_id] = (membership.get("personDisplayName", ""), bool(membership.get("isModerator", False)))
+        if save_roster(room_id, members, version):
+            flask_app.logger.debug("Roster updated, person {} {}, roomId: {}".format(person_id, "removed" if removed else "added", room_id))
+            return True
+        flask_app.logger.debug("Roster changed meanwhile, retry {}, roomId: {}".format(attempt, room_id))
+        
+    flask_app.logger.error("Roster update failed, roomId: {}".format(room_id))
+    return False
         
 def clear_meeting_presence(room_id):
     """clear presence status of all users in the Space
@@ -445,8 +636,8 @@ def clear_meeting_presence(room_id):
     """
     present_users = get_present_users(room_id)
     flask_app.logger.debug("clear presence status for roomId: {}".format(room_id))
-    for user_id in present_users:
-        set_presence(room_id, user_id, False)
+    presence_records = [{"pk": room_id, "sk": user_id, "pvalue": "PRESENT", "status": False} for user_id in present_users]
+    ddb.save_db_records_batch(presence_records, parallel=True)
         
 def get_present_users(room_id):
     """return list of user ids of users who set their presence in the Space
@@ -454,9 +645,8 @@ def get_present_users(room_id):
     arguments:
     room_id -- id of the Space
     """
-    present_list = ddb.query_db_record(room_id, "PRESENT")
     present_users = []
-    for prs in present_list:
+    for prs in ddb.iter_db_records(room_id, "PRESENT", projection=["sk", "status"]):
         status = prs.get("status", False)
         if status:
             present_users.append(prs["sk"])
@@ -478,20 +668,23 @@ def act_start_poll(room_id, event_name, settings, args_dict):
     time_limit = inputs.get("time_limit")
     form_type = "POLL_FORM"
     try:
-        user_info = webex_api.people.get(args_dict["personId"])
-        form = bc.nested_replace(bc.POLL_TEMPLATE, "display_name", user_info.displayName)
+        display_name = person_directory.get_display_name(args_dict["personId"]) or ""
+        form = bc.nested_replace(bc.POLL_TEMPLATE, "display_name", display_name)
         form = bc.nested_replace(form, "poll_subject", subject)
         form = bc.nested_replace(form, "time_limit", time_limit)
         attach = [bc.wrap_form(bc.localize(form, settings.settings["language"]))]
         message_id = send_message({"roomId": room_id}, "{} meeting form".format(event_name), attachments=attach, form_type=form_type, form_params=inputs)
         
         inputs["form_id"] = message_id
+        if message_id is not None:
+            vote_ingest.open_poll(message_id) # clicks are accepted from now on
         
         save_last_poll_state(room_id, "RUNNING", inputs)
-        request_poll_end(room_id, inputs)
+        schedule_poll_end(room_id, inputs)
             
     except ApiError as e:
         flask_app.logger.error("{} meeting form create failed: {}.".format(event_name, e))
+        identity.invalidate_on_auth_error(e)
         
 def save_last_poll_state(room_id, state, inputs):
     """save poll state in order to be able to handle both automated and manual poll end"""
@@ -507,6 +700,27 @@ def get_last_poll_state(room_id):
     
     return state, inputs
         
+def schedule_poll_end(room_id, inputs):
+    """end the poll after its time limit
+    
+    on AWS Lambda the waiting runs in a separate invocation, otherwise a timer thread ends the poll
+    so that no webhook worker is blocked for the time limit
+    """
+    if RUNNING_ON_LAMBDA:
+        request_poll_end(room_id, inputs)
+    else:
+        delay = int(inputs.get("time_limit", DEFAULT_POLL_LIMIT))
+        flask_app.logger.debug("poll \"{}\" {} ends in {}s".format(inputs.get("poll_subject"), inputs.get("form_id"), delay))
+        timer = threading.Timer(delay, end_poll_in_lane, args = (room_id, inputs))
+        timer.daemon = True
+        timer.start()
+        
+def end_poll_in_lane(room_id, inputs):
+    """end the poll in the Space's lane, in order with the webhook events of the Space"""
+    if not webhook_queue.submit_call(room_id, fsm_handle_event, room_id, "ev_end_poll", inputs):
+        flask_app.logger.warning("lane of {} full, ending poll {} directly".format(room_id, inputs.get("form_id")))
+        fsm_handle_event(room_id, "ev_end_poll", inputs)
+        
 @task
 def request_poll_end(room_id, inputs):
     """automated poll end"""
@@ -535,9 +749,13 @@ def act_end_poll(room_id, event_name, settings, args_dict):
     if poll_state == "RUNNING":
         flask_app.logger.debug("deleting poll \"{}\" form {}".format(subject, form_id))
         try:
-            webex_api.messages.delete(form_id)
+            # poll closing goes ahead of the other Webex requests
+            with webex_scheduler.priority(PRIORITY_HIGH):
+                vote_ingest.close_poll(form_id) # no more votes, the results are final
+                webex_api.messages.delete(form_id)
+                delete_form_info(form_id) # the form is gone, late clicks are ignored
 
-            publish_poll_results(room_id, form_id, subject, settings, time_limit=time_limit)
+                publish_poll_results(room_id, form_id, subject, settings, time_limit=time_limit)
 
         except ApiError as e:
             flask_app.logger.error("message {} delete failed: {}.".format(form_id, e))
@@ -549,35 +767,39 @@ def act_end_poll(room_id, event_name, settings, args_dict):
 def publish_poll_results(room_id, form_id, subject, settings, time_limit=bc.DEFAULT_TIME_LIMIT):
     """send card with poll results, save results to the database"""
     flask_app.logger.debug("publishing poll \"{}\" results, form id: {}".format(subject, form_id))
-    poll_results = ddb.query_db_record(form_id, "POLL_DATA")
     yea_res = []
     nay_res = []
     abstain_res = []
-    active_users = []
-    vote_results = []
-    name_key = bc.localize("{{loc_publish_poll_results_1}}", settings.settings["language"])
-    choice_key = bc.localize("{{loc_publish_poll_results_6}}", settings.settings["language"])
-    for res in poll_results:
-        vote = res.get("vote")
-        voter_id = res["sk"]
-        active_users.append(voter_id)
-        voter_data = webex_api.people.get(voter_id)
+    active_votes = [] # (person id, vote)
+    for res in ddb.iter_db_records(form_id, "POLL_DATA", projection=["sk", "vote"]):
+        active_votes.append((res["sk"], res.get("vote")))
+            
+    present_users = get_present_users(room_id)
+    active_users = set(voter_id for (voter_id, vote) in active_votes)
+    passive_users = list(set(present_users).difference(active_users))
+    # display names from the roster snapshot, the rest in a few batched requests
+    voter_ids = [voter_id for (voter_id, vote) in active_votes if vote in VOTE_CHOICES] + passive_users
+    members = get_roster(room_id) or {}
+    display_names = {person_id: members[person_id][0] for person_id in voter_ids if members.get(person_id, ("", False))[0]}
+    display_names.update(person_directory.get_display_names([person_id for person_id in voter_ids if person_id not in display_names]))
+    
+    vote_results = [] # (person id, display name, vote)
+    for (voter_id, vote) in active_votes:
+        if vote not in VOTE_CHOICES:
+            continue
+        display_name = display_names.get(voter_id, voter_id)
+        vote_results.append((voter_id, display_name, vote))
         if vote == "yea":
-            yea_res.append(voter_data.displayName)
-            vote_results.append({name_key: voter_data.displayName, choice_key: bc.localize("{{loc_publish_poll_results_2}}", settings.settings["language"])})
+            yea_res.append(display_name)
         elif vote == "nay":
-            nay_res.append(voter_data.displayName)
-            vote_results.append({name_key: voter_data.displayName, choice_key: bc.localize("{{loc_publish_poll_results_3}}", settings.settings["language"])})
+            nay_res.append(display_name)
         elif vote == "abstain":
-            abstain_res.append(voter_data.displayName)
-            vote_results.append({name_key: voter_data.displayName, choice_key: bc.localize("{{loc_publish_poll_results_4}}", settings.settings["language"])})
+            abstain_res.append(display_name)
             
-    present_users = get_present_users(room_id)
-    passive_users = list(set(present_users).difference(set(active_users)))
     for user_id in passive_users:
-        voter_data = webex_api.people.get(user_id)
-        abstain_res.append(voter_data.displayName)
-        vote_results.append({name_key: voter_data.displayName, choice_key: bc.localize("{{loc_publish_poll_results_4}}", settings.settings["language"])})
+        display_name = display_names.get(user_id, user_id)
+        abstain_res.append(display_name)
+        vote_results.append((user_id, display_name, "abstain"))
         
     voter_columns = {
         "type": "ColumnSet",
@@ -587,44 +809,57 @@ def publish_poll_results(room_id, form_id, subject, settings, time_limit=bc.DEFA
     voter_columns["columns"].append(create_result_column(yea_res, style=bc.YEA_STYLE))
     voter_columns["columns"].append(create_result_column(nay_res, style=bc.NAY_STYLE))
     voter_columns["columns"].append(create_result_column(abstain_res, style=bc.ABSTAIN_STYLE))
-    vote_results.sort(key=lambda x: x[name_key].split(" ")[-1])
+    vote_results.sort(key=lambda x: x[1].split(" ")[-1])
     
     rslt = {
-        "vote_results": vote_results,
         "subject": subject,
-        "timestamp": create_timestamp()
+        "timestamp": create_timestamp(),
+        **encode_vote_results(vote_results)
     }
-    ddb.save_db_record(room_id, form_id, "RESULTS", **rslt)
+        
+    # counts from the tally record, vote lists are used if the poll was started before the tally existed
+    tally = get_poll_tally(form_id)
+    if tally is not None:
+        yea_count = tally["yea"]
+        nay_count = tally["nay"]
+        abstain_count = tally["abstain"] + len(passive_users)
+    else:
+        yea_count = len(yea_res)
+        nay_count = len(nay_res)
+        abstain_count = len(abstain_res)
         
     poll_result_attachment = bc.nested_replace(bc.POLL_RESULTS_TEMPLATE, "poll_subject", subject)
-    poll_result_attachment = bc.nested_replace(poll_result_attachment, "yea_count", len(yea_res))
-    poll_result_attachment = bc.nested_replace(poll_result_attachment, "nay_count", len(nay_res))
-    poll_result_attachment = bc.nested_replace(poll_result_attachment, "abstain_count", len(abstain_res))
+    poll_result_attachment = bc.nested_replace(poll_result_attachment, "yea_count", yea_count)
+    poll_result_attachment = bc.nested_replace(poll_result_attachment, "nay_count", nay_count)
+    poll_result_attachment = bc.nested_replace(poll_result_attachment, "abstain_count", abstain_count)
     poll_result_attachment["body"].append(voter_columns)
     poll_block = bc.nested_replace(bc.NEXT_POLL_BLOCK, "time_limit", time_limit)
     poll_result_attachment["body"].append(poll_block)
     poll_result_attachment["body"].append(bc.END_MEETING_BLOCK)
     
-    msg_id = send_message({"roomId": room_id}, "{} poll results".format(subject), attachments=[bc.wrap_form(bc.localize(poll_result_attachment, settings.settings["language"]))], form_type="POLL_RESULTS")
-    
     # publish results after each poll?
-    if settings.settings["partial_results"] and len(vote_results) > 0:
-        my_url = get_my_url()
-        if my_url:
-            result_name = unidecode(subject).lower().replace(" ", "_")
-            now = datetime.now()
-            file_name = now.strftime("%Y_%m_%d_%H_%M_") + result_name
-            
-            complete_results, header_list = create_partial_results(vote_results, settings)
-            xls_stream = create_xls_stream(complete_results, header_list)
-
-            msg_data = {
-                "roomId": room_id,
-                "parentId": msg_id,
-                "markdown": bc.localize("{{loc_publish_poll_results_5}}", settings.settings["language"])
-            }
-            
-            send_file_stream(msg_data, file_name + ".xlsx", XLSX_CONTENT_TYPE, xls_stream)
+    create_partial_xls = lambda: None
+    if settings.settings["partial_results"] and len(vote_results) > 0 and get_my_url():
+        create_partial_xls = lambda: create_xls_stream(*create_partial_results([(name, vote) for (person_id, name, vote) in vote_results], settings))
+    
+    # the results card is sent while the results are saved and the XLSX is created
+    msg_id, save_status, xls_stream = webex_async.run_concurrently(
+        lambda: send_message({"roomId": room_id}, "{} poll results".format(subject), attachments=[bc.wrap_form(bc.localize(poll_result_attachment, settings.settings["language"]))], form_type="POLL_RESULTS"),
+        lambda: ddb.save_db_record(get_results_key(room_id), form_id, "RESULTS", **rslt),
+        create_partial_xls)
+    
+    if xls_stream is not None:
+        result_name = unidecode(subject).lower().replace(" ", "_")
+        now = datetime.now()
+        file_name = now.strftime("%Y_%m_%d_%H_%M_") + result_name
+        
+        msg_data = {
+            "roomId": room_id,
+            "parentId": msg_id,
+            "markdown": bc.localize("{{loc_publish_poll_results_5}}", settings.settings["language"])
+        }
+        
+        send_file_stream(msg_data, file_name + ".xlsx", XLSX_CONTENT_TYPE, xls_stream)
     
 def create_result_column(result, style = "default"):
     """create an individual result column for the card"""
@@ -657,11 +892,21 @@ def set_presence(room_id, person_id, status):
     flask_app.logger.debug("Presence status for user {} set to {}, roomId: {}".format(person_id, status, room_id))    
         
 def act_poll_data(room_id, event_name, settings, args_dict):
-    """poll click received from a user"""
+    """poll click received from a user, the poll runs according to the FSM state (see vote_ingest.py)"""
     message_id = args_dict.get("messageId") # webhook["data"]["messageId"]
     person_id = args_dict.get("personId") # webhook["data"]["personId"]
-    set_presence(room_id, person_id, True)
-    form_saved = save_form_data(message_id, person_id, args_dict, "POLL_DATA")
+    vote_ingest.save_vote(room_id, message_id, person_id, args_dict.get("inputs", {}), require_open = False)
+    
+def get_poll_tally(form_id):
+    """return live vote counts of the poll as a dict {"yea": n, "nay": n, "abstain": n}, None if no vote yet
+    
+    arguments:
+    form_id -- id of the poll form message
+    """
+    tally = ddb.get_db_record(form_id, "POLL_TALLY")
+    if tally is None:
+        return None
+    return {choice: int(tally.get(choice, 0)) for choice in VOTE_CHOICES}
             
 MEETING_FSM = [
 # current_state   event     action    target_state
@@ -687,6 +932,10 @@ MEETING_FSM = [
 ]
 
 def get_my_url():
+    """full Bot URL (cached), see load_my_url()"""
+    return identity.get("my_url")
+    
+def load_my_url():
     """workaround to get the full Bot URL in case the application context is not available"""
     my_webhooks = webex_api.webhooks.list(max = 1)
     if my_webhooks:
@@ -699,44 +948,27 @@ def get_my_url():
         return url
 
 def create_webhook(target_url):
-    """create a set of webhooks for the Bot
-    webhooks are defined according to the resource_events dict
+    """set up the Bot's webhooks
+    the existing webhooks are compared with WEBHOOK_SUBSCRIPTIONS (see webhooks.py), only the differences are created or deleted
     
     arguments:
     target_url -- full URL to be set for the webhook
+    
+    returns True if all webhooks are in place
     """    
-    flask_app.logger.debug("Create new webhook to URL: {}".format(target_url))
+    flask_app.logger.debug("Set up webhooks to URL: {}".format(target_url))
     
-    resource_events = {
-        "messages": ["created"],
-        "memberships": ["created", "deleted"],
-        "attachmentActions": ["created"]
-    }
-    status = None
-        
     try:
-        check_webhook = webex_api.webhooks.list()
-        for webhook in check_webhook:
-            flask_app.logger.debug("Deleting webhook {}, '{}', App Id: {}".format(webhook.id, webhook.name, webhook.appId))
-            try:
-                if not flask_app.testing:
-                    webex_api.webhooks.delete(webhook.id)
-            except ApiError as e:
-                flask_app.logger.error("Webhook {} delete failed: {}.".format(webhook.id, e))
+        result = reconcile_webhooks(webex_api, target_url, dry_run = flask_app.testing)
     except ApiError as e:
         flask_app.logger.error("Webhook list failed: {}.".format(e))
+        identity.invalidate_on_auth_error(e)
+        return None
         
-    for resource, events in resource_events.items():
-        for event in events:
-            try:
-                if not flask_app.testing:
-                    webex_api.webhooks.create(name="Webhook for event \"{}\" on resource \"{}\"".format(event, resource), targetUrl=target_url, resource=resource, event=event)
-                status = True
-                flask_app.logger.debug("Webhook for {}/{} was successfully created".format(resource, event))
-            except ApiError as e:
-                flask_app.logger.error("Webhook create failed: {}.".format(e))
-            
-    return status
+    flask_app.logger.debug("Webhooks kept: {}, created: {}, reactivated: {}, deleted: {}, failed: {}".format(*[len(result[change]) for change in ["kept", "created", "reactivated", "deleted", "failed"]]))
+    if result["created"] or result["deleted"]:
+        identity.invalidate("my_url") # the webhook target URL may have changed
+    return len(result["failed"]) == 0
 
 def greetings(personal=True):
     
@@ -760,14 +992,65 @@ def is_room_direct(room_id):
         flask_app.logger.error("Room info request failed: {}".format(e))
         return False
 
-def save_form_info(creator_id, form_data_id, form_type, params={}):
-    return ddb.save_db_record(creator_id, form_data_id, form_type, **params)
+"""
+Form info records are stored under the form's message id (pk = message id, sk = "FORM_INFO").
+This spreads the writes over many partitions and allows a direct point lookup.
+Before, all form info records were under the Bot's id (pk = bot id, sk = message id) - a hot partition.
+Use --migrate-form-info to move the old records.
+"""
+def save_form_info(form_data_id, form_type, params={}):
+    return ddb.save_db_record(form_data_id, "FORM_INFO", form_type, **params, **lifecycle.form_info_ttl_items(form_type))
     
-def get_form_info(form_data_id):
-    return ddb.get_db_records_by_secondary_key(form_data_id)[0]
+def get_form_info(form_data_id, consistent_read = False):
+    """return form info record of the form message, None if not found
+    
+    arguments:
+    form_data_id -- message id of the form
+    consistent_read -- bypass the read cache (the form may have been just sent by another process)
+    """
+    form_info = ddb.get_db_record(form_data_id, "FORM_INFO", consistent_read = consistent_read)
+    if form_info is None:
+        form_info = get_legacy_form_info(form_data_id)
+    return form_info
+    
+def get_legacy_form_info(form_data_id):
+    """return not yet migrated form info record (pk = bot id), None if not found
+    
+    the lookup is a secondary index query, it can be turned off by FORM_INFO_LEGACY_LOOKUP=false
+    once the records are migrated
+    """
+    if not strtobool(os.getenv("FORM_INFO_LEGACY_LOOKUP", "true")):
+        return None
+    legacy_records = [record for record in ddb.get_db_records_by_secondary_key(form_data_id) if record["pk"] == get_bot_id()]
+    return legacy_records[0] if legacy_records else None
     
 def delete_form_info(form_data_id):
-    return ddb.delete_db_records_by_secondary_key(form_data_id)
+    form_registry.remove(form_data_id)
+    return ddb.delete_db_record(form_data_id, "FORM_INFO")
+    
+def load_form_type(form_data_id):
+    """form type of the message from its form info record, None if it's not a form (loader of the form registry)"""
+    form_type = read_form_type(ddb, form_data_id)
+    if form_type is None:
+        form_info = get_legacy_form_info(form_data_id)
+        form_type = form_info.get("pvalue") if form_info is not None else None
+    return form_type
+    
+def migrate_form_info():
+    """move form info records from the Bot's id partition to the message id partitions, return number of records"""
+    bot_id = get_bot_id()
+    form_types = set(FORM_DATA_MAP.keys())
+    legacy_records = [record for record in ddb.iter_db_records(bot_id) if record["pvalue"] in form_types]
+    new_records = []
+    for record in legacy_records:
+        items = dict(record)
+        form_data_id = items.pop("sk")
+        items.pop("pk")
+        new_records.append({**items, "pk": form_data_id, "sk": "FORM_INFO", **lifecycle.form_info_ttl_items(items["pvalue"])})
+    if ddb.save_db_records_batch(new_records, parallel=True):
+        ddb.delete_db_records_batch([(bot_id, record["sk"]) for record in legacy_records], parallel=True)
+    flask_app.logger.info("Migrated {} form info records, the legacy lookup can be turned off by FORM_INFO_LEGACY_LOOKUP=false".format(len(new_records)))
+    return len(new_records)
     
 def save_form_data(primary_key, secondary_key, registration_data, data_type, **kwargs):
     inputs = registration_data.get("inputs", {})
@@ -789,30 +1072,44 @@ def send_message(destination, markdown, attachments=[], form_type=None, form_par
         res_msg = webex_api.messages.create(**destination, markdown=markdown, attachments=attachments)
         flask_app.logger.debug("Message created: {}".format(res_msg.json_data))
         if len(attachments) > 0 and form_type is not None:
-            save_form_info(get_bot_id(), res_msg.id, form_type, form_params) # sender is the owner
+            save_form_info(res_msg.id, form_type, form_params)
+            form_registry.register(res_msg.id, form_type)
         else:
             flask_app.logger.debug("Not saving, attach len: {}, form type: {}".format(len(attachments), form_type))
             
         return res_msg.id
     except ApiError as e:
         flask_app.logger.error("Message create failed: {}.".format(e))
+        identity.invalidate_on_auth_error(e)
         
 def send_file_stream(msg_data, file_name, content_type, file_stream):
+    """send a message with the file, the upload is sent again (from the start of the stream) if it's throttled"""
     try:
         flask_app.logger.debug("Send file {} with data: {}".format(file_name, msg_data))
         
         msg_data["files"] = (file_name, file_stream, content_type)
+        stream_start = file_stream.tell()
         
-        multipart_data = MultipartEncoder(msg_data)
-        headers = {'Content-type': multipart_data.content_type}
-        
-        json_data = webex_api.messages._session.post('messages', data=multipart_data, headers=headers)
+        for attempt in range(webex_scheduler.max_retries):
+            # the multipart body is consumed by the upload, the scheduler can't send it again
+            file_stream.seek(stream_start)
+            multipart_data = MultipartEncoder(msg_data)
+            headers = {'Content-type': multipart_data.content_type}
+            try:
+                with webex_scheduler.priority(PRIORITY_LOW): # file upload is not urgent
+                    json_data = webex_api.messages._session.post('messages', data=multipart_data, headers=headers)
+                break
+            except RateLimitError as e:
+                if attempt + 1 >= webex_scheduler.max_retries:
+                    raise
+                flask_app.logger.info("File upload throttled, retry {}: {}".format(attempt, e))
         res_msg = webex_api.messages._object_factory('message', json_data)
         flask_app.logger.debug("Message with file created: {}".format(dict(res_msg.json_data)))
         
         return res_msg.id
     except ApiError as e:
         flask_app.logger.error("Message create failed: {}.".format(e))
+        identity.invalidate_on_auth_error(e)
         
 def get_bot_id():
     bot_id = os.getenv("BOT_ID", None)
@@ -824,6 +1121,10 @@ def get_bot_id():
     return bot_id
     
 def get_bot_info():
+    """Bot's identity (cached), see load_bot_info()"""
+    return identity.get("bot_info")
+    
+def load_bot_info():
     try:
         me = webex_api.people.me()
         if me.avatar is None:
@@ -839,11 +1140,26 @@ def get_bot_name():
     me = get_bot_info()
     return me.displayName
         
+identity.register("bot_info", load_bot_info)
+identity.register("my_url", load_my_url)
+
 def init_globals():
-    global ddb
+    """make the database, person directory, vote ingest and webhook dedup objects available
+    the objects are shared by all threads and reused across requests, the backend is selected
+    by STORAGE_BACKEND (see storage.py), PERSON_DIRECTORY_PERSISTENT enables saving of display names to the database,
+    WEBHOOK_DEDUP_PERSISTENT enables the delivery markers in the database
+    """
+    global ddb, person_directory, webhook_dedup, vote_ingest
 
-    ddb = DDB_Single_Table()
+    ddb = get_shared_table()
     flask_app.logger.debug("initialize DDB object {}".format(ddb))
+    if person_directory is None:
+        persistent = strtobool(os.getenv("PERSON_DIRECTORY_PERSISTENT", "true"))
+        person_directory = PersonDirectory(webex_api, ddb if persistent else None)
+    if vote_ingest is None:
+        vote_ingest = VoteIngest(ddb, VOTE_CHOICES)
+    if webhook_dedup is None:
+        webhook_dedup = WebhookDedup(ddb if strtobool(os.getenv("WEBHOOK_DEDUP_PERSISTENT", "true")) else None)
 
 # Flask part of the code
 
@@ -876,8 +1192,25 @@ Main function which handles the webhook events. It reacts both on messages and b
 Look at the 'msg +=' for workflow explanation
 """
 
-# @task
 def handle_webhook_event(webhook):
+    # repeated delivery (or retried invocation) of an event which was already handled
+    if webhook_dedup.is_duplicate(webhook):
+        flask_app.logger.info("Duplicate {} {} event {}, ignoring".format(webhook["resource"], webhook["event"], webhook["data"]["id"]))
+        return json.dumps(["duplicate ignored"])
+        
+    try:
+        return process_webhook_event(webhook)
+    except Exception:
+        # the event was not handled, let a redelivery or a retried invocation take it
+        webhook_dedup.release(webhook)
+        raise
+        
+def process_webhook_event(webhook):
+    """handle the webhook event, called by handle_webhook_event()
+    
+    the event is already handled in a task (or a lane), so the FSM runs synchronously (fsm_handle_event.sync())
+    in the same invocation, an FSM failure releases the delivery marker and the event can be handled again
+    """
     action_list = []
     bot_info = get_bot_info()
     bot_email = bot_info.emails[0]
@@ -905,13 +1238,18 @@ def handle_webhook_event(webhook):
                     fsm_event = "ev_added_to_space"
                     # msg = "Odešle se nápověda a formulář pro zahájení schůze."
                     action_list.append("invited to a group Space")
-                    fsm_handle_event(webhook["data"]["roomId"], "ev_added_to_space", webhook)
+                    fsm_handle_event.sync(webhook["data"]["roomId"], "ev_added_to_space", webhook)
             elif webhook["event"] == "deleted":
                 flask_app.logger.info("I was removed from a Space")
                 action_list.append("bot removed from a Space")
-                fsm_handle_event(webhook["data"]["roomId"], "ev_removed_from_space")
+                fsm_handle_event.sync(webhook["data"]["roomId"], "ev_removed_from_space")
             else:
                 flask_app.logger.info("unhandled membership event '{}'".format(webhook["event"]))
+        else:
+            # keep the roster snapshot current
+            if webhook["event"] in ["created", "updated", "deleted"]:
+                update_roster(webhook["data"]["roomId"], webhook["data"], removed = webhook["event"] == "deleted")
+                action_list.append("roster {}".format(webhook["event"]))
 
         if msg != "" or len(attach) > 0:
             out_messages.append({"message": msg, "attachments": attach, "target": target_dict, "form_type": form_type})
@@ -925,7 +1263,6 @@ def handle_webhook_event(webhook):
             in_msg = webex_api.messages.get(webhook["data"]["id"])
             in_msg_low = in_msg.text.lower()
             in_msg_low = in_msg_low.replace(bot_name.lower() + " ", "") # remove bot"s name from message test to avoid command conflict
-            myUrlParts = urlparse(request.url)
 
             if "help" in in_msg_low:
                 personal_room = is_room_direct(webhook["data"]["roomId"])
@@ -942,25 +1279,40 @@ def handle_webhook_event(webhook):
 # this way we can not only gather the card data but also get the information to which card the user is responding
     elif webhook["resource"] == "attachmentActions":
         try:
-            in_attach = webex_api.attachment_actions.get(webhook["data"]["id"])
+            action_list.append("form received")
+            form_type = form_registry.get(webhook["data"]["messageId"])
+            if form_type is None:
+                flask_app.logger.info("Form info for message {} not found, ignoring".format(webhook["data"]["messageId"]))
+                return json.dumps(action_list)
+                
+            in_attach = None
+            if form_type == "POLL_FORM":
+                in_attach = handle_poll_click(webhook)
+                if in_attach is None:
+                    action_list.append("vote saved")
+                    return json.dumps(action_list)
+                    
+            if in_attach is None:
+                in_attach = webex_api.attachment_actions.get(webhook["data"]["id"])
             in_attach_dict = in_attach.to_dict()
             flask_app.logger.debug("Form received: {}".format(in_attach_dict))
             # flask_app.logger.debug("Form metadata: \nApp Id: {}\nMsg Id: {}\nPerson Id: {}".format(webhook["appId"], webhook["data"]["messageId"], webhook["data"]["personId"]))
-            action_list.append("form received")
             in_attach_dict["orgId"] = webhook["orgId"] # orgId is present only in original message, not in attachement
             
-            parent_record = ddb.get_db_records_by_secondary_key(webhook["data"]["messageId"])[0]
-            flask_app.logger.debug("Parent record: {}".format(parent_record))
-            form_type = parent_record.get("pvalue")
             form_data_type = FORM_DATA_MAP.get(form_type)
             flask_app.logger.debug("Received form type: {} -> {}".format(form_type, form_data_type))
             form_params = {}
                 
             fsm_event = detect_form_event(form_type, in_attach_dict)
-            fsm_handle_event(webhook["data"]["roomId"], fsm_event, in_attach_dict)
+            if form_type == "POLL_FORM" and not RUNNING_ON_LAMBDA:
+                # the click came in the voter's lane, the FSM has to run in order with the Space's events (e.g. poll end)
+                submit_fsm_event(webhook["data"]["roomId"], fsm_event, in_attach_dict)
+            else:
+                fsm_handle_event.sync(webhook["data"]["roomId"], fsm_event, in_attach_dict)
             
         except ApiError as e:
             flask_app.logger.error("Form read failed: {}.".format(e))
+            identity.invalidate_on_auth_error(e)
             action_list.append("form read failed")
                         
     if len(out_messages) > 0:
@@ -974,6 +1326,55 @@ def handle_webhook_event(webhook):
 
     return json.dumps(action_list)
     
+def handle_poll_click(webhook):
+    """save a click on a poll form by the vote fast path (see vote_ingest.py), no FSM and settings reads
+    
+    returns None if the click was handled, otherwise the attachment action for the FSM path
+    (poll started before the tally had the open flag)
+    """
+    data = webhook["data"]
+    form_id = data["messageId"]
+    person_id = data["personId"]
+    # the action inputs are fetched while the voter's current vote is read
+    in_attach, old_record = webex_async.run_concurrently(
+        lambda: webex_api.attachment_actions.get(data["id"]),
+        lambda: ddb.get_db_record(form_id, person_id) or {})
+    result = vote_ingest.save_vote(data["roomId"], form_id, person_id, in_attach.inputs, old_record)
+    flask_app.logger.debug("Poll click {}, form: {}, user: {}".format(result, form_id, person_id))
+    if result == VOTE_FALLBACK:
+        return in_attach
+        
+def submit_fsm_event(room_id, event_name, args_dict):
+    """handle the FSM event in the Space's lane"""
+    if not webhook_queue.submit_call(room_id, fsm_handle_event.sync, room_id, event_name, args_dict):
+        flask_app.logger.warning("lane of {} full, handling {} directly".format(room_id, event_name))
+        fsm_handle_event.sync(room_id, event_name, args_dict)
+    
+def webhook_lane_key(webhook):
+    """clicks on poll forms are ordered per voter (the vote write checks the poll is open), other events per Space"""
+    data = webhook["data"]
+    if webhook["resource"] == "attachmentActions" and form_registry.get_cached(data.get("messageId")) == "POLL_FORM":
+        return data.get("personId", data["roomId"])
+    return data["roomId"]
+    
+@task
+def handle_webhook_task(webhook):
+    """handle the webhook event in a separate Lambda invocation"""
+    init_globals()
+    handle_webhook_event(webhook)
+    
+# webhook events are handled in per-Space lanes, the webhook endpoint only puts them to the queue
+webhook_queue = WebhookQueue(handle_webhook_event)
+inbound_stats = InboundStats()
+
+def dispatch_webhook(webhook):
+    """pass the webhook event for handling, return False if it was dropped"""
+    if RUNNING_ON_LAMBDA:
+        handle_webhook_task(webhook)
+        return True
+        
+    return webhook_queue.submit(webhook, webhook_lane_key(webhook))
+    
 def detect_form_event(form_type, attachment_data):
     inputs = attachment_data.get("inputs", {})
     event = "ev_none"
@@ -1013,7 +1414,18 @@ def spark_webhook():
     if request.method == "POST":
         webhook = request.get_json(silent=True)
         flask_app.logger.debug("Webhook received: {}".format(webhook))
-        handle_webhook_event(webhook)        
+        if not is_valid_webhook(webhook):
+            flask_app.logger.info("Invalid webhook received, ignoring")
+            return "Invalid webhook", 400
+        # events which need no handling are recognized from the payload, before any API call
+        drop_reason = early_drop_reason(webhook)
+        inbound_stats.count(webhook, drop_reason)
+        if drop_reason is not None:
+            flask_app.logger.debug("Dropping {} event {}: {}".format(webhook["resource"], webhook["data"]["id"], drop_reason))
+            return "OK"
+        # respond immediately, the event is handled in the lane of its Space
+        if not dispatch_webhook(webhook):
+            return "Webhook lane full", 503
     elif request.method == "GET":
         bot_info = get_bot_info()
         message = "<center><img src=\"{0}\" alt=\"{1}\" style=\"width:256; height:256;\"</center>" \
@@ -1022,94 +1434,169 @@ def spark_webhook():
         message += "<center><b>I'm hosted at: <a href=\"{0}\">{0}</a></center>".format(request.url)
         res = create_webhook(request.url)
         if res is True:
-            message += "<center><b>New webhook created sucessfully</center>"
+            message += "<center><b>Webhooks are set up</center>"
         else:
-            message += "<center><b>Tried to create a new webhook but failed, see application log for details.</center>"
+            message += "<center><b>Tried to set up the webhooks but failed, see application log for details.</center>"
 
         return message
         
     flask_app.logger.debug("Webhook handling done.")
     return "OK"
         
-def create_partial_results(results_items, settings):
-    user_list = []
-    name_key = bc.localize("{{loc_publish_poll_results_1}}", settings.settings["language"])
-    choice_key = bc.localize("{{loc_publish_poll_results_6}}", settings.settings["language"])
-    for poll_res in results_items:
-        user_list.append(poll_res.get(name_key, ""))
+@flask_app.route("/stats")
+def stats():
+    """usage metrics of the Webex transport and caches"""
+    return json.dumps({
+        "webex_transport": webex_transport.stats(),
+        "webex_scheduler": webex_scheduler.stats(),
+        "storage_cache": ddb.cache_stats() if ddb is not None else None,
+        "person_directory": person_directory.stats() if person_directory is not None else None,
+        "identity_loads": identity.loads,
+        "webhook_inbound": inbound_stats.stats(),
+        "webhook_queue": webhook_queue.stats(),
+        "webhook_dedup": webhook_dedup.stats() if webhook_dedup is not None else None,
+        "form_registry": form_registry.stats(),
+        "vote_ingest": vote_ingest.stats() if vote_ingest is not None else None
+    })
         
-    user_list = list(set(user_list)) # get unique names
+def localize_vote(vote, language):
+    """return the vote label in the language, legacy results contain already localized votes which are returned as they are"""
+    vote_label = VOTE_LABELS.get(vote)
+    if vote_label is None:
+        return vote
+    return bc.localize(vote_label, language)
+
+def create_partial_results(vote_results, settings):
+    """create a table of a single poll results, row per user
+    
+    arguments:
+    vote_results -- list of (display name, vote)
+    settings -- current active settings (user- or space-level)
+    """
+    language = settings.settings["language"]
+    name_key = bc.localize("{{loc_publish_poll_results_1}}", language)
+    choice_key = bc.localize("{{loc_publish_poll_results_6}}", language)
+    user_votes = {}
+    for (name, vote) in vote_results:
+        user_votes.setdefault(name, []).append(localize_vote(vote, language))
+        
+    user_list = list(user_votes.keys())
     user_list.sort(key=lambda x: x.split(" ")[-1]) # sort by last name
     flask_app.logger.debug("got user list: {}".format(user_list))
     
     header_list = [name_key, choice_key]
-    complete_results = []
-    for user in user_list:
-        user_vote_list = [user]
-        for poll_res in results_items:
-            if poll_res[name_key] == user:
-                user_vote_list.append(poll_res[choice_key])
-            
-        complete_results.append(user_vote_list)
+    complete_results = [[user] + user_votes[user] for user in user_list]
         
     flask_app.logger.debug("Create partial results: {}".format(complete_results))
         
     return complete_results, header_list
 
+def get_last_meeting(room_id):
+    """return the LAST_MEETING record of the Space, None if no meeting was started since the record was introduced
+    
+    the record contains "start" and "end" timestamps, "subject" and pvalue "MEETING_START" or "MEETING_END"
+    
+    arguments:
+    room_id -- id of the Space
+    """
+    return ddb.get_db_record(room_id, "LAST_MEETING", consistent_read=True)
+    
+def save_last_meeting(room_id, meeting_status, timestamp, subject):
+    """update the LAST_MEETING record of the Space on meeting start/end
+    
+    arguments:
+    room_id -- id of the Space
+    meeting_status -- "MEETING_START" or "MEETING_END"
+    timestamp -- time of the start/end
+    subject -- meeting subject
+    """
+    if meeting_status == "MEETING_START":
+        ddb.save_db_record(room_id, "LAST_MEETING", meeting_status, start=timestamp, subject=subject)
+    else:
+        # end only a started meeting, legacy meetings (started before LAST_MEETING existed) have no record
+        ddb.transact_write_db_records([{"update": (room_id, "LAST_MEETING"), "set": {"pvalue": meeting_status, "end": timestamp}, "expected": {"pvalue": "MEETING_START"}}])
+        
+def get_results_key(room_id):
+    """return primary key for the RESULTS records of the last meeting in the Space
+    
+    arguments:
+    room_id -- id of the Space
+    """
+    last_meeting = get_last_meeting(room_id)
+    if last_meeting is None:
+        return room_id # legacy meeting
+    return results_key(room_id, last_meeting["start"])
+    
 def get_last_meeting_results(room_id):
+    """return the poll results of the last (or currently running) meeting in the Space
+    
+    the results are returned as a generator, the records are read page by page as they are consumed
+    
+    arguments:
+    room_id -- id of the Space
+    """
+    last_meeting = get_last_meeting(room_id)
+    if last_meeting is not None:
+        flask_app.logger.debug("Found last meeting: {}".format(last_meeting))
+        meeting_name = unidecode(last_meeting.get("subject", "")).lower().replace(" ", "_")
+        return ddb.iter_db_records(results_key(room_id, last_meeting["start"]), "RESULTS"), meeting_name
+        
+    return get_legacy_meeting_results(room_id)
+    
+def get_legacy_meeting_results(room_id):
+    """return the poll results of the last meeting saved before the LAST_MEETING record existed, see get_last_meeting_results()"""
     now = create_timestamp()
     flask_app.logger.debug("Query results for timestamp {} and room_id {}".format(now, room_id))
-    meeting_start_res = ddb.table.query(KeyConditionExpression=Key("pk").eq(room_id) & Key("sk").lt(now), FilterExpression=Attr("pvalue").eq("MEETING_START"), ScanIndexForward=False, Limit=5000)
-    flask_app.logger.debug("Found meeting start: {}".format(meeting_start_res))
-    meeting_end_res = ddb.table.query(KeyConditionExpression=Key("pk").eq(room_id) & Key("sk").lt(now), FilterExpression=Attr("pvalue").eq("MEETING_END"), ScanIndexForward=False, Limit=5000)
-    flask_app.logger.debug("Found meeting end: {}".format(meeting_end_res))
+    last_meeting_start = max(ddb.iter_db_records(room_id, "MEETING_START", sk_to=now), key=lambda x: x["sk"], default=None)
+    flask_app.logger.debug("Found meeting start: {}".format(last_meeting_start))
+    last_meeting_end = max(ddb.iter_db_records(room_id, "MEETING_END", sk_to=now, projection=["sk"]), key=lambda x: x["sk"], default=None)
+    flask_app.logger.debug("Found meeting end: {}".format(last_meeting_end))
     
-    last_meeting_start = meeting_start_res["Items"][0]["sk"]
-    last_meeting_end = meeting_end_res["Items"][0]["sk"]
-    if last_meeting_end < last_meeting_start:
-        last_meeting_end = now
-        
-    meeting_name = unidecode(meeting_start_res["Items"][0].get("subject", "")).lower().replace(" ", "_")
+    if last_meeting_start is None:
+        return iter([]), ""
+    
+    meeting_start = last_meeting_start["sk"]
+    meeting_end = last_meeting_end["sk"] if last_meeting_end is not None else now
+    if meeting_end < meeting_start:
+        meeting_end = now
         
-    results_res = ddb.table.query(KeyConditionExpression=Key("pk").eq(room_id), FilterExpression=Attr("pvalue").eq("RESULTS") & Attr("timestamp").lte(last_meeting_end) & Attr("timestamp").gte(last_meeting_start), ScanIndexForward=True)
-    flask_app.logger.debug("Meeting results: {}".format(results_res))
-    results_items = results_res.get("Items")
+    meeting_name = unidecode(last_meeting_start.get("subject", "")).lower().replace(" ", "_")
+    
+    results_items = (res for res in ddb.iter_db_records(room_id, "RESULTS") if meeting_start <= res.get("timestamp", "") <= meeting_end)
     
     return results_items, meeting_name
-            
-def get_name_from_results(vote_results, name_key):
-    name_list = []
-    for vote in vote_results:
-        name = vote.get(name_key)
-        if name:
-            name_list.append(name)
-            
-    return name_list
     
 def create_results(results_items, settings):
-    name_key = bc.localize("{{loc_publish_poll_results_1}}", settings.settings["language"])
-    choice_key = bc.localize("{{loc_publish_poll_results_6}}", settings.settings["language"])
-
-    results_items.sort(key=lambda x: x["timestamp"])
-        
-    user_list = []
-    subject_list = []
-    for poll_res in results_items:
-        vote_results = poll_res.get("vote_results", [])
-        user_list += get_name_from_results(vote_results, name_key)
-        subject_list.append(poll_res["subject"])
-        
-    user_list = list(set(user_list)) # get unique names
+    """create a table of the meeting results, row per user, column per poll
+    
+    results_items are consumed in one pass, no need to have them all in memory
+    
+    arguments:
+    results_items -- iterable of RESULTS records
+    settings -- current active settings (user- or space-level)
+    """
+    language = settings.settings["language"]
+    name_key = bc.localize("{{loc_publish_poll_results_1}}", language)
+    choice_key = bc.localize("{{loc_publish_poll_results_6}}", language)
+
+    poll_list = [] # (timestamp, poll index, subject)
+    user_votes = {} # user name -> {poll index: vote}
+    for (poll_index, poll_res) in enumerate(results_items):
+        poll_list.append((poll_res["timestamp"], poll_index, poll_res["subject"]))
+        for (name, vote) in iter_vote_results(poll_res, name_key, choice_key):
+            user_votes.setdefault(name, {}).setdefault(poll_index, vote)
+                
+    poll_list.sort()
+    user_list = list(user_votes.keys())
     user_list.sort(key=lambda x: x.split(" ")[-1]) # sort by last name
     flask_app.logger.debug("got user list: {}".format(user_list))
     
-    header_list = [name_key] + subject_list
+    header_list = [name_key] + [subject for (timestamp, poll_index, subject) in poll_list]
     complete_results = []
     for user in user_list:
         user_vote_list = [user]
-        for poll_res in results_items:
-            vote_results = poll_res.get("vote_results", [])
-            user_vote_list.append(get_vote_for_user(vote_results, user, name_key, choice_key))
+        for (timestamp, poll_index, subject) in poll_list:
+            user_vote_list.append(localize_vote(user_votes[user].get(poll_index, ""), language))
             
         complete_results.append(user_vote_list)
         
@@ -1130,14 +1617,6 @@ def create_xls_stream(complete_results, header_list):
     
     return bi
     
-def get_vote_for_user(vote_results, user, name_key, choice_key):
-    for vote_item in vote_results:
-        if vote_item[name_key] == user:
-            return vote_item[choice_key]
-            
-    return ""
-    
-
 """
 Startup procedure used to initiate @flask_app.before_first_request
 """
@@ -1174,6 +1653,7 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument('-v', '--verbose', action='count', help="Set logging level by number of -v's, -v=WARN, -vv=INFO, -vvv=DEBUG")
+    parser.add_argument('--migrate-form-info', action='store_true', help="move form info records from the Bot's id partition to the message id partitions and exit")
     
     args = parser.parse_args()
     if args.verbose:
@@ -1186,6 +1666,11 @@ if __name__ == "__main__":
             
     flask_app.logger.info("Logging level: {}".format(logging.getLogger(__name__).getEffectiveLevel()))
     
+    if args.migrate_form_info:
+        init_globals()
+        migrate_form_info()
+        sys.exit(0)
+    
     bot_identity = webex_api.people.me()
     flask_app.logger.info("Bot \"{}\"\nUsing database: {} - {}".format(bot_identity.displayName, os.getenv("DYNAMODB_ENDPOINT_URL"), os.getenv("DYNAMODB_TABLE_NAME")))
     
@@ -0,0 +1,105 @@
+"""
+Read-through cache for single table records
+Records are cached by (pk, sk), the time to live is set per sk type (for example "FSM_STATE", "SETTINGS").
+Only the sk types listed in the TTL dict are cached. A record which doesn't exist is cached
+for MISSING_RECORD_TTL at most, it may be just being created by another process.
+"""
+
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+# sk type -> seconds
+DEFAULT_CACHE_TTLS = {
+    "FSM_STATE": 2,
+    "POLL_STATE": 2,
+    "SETTINGS": 60,
+    "FORM_INFO": 300 # form info doesn't change once the form is sent
+}
+# seconds to cache a record which doesn't exist in the database (if the sk type TTL is not shorter)
+MISSING_RECORD_TTL = 1
+
+# stored in cache for records which do not exist in the database
+_MISSING = object()
+
+class RecordCache():
+    """bounded LRU cache with per-sk-type TTL
+
+    The cache is thread-safe. Cached records are copied on the way in and out
+    so that callers can modify the returned dicts.
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, max_size=1000, ttls=None, missing_ttl=MISSING_RECORD_TTL):
+        self.max_size = max_size
+        self.ttls = DEFAULT_CACHE_TTLS.copy() if ttls is None else ttls
+        self.missing_ttl = missing_ttl
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def is_cached_type(self, sk):
+        return sk in self.ttls
+
+    def get(self, pk, sk):
+        """return (found, record), record is None if it's known not to exist in the database"""
+        if not self.is_cached_type(sk):
+            return False, None
+
+        key = (str(pk), sk)
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._records.move_to_end(key)
+                self.hits += 1
+                record = entry[1]
+            else:
+                if entry is not None:
+                    del self._records[key]
+                self.misses += 1
+                return False, None
+
+        if record is _MISSING:
+            return True, None
+        return True, copy.deepcopy(record)
+
+    def put(self, pk, sk, record):
+        """store a record, None means the record doesn't exist in the database"""
+        if not self.is_cached_type(sk):
+            return
+
+        key = (str(pk), sk)
+        if record is None:
+            value = _MISSING
+            ttl = min(self.ttls[sk], self.missing_ttl)
+        else:
+            value = copy.deepcopy(record)
+            ttl = self.ttls[sk]
+        with self._lock:
+            self._records[key] = (time.monotonic() + ttl, value)
+            self._records.move_to_end(key)
+            while len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, pk, sk):
+        with self._lock:
+            self._records.pop((str(pk), sk), None)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._records),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
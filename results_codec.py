@@ -0,0 +1,91 @@
+"""
+Storage format of the poll results (RESULTS records)
+Format version 1 (legacy) stores "vote_results" as a list of {localized name key: name, localized choice key: choice}.
+Format version 2 stores the voters as columns (person ids, display names, vote codes)
+serialized to JSON, compressed by zlib and encoded as base64 string. The votes are
+localized only when the results are rendered.
+
+RESULTS records of a meeting are saved under a meeting-scoped primary key (see results_key()),
+so that the results of a meeting are read by a single query. Legacy records have the Space id
+as the primary key.
+"""
+
+import base64
+import json
+import logging
+import zlib
+
+RESULTS_FORMAT_VERSION = 2
+
+# vote -> single character code
+VOTE_CODES = {
+    "yea": "y",
+    "nay": "n",
+    "abstain": "a"
+}
+VOTE_NAMES = {code: vote for (vote, code) in VOTE_CODES.items()}
+
+logger = logging.getLogger(__name__)
+
+def results_key(room_id, meeting_start):
+    """primary key of the RESULTS records of the meeting
+
+    arguments:
+    room_id -- id of the Space
+    meeting_start -- timestamp of the meeting start
+    """
+    return "MEETING#{}#{}".format(room_id, meeting_start)
+
+def pack_json(data):
+    """serialize data to compact JSON, compress by zlib and return as base64 string"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.b64encode(zlib.compress(payload, 9)).decode("ascii")
+
+def unpack_json(packed):
+    """return data of a pack_json() string"""
+    return json.loads(zlib.decompress(base64.b64decode(packed)).decode("utf-8"))
+
+def encode_vote_results(vote_results):
+    """return RESULTS record items of the current format version
+
+    arguments:
+    vote_results -- list of (person_id, display name, vote) tuples, vote is one of VOTE_CODES keys
+    """
+    columns = {
+        "person_ids": [person_id for (person_id, name, vote) in vote_results],
+        "names": [name for (person_id, name, vote) in vote_results],
+        "votes": "".join(VOTE_CODES[vote] for (person_id, name, vote) in vote_results)
+    }
+
+    return {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "voter_count": len(vote_results),
+        "vote_data": pack_json(columns)
+    }
+
+def decode_vote_results(results_record):
+    """return the columns of a version 2 RESULTS record as a dict of lists "person_ids", "names", "votes" """
+    columns = unpack_json(results_record["vote_data"])
+    columns["votes"] = [VOTE_NAMES[code] for code in columns["votes"]]
+
+    return columns
+
+def iter_vote_results(results_record, legacy_name_key, legacy_choice_key):
+    """generate (display name, vote) of the RESULTS record
+
+    vote is one of VOTE_CODES keys for the current format version. Legacy records
+    have the vote already localized, it's returned as stored.
+
+    arguments:
+    results_record -- RESULTS record
+    legacy_name_key, legacy_choice_key -- localized keys used in legacy records
+    """
+    if int(results_record.get("format_version", 1)) >= 2:
+        columns = decode_vote_results(results_record)
+        for (name, vote) in zip(columns["names"], columns["votes"]):
+            yield name, vote
+    else:
+        for vote_item in results_record.get("vote_results", []):
+            name = vote_item.get(legacy_name_key)
+            if name:
+                yield name, vote_item.get(legacy_choice_key, "")
@@ -0,0 +1,46 @@
+"""
+Membership roster of a Space (ROSTER record, pk = Space id)
+The roster is taken when a meeting starts and kept current by the memberships webhooks.
+Members are stored as columns (person ids, display names, moderator flags) packed like the poll
+results (see results_codec.pack_json()), so that even large Spaces fit in one record.
+A roster of an unknown format version is not decoded, it's replaced by the next snapshot.
+"version" item is incremented by each write, updates are conditional on it.
+"""
+
+from results_codec import pack_json, unpack_json
+
+ROSTER_FORMAT_VERSION = 1
+
+def encode_roster(members):
+    """return ROSTER record items
+
+    arguments:
+    members -- dict {person id: (display name, is moderator)}
+    """
+    person_ids = list(members.keys())
+    columns = {
+        "person_ids": person_ids,
+        "names": [members[person_id][0] for person_id in person_ids],
+        "moderators": "".join("1" if members[person_id][1] else "0" for person_id in person_ids)
+    }
+
+    return {
+        "format_version": ROSTER_FORMAT_VERSION,
+        "member_count": len(members),
+        "roster_data": pack_json(columns)
+    }
+
+def decode_roster(roster_record):
+    """return dict {person id: (display name, is moderator)} of the ROSTER record, None if the format version is not supported"""
+    if int(roster_record.get("format_version", 0)) != ROSTER_FORMAT_VERSION:
+        return None
+    columns = unpack_json(roster_record["roster_data"])
+
+    return {person_id: (name, moderator == "1") for (person_id, name, moderator) in zip(columns["person_ids"], columns["names"], columns["moderators"])}
+
+def members_from_memberships(memberships):
+    """return roster members from the memberships.list() result"""
+    return {membership.personId: (membership.personDisplayName or "", bool(membership.isModerator)) for membership in memberships}
+
+def get_moderators(members):
+    return [person_id for (person_id, (name, is_moderator)) in members.items() if is_moderator]
@@ -0,0 +1,191 @@
+"""
+Storage protocol of the single table
+All Bot data are kept in one table of records. Each record has a primary key (pk),
+secondary key (sk), pvalue (record type or value) and optional items.
+(pk, sk) is unique. See ddb_single_table_obj.py for the DynamoDB implementation,
+sqlite_single_table_obj.py for SQLite and memory_single_table_obj.py for the in-memory one.
+"""
+
+import decimal
+import json
+import logging
+import time
+
+# item with expiration time of the record (seconds since epoch), see purge_expired_db_records()
+TTL_ATTRIBUTE = "expires_at"
+
+def _json_default(value):
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, set):
+        return sorted(value)
+    raise TypeError("{} is not JSON serializable".format(type(value)))
+
+def record_to_json(record):
+    """serialize a record, DynamoDB numbers (Decimal) are converted to JSON numbers"""
+    return json.dumps(record, default=_json_default, ensure_ascii=False, sort_keys=True)
+
+def record_from_json(record_json):
+    """deserialize a record, numbers are returned as Decimal the same way DynamoDB does"""
+    return json.loads(record_json, parse_float=decimal.Decimal, parse_int=decimal.Decimal)
+
+class Single_Table():
+    """base class of the storage backends
+
+    Backends implement the methods which raise NotImplementedError, the others have
+    a generic implementation which a backend can replace by a more efficient one.
+    """
+    logger = logging.getLogger(__name__)
+
+    def save_db_record(self, pk, sk, pvalue, **items):
+        """create or replace the record"""
+        raise NotImplementedError
+
+    def get_db_record(self, pk, sk, consistent_read=False):
+        """return the record as a dict or None if it doesn't exist
+
+        consistent_read -- strongly consistent read, bypasses caches
+        """
+        raise NotImplementedError
+
+    def get_db_records_batch(self, keys, consistent_read=False):
+        """return dict {(pk, sk): record} of the existing records, missing records are left out
+
+        arguments:
+        keys -- list of (pk, sk) tuples
+        consistent_read -- strongly consistent read, bypasses caches
+        """
+        records = {}
+        for (pk, sk) in keys:
+            record = self.get_db_record(pk, sk, consistent_read=consistent_read)
+            if record is not None:
+                records[(pk, sk)] = record
+        return records
+
+    def delete_db_record(self, pk, sk):
+        """delete the record"""
+        raise NotImplementedError
+
+    def iter_db_records(self, pk, pvalue_condition=None, sk_from=None, sk_to=None, reverse=False, page_size=None, projection=None, consistent_read=False):
+        """generator of the records with the primary key
+
+        arguments:
+        pk -- primary key
+        pvalue_condition -- return only records with this pvalue
+        sk_from -- return only records with sk >= sk_from
+        sk_to -- return only records with sk < sk_to
+        reverse -- descending order by sk (not guaranteed if pvalue_condition is used)
+        page_size -- number of records read from the storage at once
+        projection -- list of attribute names to be returned, default all
+        consistent_read -- strongly consistent read if the backend distinguishes it
+        """
+        raise NotImplementedError
+
+    def get_db_records_by_secondary_key(self, sk, pvalue_condition=None):
+        """return list of the records with the secondary key (and pvalue)"""
+        raise NotImplementedError
+
+    def iter_all_db_records(self, page_size=None):
+        """generator of all records in the table, used for export and maintenance"""
+        raise NotImplementedError
+
+    def transact_write_db_records(self, operations):
+        """write multiple records atomically, all or nothing
+
+        Each operation is a dict with one of the keys:
+            "put" -- record dict with "pk", "sk", "pvalue" and items, the record is created or replaced
+            "update" -- (pk, sk) tuple, the record is created if it doesn't exist; further keys:
+                "set" -- dict of items to set
+                "add" -- dict of numeric items to increment (negative value decrements)
+            "delete" -- (pk, sk) tuple
+        and optional "expected" dict of item values the existing record has to have,
+        None value means that the item must not exist ({"pk": None} - the record must not exist).
+
+        returns True if written, False if an expected value didn't match (or on error)
+        """
+        raise NotImplementedError
+
+    def query_db_record(self, pk, pvalue_condition=None):
+        """list of all records with the primary key (and pvalue), see iter_db_records()"""
+        return list(self.iter_db_records(pk, pvalue_condition))
+
+    def save_db_records_batch(self, records, parallel=False):
+        """save multiple records
+
+        arguments:
+        records -- list of dicts, each has to contain "pk", "sk" and "pvalue", other keys are saved as items
+        parallel -- allow the backend to write in parallel
+
+        returns True if all records were saved
+        """
+        for record in records:
+            record = dict(record)
+            self.save_db_record(record.pop("pk"), record.pop("sk"), record.pop("pvalue"), **record)
+        return True
+
+    def delete_db_records_batch(self, keys, parallel=False):
+        """delete multiple records
+
+        arguments:
+        keys -- list of (pk, sk) tuples
+        parallel -- allow the backend to delete in parallel
+
+        returns True if all records were deleted
+        """
+        for (pk, sk) in keys:
+            self.delete_db_record(pk, sk)
+        return True
+
+    def delete_db_records_by_secondary_key(self, sk):
+        """delete all records with the secondary key"""
+        keys = [(record["pk"], sk) for record in self.get_db_records_by_secondary_key(sk)]
+        return self.delete_db_records_batch(keys)
+
+    def purge_expired_db_records(self, now=None):
+        """delete records whose TTL_ATTRIBUTE time passed, return number of deleted records
+
+        arguments:
+        now -- current time (seconds since epoch), default time.time()
+        """
+        if now is None:
+            now = time.time()
+        keys = [(record["pk"], record["sk"]) for record in self.iter_all_db_records() if TTL_ATTRIBUTE in record and record[TTL_ATTRIBUTE] <= now]
+        if keys:
+            self.delete_db_records_batch(keys)
+        return len(keys)
+
+    @staticmethod
+    def operation_key(operation):
+        """(pk, sk) of a transact_write_db_records() operation"""
+        if "put" in operation:
+            return (operation["put"]["pk"], operation["put"]["sk"])
+        return tuple(operation.get("update") or operation["delete"])
+
+    @staticmethod
+    def matches_expected(record, expected):
+        """check the record (None if it doesn't exist) against the "expected" dict of an operation"""
+        for (key, value) in expected.items():
+            if value is None:
+                if record is not None and key in record:
+                    return False
+            elif record is None or record.get(key) != value:
+                return False
+        return True
+
+    @staticmethod
+    def apply_operation(record, operation):
+        """return the record (None if deleted) after a transact_write_db_records() operation"""
+        if "put" in operation:
+            return dict(operation["put"])
+        if "delete" in operation:
+            return None
+        pk, sk = operation["update"]
+        record = dict(record) if record is not None else {"pk": pk, "sk": sk}
+        record.update(operation.get("set", {}))
+        for (key, value) in operation.get("add", {}).items():
+            record[key] = record.get(key, 0) + value
+        return record
+
+    def cache_stats(self):
+        """hit/miss counters of the read cache, None if the backend doesn't cache"""
+        return None
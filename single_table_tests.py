@@ -0,0 +1,72 @@
+"""
+Backend-independent tests of the single table storage protocol
+A backend test case inherits from SingleTableTests and TestCase and implements make_table().
+"""
+
+from settings import BotSettings
+
+class SingleTableTests():
+
+    def make_table(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.db = self.make_table()
+        self.db.save_db_record("room_1", "2021-05-01T10:00:00.000Z", "MEETING_START", subject="first")
+        self.db.save_db_record("room_1", "2021-05-01T11:00:00.000Z", "MEETING_END")
+        self.db.save_db_record("room_1", "2021-05-02T10:00:00.000Z", "MEETING_START", subject="second")
+        self.db.save_db_record("room_1", "person_1", "PRESENT", status=True)
+        self.db.save_db_record("room_2", "person_1", "PRESENT", status=False)
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+
+    def test_save_get_delete(self):
+        self.assertEqual(self.db.get_db_record("room_1", "person_1"), {"pk": "room_1", "sk": "person_1", "pvalue": "PRESENT", "status": True})
+        self.db.delete_db_record("room_1", "person_1")
+        self.assertEqual(self.db.get_db_record("room_1", "person_1"), None)
+        self.assertEqual(self.db.query_db_record("room_1", "PRESENT"), [])
+
+    def test_sk_range(self):
+        records = list(self.db.iter_db_records("room_1", sk_from="2021-05-01T10:00:00.000Z", sk_to="2021-05-02T10:00:00.000Z", reverse=True, projection=["sk"], page_size=1))
+        self.assertEqual(records, [{"sk": "2021-05-01T11:00:00.000Z"}, {"sk": "2021-05-01T10:00:00.000Z"}])
+
+    def test_pvalue_filter(self):
+        records = list(self.db.iter_db_records("room_1", "MEETING_START", sk_to="2021-05-03"))
+        self.assertEqual([record["subject"] for record in records], ["first", "second"])
+
+    def test_secondary_key(self):
+        self.assertEqual(len(self.db.get_db_records_by_secondary_key("person_1")), 2)
+        self.assertEqual(len(self.db.get_db_records_by_secondary_key("person_1", "PRESENT")), 2)
+        self.db.delete_db_records_by_secondary_key("person_1")
+        self.assertEqual(self.db.get_db_records_by_secondary_key("person_1"), [])
+
+    def test_batch(self):
+        self.db.save_db_records_batch([{"pk": "room_3", "sk": "person_{}".format(i), "pvalue": "PRESENT", "status": True} for i in range(30)])
+        self.assertEqual(len(self.db.query_db_record("room_3", "PRESENT")), 30)
+        self.db.delete_db_records_batch([("room_3", "person_{}".format(i)) for i in range(30)])
+        self.assertEqual(self.db.query_db_record("room_3"), [])
+
+    def test_transact_write(self):
+        vote = {"put": {"pk": "form_1", "sk": "person_1", "pvalue": "POLL_DATA", "vote": "yea"}, "expected": {"pk": None}}
+        tally = {"update": ("form_1", "POLL_TALLY"), "set": {"pvalue": "POLL_TALLY"}, "add": {"yea": 1}}
+        self.assertTrue(self.db.transact_write_db_records([vote, tally]))
+        self.assertFalse(self.db.transact_write_db_records([vote, tally])) # record already exists
+        change = {"put": {"pk": "form_1", "sk": "person_1", "pvalue": "POLL_DATA", "vote": "nay"}, "expected": {"vote": "yea"}}
+        tally = {"update": ("form_1", "POLL_TALLY"), "set": {"pvalue": "POLL_TALLY"}, "add": {"yea": -1, "nay": 1}}
+        self.assertTrue(self.db.transact_write_db_records([change, tally]))
+        self.assertFalse(self.db.transact_write_db_records([change, tally])) # vote is not "yea" anymore
+        record = self.db.get_db_record("form_1", "POLL_TALLY")
+        self.assertEqual((record["pvalue"], record["yea"], record["nay"]), ("POLL_TALLY", 0, 1))
+        self.assertEqual(self.db.get_db_record("form_1", "person_1")["vote"], "nay")
+        self.assertTrue(self.db.transact_write_db_records([{"delete": ("form_1", "person_1"), "expected": {"vote": "nay"}}]))
+        self.assertEqual(self.db.get_db_record("form_1", "person_1"), None)
+
+    def test_settings(self):
+        stngs = BotSettings(db = self.db, settings_id = "room_1")
+        stngs.settings = {"language": "cs_CZ"}
+        stngs.save()
+        stngs2 = BotSettings(db = self.db, settings_id = "room_1")
+        self.assertEqual(stngs.settings, stngs2.settings)
+        self.assertEqual(stngs2.stored, True)
@@ -0,0 +1,226 @@
+"""
+SQLite single table implementation
+For self-hosted single-node deployments. Same record layout as the DynamoDB table:
+primary key (pk, sk), index (sk, pvalue) mirroring gsi_1 and index (pk, pvalue) mirroring gsi_2.
+Record items are stored as JSON. The database runs in WAL mode so that readers do not
+block the writer, each thread has its own connection.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from single_table import Single_Table, record_to_json, record_from_json, TTL_ATTRIBUTE
+
+DEFAULT_SQLITE_DB_PATH = "poll_bot.sqlite3"
+# seconds to wait for a lock held by another connection
+SQLITE_BUSY_TIMEOUT = 10
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS records (
+        pk TEXT NOT NULL,
+        sk TEXT NOT NULL,
+        pvalue TEXT NOT NULL,
+        items TEXT NOT NULL,
+        PRIMARY KEY (pk, sk)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_sk_pvalue ON records (sk, pvalue)",
+    "CREATE INDEX IF NOT EXISTS idx_pk_pvalue ON records (pk, pvalue, sk)"
+]
+
+class SQLite_Single_Table(Single_Table):
+    """SQLite storage backend, see single_table.Single_Table for the method descriptions"""
+
+    logger = logging.getLogger(__name__)
+
+    _shared_tables = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, db_path = None):
+        if db_path is None:
+            db_path = os.getenv("SQLITE_DB_PATH", DEFAULT_SQLITE_DB_PATH)
+
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        with self.connection as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        self.logger.debug("initialized for database {}".format(self.db_path))
+
+    @classmethod
+    def shared(cls, db_path = None):
+        """return a process-wide instance for the database file"""
+        if db_path is None:
+            db_path = os.getenv("SQLITE_DB_PATH", DEFAULT_SQLITE_DB_PATH)
+
+        with cls._shared_lock:
+            table = cls._shared_tables.get(db_path)
+            if table is None:
+                table = cls(db_path)
+                cls._shared_tables[db_path] = table
+            return table
+
+    @property
+    def connection(self):
+        """connection of the current thread, created on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout = SQLITE_BUSY_TIMEOUT, check_same_thread = False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """close connections of all threads"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def _to_row(self, pk, sk, pvalue, items):
+        return (pk, sk, pvalue, record_to_json(items))
+
+    def _from_row(self, row, projection = None):
+        pk, sk, pvalue, items = row
+        record = {"pk": pk, "sk": sk, "pvalue": pvalue, **record_from_json(items)}
+        if projection:
+            record = {key: value for (key, value) in record.items() if key in projection}
+        return record
+
+    def save_db_record(self, pk, sk, pvalue, **items):
+        try:
+            with self.connection as conn:
+                conn.execute("INSERT OR REPLACE INTO records (pk, sk, pvalue, items) VALUES (?, ?, ?, ?)", self._to_row(pk, sk, pvalue, items))
+        except Exception as e:
+            self.logger.error("Save DB record exception: {}".format(e))
+
+    def get_db_record(self, pk, sk, consistent_read=False):
+        try:
+            row = self.connection.execute("SELECT pk, sk, pvalue, items FROM records WHERE pk = ? AND sk = ?", (str(pk), sk)).fetchone()
+            return self._from_row(row) if row is not None else None
+        except Exception as e:
+            self.logger.error("Get DB record exception: {}".format(e))
+
+    def delete_db_record(self, pk, sk):
+        try:
+            with self.connection as conn:
+                conn.execute("DELETE FROM records WHERE pk = ? AND sk = ?", (pk, sk))
+        except Exception as e:
+            self.logger.error("Delete DB record exception: {}".format(e))
+
+    def _iter_select(self, query, params, page_size, projection):
+        cursor = self.connection.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(page_size or 100)
+            if not rows:
+                break
+            for row in rows:
+                yield self._from_row(row, projection)
+
+    def iter_db_records(self, pk, pvalue_condition=None, sk_from=None, sk_to=None, reverse=False, page_size=None, projection=None, consistent_read=False):
+        conditions = ["pk = ?"]
+        params = [pk]
+        if pvalue_condition is not None:
+            conditions.append("pvalue = ?")
+            params.append(pvalue_condition)
+        if sk_from is not None:
+            conditions.append("sk >= ?")
+            params.append(sk_from)
+        if sk_to is not None:
+            conditions.append("sk < ?")
+            params.append(sk_to)
+        query = "SELECT pk, sk, pvalue, items FROM records WHERE {} ORDER BY sk {}".format(" AND ".join(conditions), "DESC" if reverse else "ASC")
+        try:
+            for record in self._iter_select(query, params, page_size, projection):
+                yield record
+        except Exception as e:
+            self.logger.error("Iterate DB records exception: {}".format(e))
+
+    def iter_all_db_records(self, page_size=None):
+        try:
+            for record in self._iter_select("SELECT pk, sk, pvalue, items FROM records ORDER BY pk, sk", [], page_size, None):
+                yield record
+        except Exception as e:
+            self.logger.error("Iterate all DB records exception: {}".format(e))
+
+    def get_db_records_by_secondary_key(self, sk, pvalue_condition=None):
+        query = "SELECT pk, sk, pvalue, items FROM records WHERE sk = ?"
+        params = [sk]
+        if pvalue_condition is not None:
+            query += " AND pvalue = ?"
+            params.append(pvalue_condition)
+        try:
+            return list(self._iter_select(query, params, None, None))
+        except Exception as e:
+            self.logger.error("Get DB record by secondary key exception: {}".format(e))
+
+    def transact_write_db_records(self, operations):
+        conn = self.connection
+        try:
+            conn.execute("BEGIN IMMEDIATE") # take the write lock before reading the expected values
+            records = []
+            for operation in operations:
+                pk, sk = self.operation_key(operation)
+                row = conn.execute("SELECT pk, sk, pvalue, items FROM records WHERE pk = ? AND sk = ?", (pk, sk)).fetchone()
+                record = self._from_row(row) if row is not None else None
+                if not self.matches_expected(record, operation.get("expected", {})):
+                    conn.rollback()
+                    return False
+                records.append(((pk, sk), self.apply_operation(record, operation)))
+            for ((pk, sk), record) in records:
+                if record is None:
+                    conn.execute("DELETE FROM records WHERE pk = ? AND sk = ?", (pk, sk))
+                else:
+                    items = dict(record)
+                    items.pop("pk")
+                    items.pop("sk")
+                    conn.execute("INSERT OR REPLACE INTO records (pk, sk, pvalue, items) VALUES (?, ?, ?, ?)", self._to_row(pk, sk, items.pop("pvalue", ""), items))
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            self.logger.error("Transact write exception: {}".format(e))
+            return False
+
+    def save_db_records_batch(self, records, parallel=False):
+        rows = []
+        for record in records:
+            items = dict(record)
+            pk, sk, pvalue = items.pop("pk"), items.pop("sk"), items.pop("pvalue")
+            rows.append(self._to_row(pk, sk, pvalue, items))
+        try:
+            with self.connection as conn:
+                conn.executemany("INSERT OR REPLACE INTO records (pk, sk, pvalue, items) VALUES (?, ?, ?, ?)", rows)
+            return True
+        except Exception as e:
+            self.logger.error("Batch write exception: {}".format(e))
+            return False
+
+    def delete_db_records_batch(self, keys, parallel=False):
+        try:
+            with self.connection as conn:
+                conn.executemany("DELETE FROM records WHERE pk = ? AND sk = ?", list(keys))
+            return True
+        except Exception as e:
+            self.logger.error("Batch delete exception: {}".format(e))
+            return False
+
+    def purge_expired_db_records(self, now=None):
+        if now is None:
+            now = time.time()
+        try:
+            with self.connection as conn:
+                cursor = conn.execute("DELETE FROM records WHERE json_extract(items, ?) <= ?", ("$." + TTL_ATTRIBUTE, now))
+            return cursor.rowcount
+        except Exception as e:
+            self.logger.error("Purge expired records exception: {}".format(e))
+            return 0
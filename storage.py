@@ -0,0 +1,103 @@
+"""
+Storage backend selection
+STORAGE_BACKEND environment variable selects the backend:
+    dynamodb -- DynamoDB table (default), see DYNAMODB_TABLE_NAME, DYNAMODB_ENDPOINT_URL
+    sqlite -- SQLite database file for single-node deployments, see SQLITE_DB_PATH
+    memory -- in-memory table, data are lost when the process ends
+
+Run as a script to move data between the backends:
+    python storage.py export -b dynamodb -f dump.jsonl
+    python storage.py import -b sqlite -f dump.jsonl
+    python storage.py copy -b dynamodb -t sqlite
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from single_table import record_to_json, record_from_json
+
+DEFAULT_STORAGE_BACKEND = "dynamodb"
+STORAGE_BACKENDS = ["dynamodb", "sqlite", "memory"]
+# records written at once by import/copy
+IMPORT_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+def get_shared_table(backend = None):
+    """return the process-wide storage object of the selected backend
+
+    arguments:
+    backend -- backend name, default is STORAGE_BACKEND env variable
+    """
+    if backend is None:
+        backend = os.getenv("STORAGE_BACKEND", DEFAULT_STORAGE_BACKEND)
+
+    if backend == "dynamodb":
+        from ddb_single_table_obj import DDB_Single_Table
+        return DDB_Single_Table.shared()
+    elif backend == "sqlite":
+        from sqlite_single_table_obj import SQLite_Single_Table
+        return SQLite_Single_Table.shared()
+    elif backend == "memory":
+        from memory_single_table_obj import Memory_Single_Table
+        return Memory_Single_Table.shared()
+    else:
+        raise ValueError("unknown storage backend \"{}\"".format(backend))
+
+def export_records(table, out_file):
+    """write all records as JSON lines, return number of records"""
+    count = 0
+    for record in table.iter_all_db_records():
+        out_file.write(record_to_json(record) + "\n")
+        count += 1
+    return count
+
+def import_records(table, records):
+    """save records (iterable of dicts) in batches, return number of records"""
+    count = 0
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            table.save_db_records_batch(batch, parallel=True)
+            count += len(batch)
+            batch = []
+    if batch:
+        table.save_db_records_batch(batch, parallel=True)
+        count += len(batch)
+    return count
+
+def read_records(in_file):
+    for line in in_file:
+        if line.strip():
+            yield record_from_json(line)
+
+def handler():
+    parser = argparse.ArgumentParser(description="export/import records of the Bot's storage")
+    parser.add_argument("command", choices=["export", "import", "copy"])
+    parser.add_argument("-b", "--backend", help="storage backend (source for export/copy, target for import), default STORAGE_BACKEND env variable", choices=STORAGE_BACKENDS)
+    parser.add_argument("-t", "--target", help="target backend for copy", choices=STORAGE_BACKENDS)
+    parser.add_argument("-f", "--file", help="JSON lines file, default stdout/stdin")
+    args = parser.parse_args()
+
+    table = get_shared_table(args.backend)
+    if args.command == "export":
+        out_file = open(args.file, "w", encoding="utf-8") if args.file else sys.stdout
+        with out_file:
+            count = export_records(table, out_file)
+    elif args.command == "import":
+        in_file = open(args.file, "r", encoding="utf-8") if args.file else sys.stdin
+        with in_file:
+            count = import_records(table, read_records(in_file))
+    else:
+        if args.target is None:
+            parser.error("copy requires --target")
+        count = import_records(get_shared_table(args.target), table.iter_all_db_records())
+
+    print("{}: {} records".format(args.command, count), file=sys.stderr)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    handler()
@@ -0,0 +1,115 @@
+from unittest import TestCase
+import os
+
+from botocore.stub import Stubber, ANY
+
+# the requests are answered by the stubber, only the client needs a region
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from ddb_single_table_obj import DDB_Single_Table, GSI_DEFINITIONS, GSI_PK_PVALUE, BATCH_WRITE_SIZE
+
+TABLE_NAME = "test_table"
+
+class StubbedTable(DDB_Single_Table):
+    """DynamoDB table object which doesn't describe (or create) the table, all indexes are active"""
+
+    def setup_table(self):
+        self._active_indexes = set(GSI_DEFINITIONS.keys())
+
+def ddb_item(pk, sk, pvalue):
+    return {"pk": {"S": pk}, "sk": {"S": sk}, "pvalue": {"S": pvalue}}
+
+class DDBSingleTableTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.db = StubbedTable(TABLE_NAME)
+        # query and batch writes go through the resource, both use its client
+        self.stubber = Stubber(self.db.db.meta.client)
+        self.stubber.activate()
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+        self.stubber.deactivate()
+
+    def add_query_pages(self, pages, params):
+        """stub query responses of the pages (lists of items), each page but the last one has LastEvaluatedKey"""
+        start_key = None
+        for (index, page) in enumerate(pages):
+            response = {"Items": page}
+            if index < len(pages) - 1:
+                response["LastEvaluatedKey"] = {"pk": page[-1]["pk"], "sk": page[-1]["sk"]}
+            expected_params = {"TableName": TABLE_NAME, "KeyConditionExpression": ANY, "ScanIndexForward": True, "Limit": 2, **params}
+            if start_key is not None:
+                expected_params["ExclusiveStartKey"] = {"pk": start_key["pk"]["S"], "sk": start_key["sk"]["S"]}
+            self.stubber.add_response("query", response, expected_params)
+            start_key = response.get("LastEvaluatedKey")
+
+    def test_pages_index(self):
+        pages = [[ddb_item("room_1", "person_{}".format(i), "PRESENT") for i in range(start, start + 2)] for start in (0, 2)] + [[ddb_item("room_1", "person_4", "PRESENT")]]
+        self.add_query_pages(pages, {"IndexName": GSI_PK_PVALUE})
+        records = list(self.db.iter_db_records("room_1", "PRESENT", page_size=2))
+        self.assertEqual([record["sk"] for record in records], ["person_{}".format(i) for i in range(5)])
+        self.stubber.assert_no_pending_responses()
+
+    def test_pages_filter(self):
+        # table not migrated yet, pvalue is a filter of the pk query, a filtered page may be empty and still have a next one
+        self.db._active_indexes = set()
+        pages = [[ddb_item("room_1", "person_0", "PRESENT"), ddb_item("room_1", "person_1", "PRESENT")], [], [ddb_item("room_1", "person_2", "PRESENT")]]
+        start_keys = [None, {"pk": "room_1", "sk": "person_1"}, {"pk": "room_1", "sk": "person_1a"}]
+        for (index, page) in enumerate(pages):
+            response = {"Items": page}
+            if index < len(pages) - 1:
+                next_key = start_keys[index + 1]
+                response["LastEvaluatedKey"] = {"pk": {"S": next_key["pk"]}, "sk": {"S": next_key["sk"]}}
+            expected_params = {"TableName": TABLE_NAME, "KeyConditionExpression": ANY, "FilterExpression": ANY, "ScanIndexForward": True, "Limit": 2}
+            if start_keys[index] is not None:
+                expected_params["ExclusiveStartKey"] = start_keys[index]
+            self.stubber.add_response("query", response, expected_params)
+        records = list(self.db.iter_db_records("room_1", "PRESENT", page_size=2))
+        self.assertEqual([record["sk"] for record in records], ["person_0", "person_1", "person_2"])
+        self.stubber.assert_no_pending_responses()
+
+    def test_batch_unprocessed(self):
+        records = [{"pk": "room_1", "sk": "person_{}".format(i), "pvalue": "PRESENT"} for i in range(3)]
+        self.stubber.add_response("batch_write_item", {"UnprocessedItems": {TABLE_NAME: [{"PutRequest": {"Item": ddb_item("room_1", "person_2", "PRESENT")}}]}},
+            {"RequestItems": {TABLE_NAME: [{"PutRequest": {"Item": record}} for record in records]}})
+        self.stubber.add_response("batch_write_item", {"UnprocessedItems": {}},
+            {"RequestItems": {TABLE_NAME: [{"PutRequest": {"Item": records[2]}}]}})
+        self.assertTrue(self.db.save_db_records_batch(records))
+        self.stubber.assert_no_pending_responses()
+
+    def test_batch_chunks(self):
+        # duplicate keys are sent once (the last one), the rest in chunks of BATCH_WRITE_SIZE
+        keys = [("room_1", "person_{}".format(i)) for i in range(BATCH_WRITE_SIZE + 5)]
+        requests = [{"DeleteRequest": {"Key": {"pk": pk, "sk": sk}}} for (pk, sk) in keys]
+        self.stubber.add_response("batch_write_item", {"UnprocessedItems": {}}, {"RequestItems": {TABLE_NAME: requests[:BATCH_WRITE_SIZE]}})
+        self.stubber.add_response("batch_write_item", {"UnprocessedItems": {}}, {"RequestItems": {TABLE_NAME: requests[BATCH_WRITE_SIZE:]}})
+        self.assertTrue(self.db.delete_db_records_batch(keys + keys[:3]))
+        self.stubber.assert_no_pending_responses()
+
+    def test_batch_failed(self):
+        self.stubber.add_client_error("batch_write_item", "ProvisionedThroughputExceededException")
+        self.assertFalse(self.db.save_db_records_batch([{"pk": "room_1", "sk": "person_1", "pvalue": "PRESENT"}]))
+
+    def test_cache_invalidated_after_write(self):
+        db = StubbedTable(TABLE_NAME, cache_size = 10)
+        old_record = {"pk": "room_1", "sk": "SETTINGS", "pvalue": "SETTINGS", "language": "cs_CZ"}
+        def concurrent_read(**kwargs):
+            # another thread reads the record while it's being written
+            db.cache.put("room_1", "SETTINGS", old_record)
+        for client in (db.db.meta.client, db.db_client):
+            client.meta.events.register("before-parameter-build.dynamodb.*", concurrent_read)
+
+        with Stubber(db.db.meta.client) as stubber:
+            stubber.add_response("batch_write_item", {"UnprocessedItems": {}})
+            db.save_db_records_batch([{**old_record, "language": "en_US"}])
+        self.assertEqual(db.cache.get("room_1", "SETTINGS"), (False, None))
+
+        with Stubber(db.db_client) as stubber:
+            stubber.add_response("update_item", {})
+            db.transact_write_db_records([{"update": ("room_1", "SETTINGS"), "set": {"language": "en_US"}}])
+        self.assertEqual(db.cache.get("room_1", "SETTINGS"), (False, None))
+
+if __name__ == "__main__":
+    unittest.main()
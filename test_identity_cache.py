@@ -0,0 +1,58 @@
+from unittest import TestCase
+from types import SimpleNamespace
+import threading
+import time
+
+from identity_cache import IdentityCache
+
+class IdentityCacheTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.calls = 0
+        self.loaded = threading.Event()
+        self.cache = IdentityCache(refresh = 3600)
+        self.cache.register("bot_info", self.load)
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+
+    def load(self):
+        self.calls += 1
+        self.loaded.set()
+        return {"id": "bot_{}".format(self.calls)}
+
+    def test_load_once(self):
+        for i in range(100):
+            self.assertEqual(self.cache.get("bot_info"), {"id": "bot_1"})
+        self.assertEqual(self.calls, 1)
+
+    def test_not_cached_none(self):
+        self.cache.register("my_url", lambda: None)
+        self.assertEqual(self.cache.get("my_url"), None)
+        self.cache.register("my_url", lambda: "https://example.com")
+        self.assertEqual(self.cache.get("my_url"), "https://example.com")
+
+    def test_background_refresh(self):
+        self.cache.get("bot_info")
+        self.cache.refresh = 0
+        self.loaded.clear()
+        self.assertEqual(self.cache.get("bot_info"), {"id": "bot_1"}) # stale value returned immediately
+        self.assertTrue(self.loaded.wait(5))
+        self.cache.refresh = 3600
+        for i in range(100):
+            if self.cache.get("bot_info") == {"id": "bot_2"}:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.cache.get("bot_info"), {"id": "bot_2"})
+        self.assertEqual(self.calls, 2)
+
+    def test_invalidate_on_auth_error(self):
+        self.cache.get("bot_info")
+        self.cache.invalidate_on_auth_error(SimpleNamespace(status_code=404))
+        self.assertEqual(self.cache.get("bot_info"), {"id": "bot_1"})
+        self.cache.invalidate_on_auth_error(SimpleNamespace(status_code=401))
+        self.assertEqual(self.cache.get("bot_info"), {"id": "bot_2"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+from unittest import TestCase
+import threading
+import time
+
+from lane_executor import LaneExecutor
+
+class LaneExecutorTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.executor = LaneExecutor(lanes = 8, backlog = 50)
+        self.lock = threading.Lock()
+        self.events = {}
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+
+    def record(self, key, value, delay = 0):
+        time.sleep(delay)
+        with self.lock:
+            self.events.setdefault(key, []).append(value)
+
+    def test_key_order(self):
+        for i in range(20):
+            for key in ["room_a", "room_b", "room_c"]:
+                self.executor.submit(key, self.record, key, i, delay = 0.001 * (i % 3))
+        self.executor.join()
+        for key in ["room_a", "room_b", "room_c"]:
+            self.assertEqual(self.events[key], list(range(20)))
+        self.assertEqual(self.executor.lane_index("room_a"), LaneExecutor(lanes = 8).lane_index("room_a"))
+
+    def test_lanes_in_parallel(self):
+        keys = []
+        index = 0
+        while len(keys) < 4: # keys in different lanes
+            key = "room_{}".format(index)
+            if self.executor.lane_index(key) not in [self.executor.lane_index(k) for k in keys]:
+                keys.append(key)
+            index += 1
+
+        started = time.monotonic()
+        for key in keys:
+            self.executor.submit(key, self.record, key, 1, delay = 0.2)
+        self.executor.join()
+        self.assertLess(time.monotonic() - started, 0.6)
+
+    def test_backlog_and_stats(self):
+        executor = LaneExecutor(lanes = 2, backlog = 1)
+        release = threading.Event()
+        results = [executor.submit("room_a", release.wait, 5) for i in range(4)]
+        self.assertIn(False, results)
+        time.sleep(0.05)
+        release.set()
+        executor.join()
+
+        stats = executor.stats()
+        lane = stats["lanes"][executor.lane_index("room_a")]
+        self.assertEqual(lane["dropped"], results.count(False))
+        self.assertEqual(lane["processed"], results.count(True))
+        self.assertEqual(stats["dropped"], results.count(False))
+        self.assertGreaterEqual(lane["max_latency"], 0.04)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+from unittest import TestCase
+from unittest.mock import patch
+import os
+import tempfile
+
+from memory_single_table_obj import Memory_Single_Table
+from single_table import TTL_ATTRIBUTE
+from results_codec import results_key
+import lifecycle
+
+class LifecycleTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.archive = lifecycle.DirectoryArchive(self.tmp_dir.name)
+        self.db = Memory_Single_Table()
+        # finished meeting with one poll
+        self.db.save_db_record("room_1", "2021-05-01T10:00:00.000Z", "MEETING_START", subject="first")
+        self.db.save_db_record("room_1", "2021-05-01T11:00:00.000Z", "MEETING_END")
+        self.db.save_db_record("room_1", "form_1", "RESULTS", subject="poll", timestamp="2021-05-01T10:30:00.000Z")
+        self.db.save_db_record("form_1", "person_1", "POLL_DATA", vote="yea")
+        self.db.save_db_record("form_1", "POLL_TALLY", "POLL_TALLY", yea=1)
+        # running meeting
+        self.db.save_db_record("room_1", "2021-05-02T10:00:00.000Z", "MEETING_START", subject="second")
+        self.db.save_db_record(results_key("room_1", "2021-05-02T10:00:00.000Z"), "form_2", "RESULTS", subject="poll", timestamp="2021-05-02T10:30:00.000Z")
+        self.db.save_db_record("room_1", "FSM_STATE", "MEETING_ACTIVE")
+        # finished meeting with meeting-scoped results
+        self.db.save_db_record("room_2", "2021-05-01T10:00:00.000Z", "MEETING_START", subject="first")
+        self.db.save_db_record("room_2", "2021-05-01T11:00:00.000Z", "MEETING_END")
+        self.db.save_db_record(results_key("room_2", "2021-05-01T10:00:00.000Z"), "form_3", "RESULTS", subject="poll", timestamp="2021-05-01T10:30:00.000Z")
+        self.db.save_db_record("form_3", "FORM_INFO", "POLL_FORM")
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+        self.tmp_dir.cleanup()
+
+    def test_ttl_items(self):
+        self.assertEqual(lifecycle.ttl_items("POLL_DATA", now=1000), {TTL_ATTRIBUTE: 1000 + lifecycle.DEFAULT_RECORD_TTL_DAYS["POLL_DATA"] * lifecycle.DAY})
+        self.assertEqual(lifecycle.ttl_items("RESULTS"), {})
+        # the votes are kept until the meeting is archived
+        with patch.dict(os.environ, {"POLL_DATA_TTL_DAYS": "10", "ARCHIVE_AFTER_DAYS": "60"}):
+            self.assertEqual(lifecycle.record_ttl_days("POLL_DATA"), 60 + lifecycle.ARCHIVE_GRACE_DAYS)
+        # only the poll forms expire
+        self.assertIn(TTL_ATTRIBUTE, lifecycle.form_info_ttl_items("POLL_FORM"))
+        self.assertEqual(lifecycle.form_info_ttl_items("WELCOME_FORM"), {})
+
+    def test_purge(self):
+        self.db.save_db_record("form_4", "person_1", "POLL_DATA", vote="nay", **lifecycle.ttl_items("POLL_DATA", now=0))
+        self.db.save_db_record("form_4", "person_2", "POLL_DATA", vote="nay", **lifecycle.ttl_items("POLL_DATA"))
+        self.assertEqual(self.db.purge_expired_db_records(), 1)
+        self.assertEqual([record["sk"] for record in self.db.iter_db_records("form_4")], ["person_2"])
+
+    def test_find_finished_meetings(self):
+        self.assertEqual(lifecycle.find_finished_meetings(self.db, "2021-06-01"), [("room_1", "2021-05-01T10:00:00.000Z", "2021-05-01T11:00:00.000Z"), ("room_2", "2021-05-01T10:00:00.000Z", "2021-05-01T11:00:00.000Z")])
+        self.assertEqual(lifecycle.find_finished_meetings(self.db, "2021-05-01T10:59"), [])
+
+    def test_archive_rehydrate(self):
+        all_records = sorted(self.db.iter_all_db_records(), key=lambda x: (x["pk"], x["sk"]))
+        archived = lifecycle.archive_meetings(self.db, self.archive, older_than_days=1)
+        self.assertEqual(archived, [(lifecycle.archive_name("room_1", "2021-05-01T10:00:00.000Z"), 5), (lifecycle.archive_name("room_2", "2021-05-01T10:00:00.000Z"), 4)])
+        self.assertEqual(self.archive.list("meetings/room_1"), [archived[0][0]])
+        self.assertEqual(self.db.query_db_record("form_1"), [])
+        self.assertEqual(self.db.query_db_record("form_3"), [])
+        self.assertEqual(self.db.query_db_record("room_2"), [])
+        self.assertEqual([record["sk"] for record in self.db.query_db_record("room_1")], ["2021-05-02T10:00:00.000Z", "FSM_STATE"])
+
+        self.assertEqual(lifecycle.rehydrate_meeting(self.db, self.archive, archived[0][0], keep_days=0), 5)
+        self.assertEqual(lifecycle.rehydrate_meeting(self.db, self.archive, archived[1][0], keep_days=0), 4)
+        self.assertEqual(sorted(self.db.iter_all_db_records(), key=lambda x: (x["pk"], x["sk"])), all_records)
+
+if __name__ == "__main__":
+    unittest.main()
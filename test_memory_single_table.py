@@ -0,0 +1,34 @@
+from unittest import TestCase
+import threading
+
+from memory_single_table_obj import Memory_Single_Table
+from single_table_tests import SingleTableTests
+
+class MemorySingleTableTest(SingleTableTests, TestCase):
+
+    def make_table(self):
+        return Memory_Single_Table()
+
+    def test_returned_copy(self):
+        record = self.db.get_db_record("room_1", "person_1")
+        record["status"] = False
+        self.assertEqual(self.db.get_db_record("room_1", "person_1")["status"], True)
+
+    def test_overwrite_pvalue(self):
+        self.db.save_db_record("room_1", "person_1", "ABSENT")
+        self.assertEqual(self.db.query_db_record("room_1", "PRESENT"), [])
+        self.assertEqual(len(self.db.query_db_record("room_1", "ABSENT")), 1)
+
+    def test_parallel_writes(self):
+        def writer(n):
+            for i in range(200):
+                self.db.save_db_record("form_1", "person_{}_{}".format(n, i), "POLL_DATA", vote="yea")
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.db.query_db_record("form_1", "POLL_DATA")), 800)
+
+if __name__ == "__main__":
+    unittest.main()
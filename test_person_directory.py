@@ -0,0 +1,72 @@
+from unittest import TestCase
+from types import SimpleNamespace
+import threading
+
+from memory_single_table_obj import Memory_Single_Table
+from person_directory import PersonDirectory, PEOPLE_LIST_MAX_IDS
+
+class FakePeopleAPI():
+    """people.list() returning names of known ids, unknown ids are left out like Webex does"""
+
+    def __init__(self, names):
+        self.names = names
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def list(self, id=None, **kwargs):
+        person_ids = id.split(",")
+        with self.lock:
+            self.calls.append(person_ids)
+        return [SimpleNamespace(id=person_id, displayName=self.names[person_id]) for person_id in person_ids if person_id in self.names]
+
+class PersonDirectoryTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.people = FakePeopleAPI({"person_{}".format(i): "First Last{}".format(i) for i in range(200)})
+        self.db = Memory_Single_Table()
+        self.directory = PersonDirectory(SimpleNamespace(people=self.people), self.db, cache_size=1000, refresh=3600)
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+
+    def test_batches(self):
+        person_ids = ["person_{}".format(i) for i in range(200)] + ["unknown"]
+        names = self.directory.get_display_names(person_ids)
+        self.assertEqual(len(names), 200)
+        self.assertEqual(names["person_7"], "First Last7")
+        self.assertEqual(len(self.people.calls), 3)
+        self.assertTrue(all(len(call) <= PEOPLE_LIST_MAX_IDS for call in self.people.calls))
+        self.assertEqual(self.directory.get_display_name("unknown"), None)
+
+    def test_parallel_stats(self):
+        directory = PersonDirectory(SimpleNamespace(people=self.people), cache_size=1000, refresh=3600)
+        def lookup(n):
+            directory.get_display_names(["person_{}".format(i) for i in range(n * 50, n * 50 + 50)] * 2)
+        threads = [threading.Thread(target=lookup, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = directory.stats()
+        self.assertEqual((stats["requests"], stats["fetched"]), (len(self.people.calls), 200))
+
+    def test_memory_cache(self):
+        self.directory.get_display_names(["person_1", "person_2"])
+        self.assertEqual(self.directory.get_display_names(["person_1", "person_2"]), {"person_1": "First Last1", "person_2": "First Last2"})
+        self.assertEqual(len(self.people.calls), 1)
+
+    def test_persistent_tier(self):
+        self.directory.get_display_names(["person_1", "person_2"])
+        self.assertEqual(self.db.get_db_record("person_1", "PERSON")["display_name"], "First Last1")
+        other_directory = PersonDirectory(SimpleNamespace(people=self.people), self.db, refresh=3600)
+        self.assertEqual(other_directory.get_display_names(["person_1", "person_2", "person_3"]), {"person_1": "First Last1", "person_2": "First Last2", "person_3": "First Last3"})
+        self.assertEqual(self.people.calls[-1], ["person_3"])
+
+    def test_refresh(self):
+        self.db.save_db_record("person_1", "PERSON", "PERSON", display_name="Old Name", refreshed_at=0)
+        self.assertEqual(self.directory.get_display_name("person_1"), "First Last1")
+        self.assertEqual(self.db.get_db_record("person_1", "PERSON")["display_name"], "First Last1")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,18 @@
 from unittest import TestCase
+from unittest.mock import patch
+from types import SimpleNamespace
 from flask.testing import FlaskClient
 import os
+import io
 import json
+import requests
+
+# the Bot runs on the memory backend, no Webex request is made by the tests
+os.environ.setdefault("WEBEX_TEAMS_ACCESS_TOKEN", "test_token")
+os.environ["STORAGE_BACKEND"] = "memory"
+
+from webexteamssdk.exceptions import RateLimitError
+import poll_bot
 
 class BotTest(TestCase):
     
@@ -13,6 +24,187 @@ class BotTest(TestCase):
     def tearDown(self):
         print("tear down {}".format(self.__class__.__name__))
 
+class BotStorageTest(TestCase):
+    """poll_bot functions on an empty memory table"""
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        poll_bot.init_globals()
+        self.db = poll_bot.ddb
+        self.db.delete_db_records_batch([(record["pk"], record["sk"]) for record in list(self.db.iter_all_db_records())])
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+
+class FSMTest(BotStorageTest):
+
+    def setUp(self):
+        super().setUp()
+        self.actions = []
+        def act_test(room_id, event_name, settings, args_dict):
+            self.actions.append((self.db.get_db_record(room_id, "FSM_STATE", consistent_read = True)["pvalue"], event_name))
+        test_fsm = [
+            [None, "ev_start", act_test, "IDLE"],
+            ["IDLE", "ev_next", act_test, "STATE_A"],
+            ["STATE_B", "ev_next", act_test, "STATE_C"],
+            ["any_state", "ev_ping", act_test, "same_state"]
+        ]
+        self.fsm_patch = patch.object(poll_bot, "MEETING_FSM", test_fsm)
+        self.fsm_patch.start()
+
+    def tearDown(self):
+        self.fsm_patch.stop()
+        super().tearDown()
+
+    def state(self):
+        return poll_bot.get_current_state_version("room_1", consistent_read = True)
+
+    def test_transition(self):
+        poll_bot.fsm_handle_event.sync("room_1", "ev_start")
+        self.assertEqual(self.state(), ("IDLE", 1))
+        poll_bot.fsm_handle_event.sync("room_1", "ev_next")
+        self.assertEqual(self.state(), ("STATE_A", 2))
+        # the state is committed before the action
+        self.assertEqual(self.actions, [("IDLE", "ev_start"), ("STATE_A", "ev_next")])
+        poll_bot.fsm_handle_event.sync("room_1", "ev_next") # no transition from STATE_A
+        self.assertEqual(len(self.actions), 2)
+
+    def test_version_conflict(self):
+        poll_bot.fsm_handle_event.sync("room_1", "ev_start")
+        transact_write = self.db.transact_write_db_records
+        def parallel_event(operations):
+            # another event moves the state to STATE_B after it was read
+            if self.state()[0] == "IDLE":
+                self.db.save_db_record("room_1", "FSM_STATE", "STATE_B", version = 2)
+            return transact_write(operations)
+
+        with patch.object(self.db, "transact_write_db_records", side_effect = parallel_event) as write_mock:
+            poll_bot.fsm_handle_event.sync("room_1", "ev_next")
+        self.assertEqual(write_mock.call_count, 2)
+        # the transition is re-evaluated in the new state and done once
+        self.assertEqual(self.state(), ("STATE_C", 3))
+        self.assertEqual(self.actions[1:], [("STATE_C", "ev_next")])
+
+    def test_retries_exhausted(self):
+        poll_bot.fsm_handle_event.sync("room_1", "ev_start")
+        with patch.object(self.db, "transact_write_db_records", return_value = False) as write_mock:
+            poll_bot.fsm_handle_event.sync("room_1", "ev_next")
+        self.assertEqual(write_mock.call_count, poll_bot.FSM_TRANSITION_RETRIES)
+        self.assertEqual(self.state(), ("IDLE", 1))
+        self.assertEqual(len(self.actions), 1)
+
+    def test_same_state(self):
+        poll_bot.fsm_handle_event.sync("room_1", "ev_start")
+        with patch.object(self.db, "transact_write_db_records") as write_mock:
+            poll_bot.fsm_handle_event.sync("room_1", "ev_ping")
+        write_mock.assert_not_called()
+        self.assertEqual(self.state(), ("IDLE", 1))
+        self.assertEqual(self.actions[-1], ("IDLE", "ev_ping"))
+
+class MeetingResultsTest(BotStorageTest):
+
+    def save_results(self, pk, form_id, timestamp):
+        self.db.save_db_record(pk, form_id, "RESULTS", timestamp = timestamp, subject = "poll {}".format(form_id))
+
+    def results(self):
+        results_items, meeting_name = poll_bot.get_last_meeting_results("room_1")
+        return [results["sk"] for results in results_items], meeting_name
+
+    def test_meeting(self):
+        poll_bot.save_last_meeting("room_1", "MEETING_START", "2021-05-01T10:00:00.000Z", "First Meeting")
+        self.assertEqual(poll_bot.get_results_key("room_1"), "MEETING#room_1#2021-05-01T10:00:00.000Z")
+        self.save_results(poll_bot.get_results_key("room_1"), "form_1", "2021-05-01T10:10:00.000Z")
+        self.save_results("room_1", "form_0", "2021-05-01T10:05:00.000Z") # legacy record is not used
+        poll_bot.save_last_meeting("room_1", "MEETING_END", "2021-05-01T11:00:00.000Z", "First Meeting")
+        self.assertEqual(poll_bot.get_last_meeting("room_1")["pvalue"], "MEETING_END")
+        self.assertEqual(self.results(), (["form_1"], "first_meeting"))
+
+        poll_bot.save_last_meeting("room_1", "MEETING_START", "2021-05-02T10:00:00.000Z", "Second Meeting")
+        self.save_results(poll_bot.get_results_key("room_1"), "form_2", "2021-05-02T10:10:00.000Z")
+        self.assertEqual(self.results(), (["form_2"], "second_meeting"))
+
+    def test_legacy_meeting(self):
+        self.db.save_db_record("room_1", "2021-05-01T10:00:00.000Z", "MEETING_START", subject = "Old Meeting")
+        self.db.save_db_record("room_1", "2021-05-01T11:00:00.000Z", "MEETING_END")
+        self.save_results("room_1", "form_1", "2021-05-01T10:10:00.000Z")
+        self.save_results("room_1", "form_2", "2021-05-01T12:00:00.000Z") # after the meeting end
+        self.save_results("room_1", "form_0", "2021-04-30T10:00:00.000Z") # previous meeting
+        self.assertEqual(poll_bot.get_results_key("room_1"), "room_1")
+        self.assertEqual(self.results(), (["form_1"], "old_meeting"))
+        # end of a meeting started before LAST_MEETING existed doesn't create the record
+        poll_bot.save_last_meeting("room_1", "MEETING_END", "2021-05-01T11:00:00.000Z", "Old Meeting")
+        self.assertIsNone(poll_bot.get_last_meeting("room_1"))
+
+    def test_missing_results(self):
+        self.assertEqual(self.results(), ([], ""))
+        poll_bot.save_last_meeting("room_1", "MEETING_START", "2021-05-01T10:00:00.000Z", "Empty Meeting")
+        self.assertEqual(self.results(), ([], "empty_meeting"))
+
+class FileUploadTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+
+    def test_throttled_upload(self):
+        response = requests.Response()
+        response.status_code = 429
+        response.headers["Retry-After"] = "1"
+        response.request = requests.Request("POST", "https://webexapis.com/v1/messages").prepare()
+        response._content = b""
+        bodies = []
+        def post(url, data = None, headers = None):
+            bodies.append(data.read())
+            if len(bodies) == 1:
+                raise RateLimitError(response)
+            return {"id": "message_1", "roomId": "room_1"}
+
+        file_stream = io.BytesIO(b"xlsx file content")
+        with patch.object(poll_bot.webex_api.messages._session, "post", side_effect = post):
+            self.assertEqual(poll_bot.send_file_stream({"roomId": "room_1"}, "results.xlsx", poll_bot.XLSX_CONTENT_TYPE, file_stream), "message_1")
+        # the second upload is complete, not an already consumed body
+        self.assertEqual(len(bodies), 2)
+        self.assertIn(b"xlsx file content", bodies[1])
+
+class WebhookTaskTest(BotStorageTest):
+
+    def setUp(self):
+        super().setUp()
+        self.bot_patches = [patch.object(poll_bot, "get_bot_info", return_value = SimpleNamespace(emails = ["bot@example.com"], displayName = "Bot")),
+            patch.object(poll_bot, "get_bot_id", return_value = "bot_id")]
+        for bot_patch in self.bot_patches:
+            bot_patch.start()
+
+    def tearDown(self):
+        for bot_patch in self.bot_patches:
+            bot_patch.stop()
+        super().tearDown()
+
+    def test_fsm_failure_releases_delivery(self):
+        webhook = {"resource": "memberships", "event": "deleted", "orgId": "org_1",
+            "data": {"id": "membership_fsm_failure", "roomId": "room_1", "personId": "bot_id"}}
+        # the FSM runs in the webhook's invocation, not as another (asynchronous) task
+        with patch.object(poll_bot.fsm_handle_event, "sync", side_effect = RuntimeError("FSM failed")) as fsm_sync:
+            for attempt in range(2):
+                with self.assertRaises(RuntimeError):
+                    poll_bot.handle_webhook_event(webhook)
+        self.assertEqual(fsm_sync.call_count, 2)
+        fsm_sync.assert_called_with("room_1", "ev_removed_from_space")
+
+    def test_vote_fallback_in_room_lane(self):
+        webhook = {"resource": "attachmentActions", "event": "created", "orgId": "org_1",
+            "data": {"id": "action_vote_fallback", "roomId": "room_1", "personId": "person_1", "messageId": "form_1"}}
+        in_attach = SimpleNamespace(to_dict = lambda: {"inputs": {"vote": "yes"}})
+        with patch.object(poll_bot.form_registry, "get", return_value = "POLL_FORM"), \
+            patch.object(poll_bot, "handle_poll_click", return_value = in_attach), \
+            patch.object(poll_bot.webhook_queue, "submit_call", return_value = True) as submit_call, \
+            patch.object(poll_bot.fsm_handle_event, "sync") as fsm_sync:
+            poll_bot.handle_webhook_event(webhook)
+        # the FSM is not run in the voter's lane
+        fsm_sync.assert_not_called()
+        submit_call.assert_called_once_with("room_1", fsm_sync, "room_1", "ev_poll_data", {"inputs": {"vote": "yes"}, "orgId": "org_1"})
 
 if __name__ == "__main__":
     unittest.main()
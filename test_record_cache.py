@@ -0,0 +1,73 @@
+from unittest import TestCase
+import time
+
+from record_cache import RecordCache
+
+TEST_RECORD_1 = {"pk": "room_1", "sk": "FSM_STATE", "pvalue": "WELCOME"}
+TEST_RECORD_2 = {"pk": "room_2", "sk": "FSM_STATE", "pvalue": "MEETING_ACTIVE"}
+
+class RecordCacheTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+
+    def test_hit_miss(self):
+        cache = RecordCache(max_size = 10)
+        self.assertEqual(cache.get("room_1", "FSM_STATE"), (False, None))
+        cache.put("room_1", "FSM_STATE", TEST_RECORD_1)
+        self.assertEqual(cache.get("room_1", "FSM_STATE"), (True, TEST_RECORD_1))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_copy(self):
+        cache = RecordCache(max_size = 10)
+        cache.put("room_1", "FSM_STATE", TEST_RECORD_1)
+        found, record = cache.get("room_1", "FSM_STATE")
+        del(record["pvalue"])
+        self.assertEqual(cache.get("room_1", "FSM_STATE"), (True, TEST_RECORD_1))
+
+    def test_missing_record(self):
+        cache = RecordCache(max_size = 10)
+        cache.put("room_1", "SETTINGS", None)
+        self.assertEqual(cache.get("room_1", "SETTINGS"), (True, None))
+
+    def test_missing_record_ttl(self):
+        # the form info may be saved by another process right after the miss
+        cache = RecordCache(max_size = 10, missing_ttl = 0.01)
+        cache.put("form_1", "FORM_INFO", None)
+        cache.put("form_2", "FORM_INFO", TEST_RECORD_1)
+        self.assertEqual(cache.get("form_1", "FORM_INFO"), (True, None))
+        time.sleep(0.02)
+        self.assertEqual(cache.get("form_1", "FORM_INFO"), (False, None))
+        self.assertEqual(cache.get("form_2", "FORM_INFO"), (True, TEST_RECORD_1))
+
+    def test_uncached_type(self):
+        cache = RecordCache(max_size = 10)
+        cache.put("room_1", "PRESENT", TEST_RECORD_1)
+        self.assertEqual(cache.get("room_1", "PRESENT"), (False, None))
+
+    def test_lru_eviction(self):
+        cache = RecordCache(max_size = 1)
+        cache.put("room_1", "FSM_STATE", TEST_RECORD_1)
+        cache.put("room_2", "FSM_STATE", TEST_RECORD_2)
+        self.assertEqual(cache.get("room_1", "FSM_STATE"), (False, None))
+        self.assertEqual(cache.get("room_2", "FSM_STATE"), (True, TEST_RECORD_2))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl(self):
+        cache = RecordCache(max_size = 10, ttls = {"FSM_STATE": 0.01})
+        cache.put("room_1", "FSM_STATE", TEST_RECORD_1)
+        time.sleep(0.02)
+        self.assertEqual(cache.get("room_1", "FSM_STATE"), (False, None))
+
+    def test_invalidate(self):
+        cache = RecordCache(max_size = 10)
+        cache.put("room_1", "FSM_STATE", TEST_RECORD_1)
+        cache.invalidate("room_1", "FSM_STATE")
+        self.assertEqual(cache.get("room_1", "FSM_STATE"), (False, None))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+import results_codec as rc
+
+class ResultsCodecTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.vote_results = [("person_{}".format(i), "Jméno Příjmení{}".format(i), rc.VOTE_NAMES["yna"[i % 3]]) for i in range(500)]
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+
+    def test_round_trip(self):
+        record = rc.encode_vote_results(self.vote_results)
+        self.assertEqual(record["format_version"], rc.RESULTS_FORMAT_VERSION)
+        self.assertEqual(record["voter_count"], 500)
+        columns = rc.decode_vote_results(record)
+        self.assertEqual(list(zip(columns["person_ids"], columns["names"], columns["votes"])), self.vote_results)
+        self.assertEqual(list(rc.iter_vote_results(record, "name", "vote")), [(name, vote) for (person_id, name, vote) in self.vote_results])
+
+    def test_compact(self):
+        legacy_size = len(str([{"jméno": name, "volba": "zdržel se"} for (person_id, name, vote) in self.vote_results]))
+        self.assertLess(len(rc.encode_vote_results(self.vote_results)["vote_data"]), legacy_size / 4)
+
+    def test_empty(self):
+        record = rc.encode_vote_results([])
+        self.assertEqual(list(rc.iter_vote_results(record, "name", "vote")), [])
+
+    def test_legacy(self):
+        record = {"subject": "poll", "vote_results": [{"jméno": "Jan Novák", "volba": "pro"}, {"volba": "proti"}]}
+        self.assertEqual(list(rc.iter_vote_results(record, "jméno", "volba")), [("Jan Novák", "pro")])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+from unittest import TestCase
+from types import SimpleNamespace
+
+import roster
+
+class RosterTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.members = {"person_{}".format(i): ("Jméno Příjmení{}".format(i), i % 10 == 0) for i in range(1000)}
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+
+    def test_round_trip(self):
+        record = roster.encode_roster(self.members)
+        self.assertEqual(record["member_count"], 1000)
+        self.assertEqual(roster.decode_roster(record), self.members)
+        self.assertEqual(roster.decode_roster(roster.encode_roster({})), {})
+
+    def test_format_version(self):
+        record = roster.encode_roster(self.members)
+        record["format_version"] = roster.ROSTER_FORMAT_VERSION + 1
+        self.assertIsNone(roster.decode_roster(record))
+        del record["format_version"]
+        self.assertIsNone(roster.decode_roster(record))
+
+    def test_moderators(self):
+        self.assertEqual(len(roster.get_moderators(self.members)), 100)
+        self.assertIn("person_10", roster.get_moderators(self.members))
+
+    def test_memberships(self):
+        memberships = [SimpleNamespace(personId="person_1", personDisplayName="First Last", isModerator=True),
+            SimpleNamespace(personId="person_2", personDisplayName=None, isModerator=None)]
+        self.assertEqual(roster.members_from_memberships(memberships), {"person_1": ("First Last", True), "person_2": ("", False)})
+
+if __name__ == "__main__":
+    unittest.main()
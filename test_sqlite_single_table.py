@@ -0,0 +1,57 @@
+from unittest import TestCase
+import decimal
+import io
+import os
+import tempfile
+import threading
+
+from sqlite_single_table_obj import SQLite_Single_Table
+from memory_single_table_obj import Memory_Single_Table
+from single_table_tests import SingleTableTests
+import storage
+
+class SQLiteSingleTableTest(SingleTableTests, TestCase):
+
+    def make_table(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        return SQLite_Single_Table(os.path.join(self.tmp_dir.name, "test.sqlite3"))
+
+    def tearDown(self):
+        super().tearDown()
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    def test_numbers(self):
+        self.db.save_db_record("form_1", "POLL_TALLY", "POLL_TALLY", yea=decimal.Decimal(3), ratio=0.5)
+        record = self.db.get_db_record("form_1", "POLL_TALLY")
+        self.assertEqual(record["yea"], decimal.Decimal(3))
+        self.assertEqual(record["ratio"], decimal.Decimal("0.5"))
+
+    def test_thread_connections(self):
+        def writer(n):
+            for i in range(50):
+                self.db.save_db_record("form_1", "person_{}_{}".format(n, i), "POLL_DATA", vote="yea")
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.db.query_db_record("form_1", "POLL_DATA")), 200)
+
+    def test_purge_expired(self):
+        self.db.save_db_record("form_1", "person_1", "POLL_DATA", vote="yea", expires_at=100)
+        self.db.save_db_record("form_1", "person_2", "POLL_DATA", vote="yea", expires_at=300)
+        self.assertEqual(self.db.purge_expired_db_records(now=200), 1)
+        self.assertEqual([record["sk"] for record in self.db.iter_db_records("form_1")], ["person_2"])
+        self.assertEqual(len(list(self.db.iter_all_db_records())), 6)
+
+    def test_export_import(self):
+        dump = io.StringIO()
+        self.assertEqual(storage.export_records(self.db, dump), 5)
+        dump.seek(0)
+        memory_db = Memory_Single_Table()
+        self.assertEqual(storage.import_records(memory_db, storage.read_records(dump)), 5)
+        self.assertEqual(list(memory_db.iter_all_db_records()), list(self.db.iter_all_db_records()))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+from unittest import TestCase
+import concurrent.futures
+import os
+import tempfile
+
+from sqlite_single_table_obj import SQLite_Single_Table
+from memory_single_table_obj import Memory_Single_Table
+from record_cache import RecordCache
+from form_registry import FormRegistry, read_form_type
+from vote_ingest import VoteIngest, VOTE_SAVED, VOTE_CLOSED, VOTE_FALLBACK
+
+VOTE_CHOICES = ["yea", "nay", "abstain"]
+
+class CachedMemoryTable(Memory_Single_Table):
+    """memory table with a read cache like the DynamoDB backend (misses are cached too)"""
+
+    def __init__(self):
+        super().__init__()
+        self.cache = RecordCache(max_size = 100)
+
+    def get_db_record(self, pk, sk, consistent_read=False):
+        if not consistent_read:
+            found, record = self.cache.get(pk, sk)
+            if found:
+                return record
+        record = super().get_db_record(pk, sk)
+        self.cache.put(pk, sk, record)
+        return record
+
+class VoteIngestTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = SQLite_Single_Table(os.path.join(self.tmp_dir.name, "test.sqlite3"))
+        self.ingest = VoteIngest(self.db, VOTE_CHOICES)
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    def tally(self, form_id):
+        tally = self.db.get_db_record(form_id, "POLL_TALLY", consistent_read=True)
+        return {choice: int(tally.get(choice, 0)) for choice in VOTE_CHOICES}
+
+    def test_vote_and_presence(self):
+        self.ingest.open_poll("form_1")
+        self.assertEqual(self.ingest.save_vote("room_1", "form_1", "person_1", {"vote": "yea"}), VOTE_SAVED)
+        self.assertEqual(self.ingest.save_vote("room_1", "form_1", "person_1", {"vote": "nay"}), VOTE_SAVED)
+        self.assertEqual(self.ingest.save_vote("room_1", "form_1", "person_1", {"vote": "nay"}), VOTE_SAVED)
+        self.assertEqual(self.tally("form_1"), {"yea": 0, "nay": 1, "abstain": 0})
+        self.assertEqual(self.db.get_db_record("form_1", "person_1")["vote"], "nay")
+        self.assertTrue(self.db.get_db_record("room_1", "person_1")["status"])
+
+    def test_closed_poll(self):
+        self.ingest.open_poll("form_1")
+        self.ingest.save_vote("room_1", "form_1", "person_1", {"vote": "yea"})
+        self.assertTrue(self.ingest.close_poll("form_1"))
+        self.assertEqual(self.ingest.save_vote("room_1", "form_1", "person_2", {"vote": "yea"}), VOTE_CLOSED)
+        self.assertIsNone(self.db.get_db_record("form_1", "person_2"))
+        self.assertEqual(self.tally("form_1")["yea"], 1)
+        self.assertEqual(self.ingest.stats()[VOTE_CLOSED], 1)
+
+    def test_legacy_poll(self):
+        # tally without the open flag (poll started before the fast path) or no tally at all
+        self.db.transact_write_db_records([{"update": ("form_1", "POLL_TALLY"), "set": {"pvalue": "POLL_TALLY"}, "add": {"yea": 1}}])
+        self.assertEqual(self.ingest.save_vote("room_1", "form_1", "person_1", {"vote": "yea"}), VOTE_FALLBACK)
+        self.assertEqual(self.ingest.save_vote("room_1", "form_2", "person_1", {"vote": "yea"}), VOTE_FALLBACK)
+        self.assertIsNone(self.db.get_db_record("form_1", "person_1"))
+
+    def test_fsm_path(self):
+        # legacy poll saved without the open flag condition, the tally is created by the first vote
+        self.assertEqual(self.ingest.save_vote("room_1", "form_1", "person_1", {"vote": "yea"}, require_open = False), VOTE_SAVED)
+        self.assertEqual(self.ingest.save_vote("room_1", "form_1", "person_1", {"vote": "nay"}, require_open = False), VOTE_SAVED)
+        self.assertEqual(self.ingest.save_vote("room_1", "form_1", "person_2", {"vote": "nay"}, require_open = False), VOTE_SAVED)
+        self.assertEqual(self.tally("form_1"), {"yea": 0, "nay": 2, "abstain": 0})
+        self.assertNotIn("open", self.db.get_db_record("form_1", "POLL_TALLY"))
+        self.assertTrue(self.db.get_db_record("room_1", "person_2")["status"])
+
+    def test_vote_before_open(self):
+        # a vote saved by the FSM path before the poll was opened is kept
+        self.db.transact_write_db_records([{"update": ("form_1", "POLL_TALLY"), "set": {"pvalue": "POLL_TALLY"}, "add": {"nay": 1}}])
+        self.ingest.open_poll("form_1")
+        self.ingest.save_vote("room_1", "form_1", "person_1", {"vote": "yea"})
+        self.assertEqual(self.tally("form_1"), {"yea": 1, "nay": 1, "abstain": 0})
+
+    def test_parallel_clicks(self):
+        self.ingest.open_poll("form_1")
+        def click(index):
+            person_id = "person_{}".format(index % 50)
+            return self.ingest.save_vote("room_1", "form_1", person_id, {"vote": VOTE_CHOICES[index % 3]})
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers = 8) as executor:
+            results = list(executor.map(click, range(200)))
+        self.assertEqual(set(results), {VOTE_SAVED})
+
+        votes = [record["vote"] for record in self.db.iter_db_records("form_1", "POLL_DATA")]
+        self.assertEqual(len(votes), 50)
+        self.assertEqual(self.tally("form_1"), {choice: votes.count(choice) for choice in VOTE_CHOICES})
+        self.assertIn("latency_p99", self.ingest.stats())
+
+    def test_form_registry(self):
+        loaded = []
+        def loader(form_id):
+            loaded.append(form_id)
+            return "POLL_FORM" if form_id == "form_2" else None
+
+        registry = FormRegistry(loader, max_size = 10, ttl = 60)
+        registry.register("form_1", "POLL_FORM")
+        self.assertEqual(registry.get("form_1"), "POLL_FORM")
+        self.assertEqual(registry.get("form_2"), "POLL_FORM")
+        self.assertEqual(registry.get("form_2"), "POLL_FORM")
+        self.assertIsNone(registry.get("form_3"))
+        self.assertIsNone(registry.get("form_3")) # missing forms are not cached
+        self.assertEqual(loaded, ["form_2", "form_3", "form_3"])
+
+        registry.remove("form_1")
+        self.assertIsNone(registry.get_cached("form_1"))
+
+    def test_form_saved_after_miss(self):
+        # a click comes before another process saved the form info
+        db = CachedMemoryTable()
+        registry = FormRegistry(lambda form_id: read_form_type(db, form_id), max_size = 10, ttl = 60)
+        self.assertIsNone(db.get_db_record("form_1", "FORM_INFO"))
+        self.assertIsNone(registry.get("form_1"))
+        db.save_db_record("form_1", "FORM_INFO", "POLL_FORM")
+        self.assertEqual(registry.get("form_1"), "POLL_FORM")
+        self.assertEqual(registry.stats()["loads"], 2)
+
+if __name__ == "__main__":
+    unittest.main()
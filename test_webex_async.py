@@ -0,0 +1,63 @@
+from unittest import TestCase
+from types import SimpleNamespace
+import asyncio
+import threading
+import time
+
+import webex_scheduler as ws
+from webex_async import AsyncWebexClient
+
+class FakeMessagesAPI():
+    def __init__(self, delay):
+        self.delay = delay
+        self.threads = set()
+
+    def create(self, **kwargs):
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        return SimpleNamespace(id="msg_{}".format(kwargs["roomId"]))
+
+class WebexAsyncTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.messages = FakeMessagesAPI(0.2)
+        self.scheduler = ws.WebexScheduler(rate_limits={"default": (1000, 1000)})
+        self.client = AsyncWebexClient(scheduler=self.scheduler, max_workers=4)
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+        self.client.close()
+
+    def test_concurrent_calls(self):
+        started = time.monotonic()
+        results = self.client.run_concurrently(*[lambda room_id=room_id: self.messages.create(roomId=room_id).id for room_id in range(4)])
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual(results, ["msg_0", "msg_1", "msg_2", "msg_3"])
+        self.assertGreater(len(self.messages.threads), 1)
+
+    def test_coroutines(self):
+        async def create_messages():
+            return await asyncio.gather(self.client.call(self.messages.create, roomId="a"), self.client.call(self.messages.create, roomId="b"))
+
+        messages = self.client.run(create_messages())
+        self.assertEqual([message.id for message in messages], ["msg_a", "msg_b"])
+
+    def test_priority_propagation(self):
+        with self.scheduler.priority(ws.PRIORITY_HIGH):
+            priorities = self.client.run_concurrently(self.scheduler.current_priority, self.scheduler.current_priority)
+        self.assertEqual(priorities, [ws.PRIORITY_HIGH, ws.PRIORITY_HIGH])
+        self.assertEqual(self.client.run_concurrently(self.scheduler.current_priority, lambda: None), [ws.PRIORITY_NORMAL, None])
+
+    def test_single_call(self):
+        self.assertEqual(self.client.run_concurrently(lambda: "direct"), ["direct"])
+        self.assertEqual(self.client.run_concurrently(), [])
+
+    def test_inside_event_loop(self):
+        async def nested():
+            return self.client.run_concurrently(lambda: 1, lambda: 2)
+
+        self.assertEqual(asyncio.run(nested()), [1, 2])
+
+if __name__ == "__main__":
+    unittest.main()
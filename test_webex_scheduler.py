@@ -0,0 +1,84 @@
+from unittest import TestCase
+from types import SimpleNamespace
+import threading
+import time
+import requests
+
+from webexteamssdk.exceptions import RateLimitError
+import webex_scheduler as ws
+
+def rate_limit_error(retry_after):
+    response = requests.Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    response.request = requests.Request("GET", "https://webexapis.com/v1/people").prepare()
+    response._content = b""
+    return RateLimitError(response)
+
+class WebexSchedulerTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.scheduler = ws.WebexScheduler(rate_limits={"messages": (20, 1), "default": (1000, 1000)})
+        self.sent = []
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+
+    def test_endpoint_class(self):
+        self.assertEqual(ws.endpoint_class("https://webexapis.com/v1/messages/123"), "messages")
+        self.assertEqual(ws.endpoint_class("people/me"), "people")
+        self.assertEqual(ws.endpoint_class("https://webexapis.com/v1/"), "default")
+        self.assertEqual(ws.parse_rate_limits("messages=5/10, people=20"), {"messages": (5.0, 10.0), "people": (20.0, 20.0)})
+
+    def test_token_bucket(self):
+        started = time.monotonic()
+        for i in range(5):
+            self.scheduler.acquire("messages")
+        self.assertGreaterEqual(time.monotonic() - started, 0.15) # 1 burst token + 4 tokens at 20/s
+        self.assertEqual(self.scheduler.stats()["messages"]["requests"], 5)
+
+    def test_priority(self):
+        self.scheduler.acquire("messages") # use the burst token, next one is available in 50 ms
+        def send(priority, name):
+            with self.scheduler.priority(priority):
+                self.scheduler.acquire("messages", self.scheduler.current_priority())
+                self.sent.append(name)
+        threads = [threading.Thread(target=send, args=(ws.PRIORITY_LOW, "low_{}".format(i))) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.01)
+        high = threading.Thread(target=send, args=(ws.PRIORITY_HIGH, "high"))
+        high.start()
+        for thread in threads + [high]:
+            thread.join()
+        self.assertEqual(self.sent[0], "high")
+        self.assertEqual(self.scheduler.stats()["messages"]["max_queue_depth"], 4)
+
+    def test_retry_after(self):
+        responses = [rate_limit_error(1), "ok"]
+        def session_request(method, url, erc, **kwargs):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        started = time.monotonic()
+        self.assertEqual(self.scheduler.request(session_request, "GET", "people", 200), "ok")
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+        self.assertEqual(self.scheduler.stats()["people"]["throttled"], 1)
+
+    def test_streamed_body_not_retried(self):
+        def session_request(method, url, erc, **kwargs):
+            raise rate_limit_error(1)
+        with self.assertRaises(RateLimitError):
+            self.scheduler.request(session_request, "POST", "messages", 200, data=SimpleNamespace(read=None))
+
+    def test_install(self):
+        session = SimpleNamespace(wait_on_rate_limit=True, request=lambda method, url, erc, **kwargs: (method, url))
+        self.scheduler.install(SimpleNamespace(_session=session))
+        self.assertFalse(session.wait_on_rate_limit)
+        self.assertEqual(session.request("GET", "rooms", 200), ("GET", "rooms"))
+        self.assertEqual(self.scheduler.stats()["rooms"]["requests"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
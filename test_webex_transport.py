@@ -0,0 +1,63 @@
+from unittest import TestCase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import requests
+
+from webex_transport import WebexTransport, parse_host_pool_sizes
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    failures = 0
+
+    def do_GET(self):
+        if self.path == "/flaky" and Handler.failures > 0:
+            Handler.failures -= 1
+            self.send_response(503)
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def do_POST(self):
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class WebexTransportTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.transport = WebexTransport(pool_connections=2, pool_maxsize=2, connect_timeout=1, read_timeout=2, retries=2, host_pool_sizes={})
+        self.session = requests.Session()
+        self.transport.mount(self.session)
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_stats(self):
+        for i in range(5):
+            self.assertEqual(self.session.get(self.url + "/", timeout=60).status_code, 200)
+        host_stats = self.transport.stats()["127.0.0.1:{}".format(self.server.server_address[1])]
+        self.assertEqual((host_stats["requests"], host_stats["in_flight"], host_stats["max_in_flight"], host_stats["pool_maxsize"]), (5, 0, 1, 2))
+
+    def test_retry_idempotent(self):
+        Handler.failures = 2
+        self.assertEqual(self.session.get(self.url + "/flaky").status_code, 200)
+        self.assertEqual(self.session.post(self.url + "/").status_code, 503) # POST is not retried
+
+    def test_parse_host_pool_sizes(self):
+        self.assertEqual(parse_host_pool_sizes("webexapis.com=32, files.example.com=8"), {"webexapis.com": 32, "files.example.com": 8})
+        self.assertEqual(parse_host_pool_sizes(None), {})
+
+if __name__ == "__main__":
+    unittest.main()
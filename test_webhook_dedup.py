@@ -0,0 +1,72 @@
+from unittest import TestCase
+import concurrent.futures
+
+from memory_single_table_obj import Memory_Single_Table
+from single_table import TTL_ATTRIBUTE
+from webhook_dedup import WebhookDedup
+
+def create_webhook(event_id, resource = "attachmentActions", event = "created"):
+    return {"resource": resource, "event": event, "data": {"id": event_id, "roomId": "room_1"}}
+
+class WebhookDedupTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.db = Memory_Single_Table()
+        self.dedup = WebhookDedup(self.db, window_size = 2)
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+
+    def test_window(self):
+        self.assertFalse(self.dedup.is_duplicate(create_webhook("action_1")))
+        self.assertTrue(self.dedup.is_duplicate(create_webhook("action_1")))
+        self.assertFalse(self.dedup.is_duplicate(create_webhook("action_1", event = "deleted")))
+        stats = self.dedup.stats()
+        self.assertEqual(stats["window_duplicates"], 1)
+        self.assertEqual(stats["drop_rate"], round(1 / 3, 4))
+
+    def test_marker(self):
+        self.assertFalse(self.dedup.is_duplicate(create_webhook("action_1")))
+        marker = self.db.get_db_record("action_1", "DELIVERY#created")
+        self.assertIn(TTL_ATTRIBUTE, marker)
+
+        # another process (or an event dropped from the window) finds the marker
+        other_dedup = WebhookDedup(self.db)
+        self.assertTrue(other_dedup.is_duplicate(create_webhook("action_1")))
+        self.assertEqual(other_dedup.stats()["stored_duplicates"], 1)
+
+        self.dedup.is_duplicate(create_webhook("action_2"))
+        self.dedup.is_duplicate(create_webhook("action_3"))
+        self.assertTrue(self.dedup.is_duplicate(create_webhook("action_1")))
+        self.assertEqual(self.dedup.stats()["window"], 2)
+
+    def test_release(self):
+        # handling failed, the retried invocation (another process) must not be dropped
+        webhook = create_webhook("action_1")
+        self.assertFalse(self.dedup.is_duplicate(webhook))
+        self.dedup.release(webhook)
+        self.assertIsNone(self.db.get_db_record("action_1", "DELIVERY#created"))
+        self.assertFalse(WebhookDedup(self.db).is_duplicate(webhook))
+        self.assertTrue(self.dedup.is_duplicate(webhook))
+        self.assertEqual(self.dedup.stats()["released"], 1)
+
+    def test_parallel_deliveries(self):
+        dedups = [WebhookDedup(self.db) for i in range(8)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers = 8) as executor:
+            results = list(executor.map(lambda dedup: dedup.is_duplicate(create_webhook("action_1")), dedups))
+        self.assertEqual(results.count(False), 1)
+
+    def test_exempt_events(self):
+        webhook = create_webhook("membership_1", resource = "memberships", event = "updated")
+        self.assertFalse(self.dedup.is_duplicate(webhook))
+        self.assertFalse(self.dedup.is_duplicate(webhook))
+        self.assertEqual(self.dedup.stats()["exempt"], 2)
+
+    def test_without_table(self):
+        dedup = WebhookDedup(None)
+        self.assertFalse(dedup.is_duplicate(create_webhook("action_1")))
+        self.assertTrue(dedup.is_duplicate(create_webhook("action_1")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+from unittest import TestCase
+import threading
+import time
+
+from webhook_queue import WebhookQueue, is_valid_webhook
+
+def create_webhook(event_id, room_id = "room_1", resource = "messages"):
+    return {"resource": resource, "event": "created", "data": {"id": event_id, "roomId": room_id}}
+
+class WebhookQueueTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+        self.handled = []
+        self.release = threading.Event()
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+        self.release.set()
+
+    def handler(self, webhook):
+        self.release.wait(5)
+        if webhook["data"]["id"] == "fail":
+            raise ValueError("handler failed")
+        self.handled.append(webhook["data"]["id"])
+
+    def test_validation(self):
+        self.assertTrue(is_valid_webhook(create_webhook("msg_1")))
+        self.assertFalse(is_valid_webhook(None))
+        self.assertFalse(is_valid_webhook({"resource": "messages", "event": "created"}))
+        self.assertFalse(is_valid_webhook({"resource": "messages", "event": "created", "data": {"id": "msg_1"}}))
+
+    def test_submit_returns_immediately(self):
+        webhook_queue = WebhookQueue(self.handler, lanes = 4, backlog = 10)
+        started = time.monotonic()
+        for i in range(4):
+            self.assertTrue(webhook_queue.submit(create_webhook("msg_{}".format(i), room_id = "room_{}".format(i))))
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(self.handled, [])
+
+        self.release.set()
+        webhook_queue.join()
+        self.assertEqual(sorted(self.handled), ["msg_0", "msg_1", "msg_2", "msg_3"])
+        stats = webhook_queue.stats()
+        self.assertEqual(stats["processed"], 4)
+        self.assertEqual(stats["backlog"], 0)
+
+    def test_room_order(self):
+        webhook_queue = WebhookQueue(self.handler, lanes = 4, backlog = 20)
+        self.release.set()
+        for i in range(10):
+            webhook_queue.submit(create_webhook("msg_{}".format(i)))
+        webhook_queue.join()
+        self.assertEqual(self.handled, ["msg_{}".format(i) for i in range(10)])
+
+    def test_drop_when_full(self):
+        webhook_queue = WebhookQueue(self.handler, lanes = 1, backlog = 2)
+        results = [webhook_queue.submit(create_webhook("msg_{}".format(i))) for i in range(5)]
+        # one event is being handled, two are waiting, the rest is dropped
+        self.assertEqual(results.count(False), webhook_queue.stats()["dropped"])
+        self.assertGreaterEqual(results.count(False), 2)
+
+        self.release.set()
+        webhook_queue.join()
+        self.assertEqual(len(self.handled), results.count(True))
+
+    def test_failed_handler(self):
+        webhook_queue = WebhookQueue(self.handler, lanes = 1, backlog = 10)
+        self.release.set()
+        webhook_queue.submit(create_webhook("fail"))
+        webhook_queue.submit(create_webhook("msg_1"))
+        webhook_queue.join()
+        self.assertEqual(self.handled, ["msg_1"])
+        self.assertEqual(webhook_queue.stats()["failed"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
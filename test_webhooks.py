@@ -0,0 +1,108 @@
+from unittest import TestCase
+from types import SimpleNamespace
+
+from webhooks import WEBHOOK_SUBSCRIPTIONS, early_drop_reason, webhook_name, reconcile_webhooks, InboundStats
+
+BOT_ID = "bot_id"
+
+def create_webhook(resource, data, actor_id = "person_1", event = "created"):
+    return {"resource": resource, "event": event, "createdBy": BOT_ID, "actorId": actor_id, "data": {"id": "id_1", "roomId": "room_1", **data}}
+
+class FakeWebhooksAPI():
+    def __init__(self, webhooks):
+        self.webhooks = {webhook.id: webhook for webhook in webhooks}
+        self.calls = []
+
+    def list(self):
+        self.calls.append("list")
+        return list(self.webhooks.values())
+
+    def create(self, name, targetUrl, resource, event, filter=None):
+        self.calls.append("create")
+        webhook_id = "wh_{}".format(len(self.calls))
+        self.webhooks[webhook_id] = create_existing(webhook_id, resource, event, filter, targetUrl)
+
+    def update(self, webhookId, name=None, targetUrl=None, status=None):
+        self.calls.append("update")
+        self.webhooks[webhookId].status = status
+
+    def delete(self, webhookId):
+        self.calls.append("delete")
+        del self.webhooks[webhookId]
+
+def create_existing(webhook_id, resource, event, webhook_filter, target_url, status = "active"):
+    return SimpleNamespace(id=webhook_id, name=webhook_name(resource, event, webhook_filter), resource=resource, event=event, filter=webhook_filter, targetUrl=target_url, status=status)
+
+class WebhooksTest(TestCase):
+
+    def setUp(self):
+        print("\nsetup {}".format(self.__class__.__name__))
+
+    def tearDown(self):
+        print("tear down {}".format(self.__class__.__name__))
+
+    def test_early_drop(self):
+        own_message = create_webhook("messages", {"personId": BOT_ID, "roomType": "direct"}, actor_id = BOT_ID)
+        self.assertEqual(early_drop_reason(own_message), "self_authored")
+        not_mentioned = create_webhook("messages", {"personId": "person_1", "roomType": "group", "mentionedPeople": ["person_2"]})
+        self.assertEqual(early_drop_reason(not_mentioned), "not_mentioned")
+        mentioned = create_webhook("messages", {"personId": "person_1", "roomType": "group", "mentionedPeople": [BOT_ID]})
+        self.assertIsNone(early_drop_reason(mentioned))
+        direct = create_webhook("messages", {"personId": "person_1", "roomType": "direct"})
+        self.assertIsNone(early_drop_reason(direct))
+        # the Bot's membership events are needed (added to / removed from a Space)
+        bot_added = create_webhook("memberships", {"personId": BOT_ID})
+        self.assertIsNone(early_drop_reason(bot_added))
+
+    def test_subscriptions(self):
+        resource_events = set((resource, event) for (resource, event, webhook_filter) in WEBHOOK_SUBSCRIPTIONS)
+        self.assertIn(("memberships", "updated"), resource_events)
+        self.assertIn(("attachmentActions", "created"), resource_events)
+        self.assertEqual(webhook_name("messages", "created", "roomType=direct"), "Webhook for event \"created\" on resource \"messages\" filtered by \"roomType=direct\"")
+
+    def test_reconcile(self):
+        url = "https://bot.example.com/"
+        webhooks_api = FakeWebhooksAPI([create_existing("wh_{}".format(i), resource, event, webhook_filter, url) for (i, (resource, event, webhook_filter)) in enumerate(WEBHOOK_SUBSCRIPTIONS)])
+        webex_api = SimpleNamespace(webhooks=webhooks_api)
+
+        # nothing to change, only the list call
+        result = reconcile_webhooks(webex_api, url)
+        self.assertEqual(len(result["kept"]), len(WEBHOOK_SUBSCRIPTIONS))
+        self.assertEqual(webhooks_api.calls, ["list"])
+
+        # unfiltered messages webhook, inactive webhook, duplicate
+        webhooks_api.calls = []
+        webhooks_api.webhooks["wh_old"] = create_existing("wh_old", "messages", "created", None, url)
+        webhooks_api.webhooks["wh_dup"] = create_existing("wh_dup", "memberships", "created", None, url)
+        webhooks_api.webhooks["wh_5"].status = "inactive"
+        result = reconcile_webhooks(webex_api, url)
+        self.assertEqual(len(result["deleted"]), 2)
+        self.assertEqual(len(result["reactivated"]), 1)
+        self.assertEqual(result["created"], [])
+        self.assertEqual(len(webhooks_api.webhooks), len(WEBHOOK_SUBSCRIPTIONS))
+
+        # new URL, webhooks are created before the old ones are deleted
+        webhooks_api.calls = []
+        result = reconcile_webhooks(webex_api, "https://new.example.com/")
+        self.assertEqual(len(result["created"]), len(WEBHOOK_SUBSCRIPTIONS))
+        self.assertEqual(webhooks_api.calls, ["list"] + ["create"] * len(WEBHOOK_SUBSCRIPTIONS) + ["delete"] * len(WEBHOOK_SUBSCRIPTIONS))
+        self.assertEqual(set(webhook.targetUrl for webhook in webhooks_api.webhooks.values()), {"https://new.example.com/"})
+
+        # dry run doesn't change anything
+        webhooks_api.calls = []
+        result = reconcile_webhooks(webex_api, url, dry_run=True)
+        self.assertEqual(len(result["created"]), len(WEBHOOK_SUBSCRIPTIONS))
+        self.assertEqual(webhooks_api.calls, ["list"])
+
+    def test_inbound_stats(self):
+        inbound_stats = InboundStats()
+        message = create_webhook("messages", {"personId": BOT_ID}, actor_id = BOT_ID)
+        inbound_stats.count(message, early_drop_reason(message))
+        inbound_stats.count(create_webhook("attachmentActions", {}))
+        stats = inbound_stats.stats()
+        self.assertEqual(stats["received"], {"messages/created": 1, "attachmentActions/created": 1})
+        self.assertEqual(stats["dropped"], {"self_authored": 1})
+        self.assertEqual(stats["drop_rate"], 0.5)
+
+if __name__ == "__main__":
+    unittest.main()
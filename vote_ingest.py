@@ -0,0 +1,141 @@
+"""
+Fast path of the poll form clicks
+A click on a poll form doesn't go through the FSM and the settings. The poll tally record
+(pk = form id, sk = "POLL_TALLY") carries an "open" flag, set when the poll is started
+and cleared when it's ended. The vote, the voter's presence and the tally increments are
+written in one transaction which is conditional on the open flag, so a late click is rejected
+by the same write which would save it.
+Polls started before the open flag existed are left to the FSM path (VOTE_FALLBACK), which saves
+the vote by the same write without the open flag condition (the FSM state tells if the poll runs).
+"""
+
+import collections
+import logging
+import threading
+import time
+
+import lifecycle
+
+VOTE_SAVED = "saved"
+VOTE_CLOSED = "closed"
+VOTE_FALLBACK = "fallback"
+
+VOTE_SAVE_RETRIES = 5
+# number of the latest vote latencies kept for the percentiles
+LATENCY_SAMPLES = 1000
+
+class VoteIngest():
+    """poll tally open/close and vote writes
+
+    arguments:
+    table -- storage object
+    vote_choices -- votes counted in the tally
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, table, vote_choices):
+        self.table = table
+        self.vote_choices = vote_choices
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen = LATENCY_SAMPLES)
+        self._stats = {VOTE_SAVED: 0, VOTE_CLOSED: 0, VOTE_FALLBACK: 0, "retries": 0}
+
+    def open_poll(self, form_id):
+        """create the tally of the poll with the open flag, votes which came before are kept"""
+        return self.table.transact_write_db_records([{
+            "update": (form_id, "POLL_TALLY"),
+            "set": {"pvalue": "POLL_TALLY", "open": True, **lifecycle.ttl_items("POLL_TALLY")},
+            "add": {choice: 0 for choice in self.vote_choices}
+        }])
+
+    def close_poll(self, form_id):
+        """clear the open flag, the votes are not accepted anymore"""
+        return self.table.transact_write_db_records([{
+            "update": (form_id, "POLL_TALLY"),
+            "set": {"open": False},
+            "expected": {"open": True}
+        }])
+
+    def save_vote(self, room_id, form_id, person_id, inputs, old_record = None, require_open = True):
+        """save the vote, the voter's presence and the tally change in one write, return VOTE_SAVED, VOTE_CLOSED or VOTE_FALLBACK
+
+        the vote record is written only if it didn't change since it was read, so a changed vote
+        decrements the old choice and increments the new one exactly once
+
+        arguments:
+        room_id -- id of the Space
+        form_id -- id of the poll form message
+        person_id -- id of the voter
+        inputs -- inputs of the attachment action, "vote" is the choice
+        old_record -- voter's current vote record if already read ({} if it doesn't exist), read if None
+        require_open -- save only if the tally has the open flag set, False for the FSM path
+            (the tally is created if needed)
+        """
+        started = time.monotonic()
+        new_vote = inputs.get("vote")
+        for attempt in range(VOTE_SAVE_RETRIES):
+            if attempt > 0 or old_record is None:
+                old_record = self.table.get_db_record(form_id, person_id, consistent_read = attempt > 0) or {}
+            old_vote = old_record.get("vote")
+            deltas = {}
+            if new_vote != old_vote:
+                if new_vote in self.vote_choices:
+                    deltas[new_vote] = 1
+                if old_vote in self.vote_choices:
+                    deltas[old_vote] = -1
+            operations = [
+                {
+                    "put": {"pk": form_id, "sk": person_id, "pvalue": "POLL_DATA", **inputs, **lifecycle.ttl_items("POLL_DATA")},
+                    "expected": {"vote": old_vote} if old_record else {"pk": None}
+                },
+                {"put": {"pk": room_id, "sk": person_id, "pvalue": "PRESENT", "status": True}}
+            ]
+            if require_open:
+                # the tally is always part of the write because of the open flag condition
+                tally_operation = {"update": (form_id, "POLL_TALLY"), "expected": {"open": True}}
+                if deltas:
+                    tally_operation["add"] = deltas
+                else:
+                    tally_operation["set"] = {"open": True}
+                operations.append(tally_operation)
+            elif deltas:
+                operations.append({"update": (form_id, "POLL_TALLY"), "set": {"pvalue": "POLL_TALLY", **lifecycle.ttl_items("POLL_TALLY")}, "add": deltas})
+            if self.table.transact_write_db_records(operations):
+                self._count(VOTE_SAVED, time.monotonic() - started)
+                self.logger.debug("vote saved, form: {}, user: {}, {} -> {}".format(form_id, person_id, old_vote, new_vote))
+                return VOTE_SAVED
+
+            if not require_open:
+                self._count("retries")
+                self.logger.debug("vote changed meanwhile, retry {}, form: {}, user: {}".format(attempt, form_id, person_id))
+                continue
+            tally = self.table.get_db_record(form_id, "POLL_TALLY", consistent_read = True)
+            if tally is None or "open" not in tally:
+                self._count(VOTE_FALLBACK)
+                return VOTE_FALLBACK
+            if not tally["open"]:
+                self._count(VOTE_CLOSED)
+                self.logger.debug("poll closed, vote ignored, form: {}, user: {}".format(form_id, person_id))
+                return VOTE_CLOSED
+            self._count("retries")
+            self.logger.debug("vote changed meanwhile, retry {}, form: {}, user: {}".format(attempt, form_id, person_id))
+
+        self.logger.error("vote save failed, form: {}, user: {}".format(form_id, person_id))
+        self._count(VOTE_FALLBACK)
+        return VOTE_FALLBACK
+
+    def _count(self, result, latency = None):
+        with self._lock:
+            self._stats[result] += 1
+            if latency is not None:
+                self._latencies.append(latency)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+        if latencies:
+            stats["latency_p50"] = round(latencies[len(latencies) // 2], 4)
+            stats["latency_p99"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 4)
+            stats["latency_max"] = round(latencies[-1], 4)
+        return stats
@@ -0,0 +1,74 @@
+"""
+Asyncio interface of the Webex API calls
+The SDK calls are blocking, AsyncWebexClient runs them in a thread pool (loop.run_in_executor)
+so that coroutines can await them and independent calls run concurrently. The calls keep using
+the SDK session, i.e. the pooled transport and the request scheduler. The priority of the calling
+thread (see webex_scheduler.WebexScheduler.priority()) is passed to the worker threads.
+
+The sync facade allows the existing (blocking) code to run independent calls concurrently:
+    message_id, room = webex_async.run_concurrently(
+        lambda: send_message(...),
+        lambda: webex_api.rooms.get(room_id))
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import os
+
+DEFAULT_ASYNC_WORKERS = 16
+
+class AsyncWebexClient():
+    """runs the blocking Webex API calls in a thread pool, as coroutines or concurrently from the sync code
+
+    arguments:
+    scheduler -- WebexScheduler whose priority is passed to the worker threads, optional
+    max_workers -- size of the thread pool, default WEBEX_ASYNC_WORKERS env variable
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, scheduler = None, max_workers = None):
+        if max_workers is None:
+            max_workers = int(os.getenv("WEBEX_ASYNC_WORKERS", DEFAULT_ASYNC_WORKERS))
+        self.scheduler = scheduler
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "webex_async")
+
+    def _with_priority(self, func, priority):
+        if self.scheduler is None:
+            return func
+        def run():
+            with self.scheduler.priority(priority):
+                return func()
+        return run
+
+    async def call(self, func, *args, **kwargs):
+        """run a blocking function in the thread pool"""
+        priority = self.scheduler.current_priority() if self.scheduler is not None else None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._with_priority(functools.partial(func, *args, **kwargs), priority))
+
+    async def gather(self, *functions):
+        """run the blocking functions (without arguments) concurrently, return list of their results"""
+        return await asyncio.gather(*[self.call(func) for func in functions])
+
+    def run(self, coroutine):
+        """sync facade: run the coroutine to completion and return its result
+
+        a thread which already runs an event loop cannot block on it, the coroutine is run in another thread then
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+        with concurrent.futures.ThreadPoolExecutor(max_workers = 1) as executor:
+            return executor.submit(asyncio.run, coroutine).result()
+
+    def run_concurrently(self, *functions):
+        """sync facade: run the blocking functions (without arguments) concurrently, return list of their results"""
+        if len(functions) <= 1:
+            return [func() for func in functions]
+        return self.run(self.gather(*functions))
+
+    def close(self):
+        self.executor.shutdown(wait = False)
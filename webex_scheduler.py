@@ -0,0 +1,200 @@
+"""
+Rate-limit-aware scheduler of the Webex API requests
+install_scheduler() routes all requests of a WebexTeamsAPI object (RestSession.request) through the scheduler:
+- requests are grouped to endpoint classes by the first segment of the API path ("messages", "people", ...)
+- each class has a token bucket (rate per second and burst, WEBEX_RATE_LIMITS="messages=5/10,people=20/20")
+- requests waiting for a token are queued by priority, see priority()
+- HTTP 429 blocks the whole class for the Retry-After period, the request is queued again
+- stats() reports queue depth, waits and throttle counts per class
+"""
+
+import contextlib
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from webexteamssdk.exceptions import RateLimitError
+
+PRIORITY_HIGH = 0 # poll closing, results
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2 # cosmetic, file uploads
+
+# endpoint class -> (requests per second, burst)
+DEFAULT_RATE_LIMITS = {
+    "messages": (5, 10),
+    "default": (20, 20)
+}
+# attempts of a request which received 429
+DEFAULT_RATE_LIMIT_RETRIES = 5
+
+logger = logging.getLogger(__name__)
+
+def parse_rate_limits(rate_limits):
+    """parse "class=rate/burst,class=rate/burst" string to a dict"""
+    limits = {}
+    for item in (rate_limits or "").split(","):
+        if "=" in item:
+            endpoint_class, limit = item.split("=", 1)
+            rate, _, burst = limit.partition("/")
+            limits[endpoint_class.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+def endpoint_class(url):
+    """return endpoint class of the API URL (absolute or relative), for example "messages" for https://webexapis.com/v1/messages/123"""
+    path = urlparse(url).path if "://" in url else url
+    segments = [segment for segment in path.split("/") if segment]
+    if segments and segments[0].startswith("v") and segments[0][1:].isdigit():
+        segments = segments[1:]
+    return segments[0] if segments else "default"
+
+class TokenBucket():
+    """rate tokens per second, up to burst tokens"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """take a token, return 0 if taken or seconds to wait for the next token"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class EndpointClass():
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        self.waiters = [] # heap of (priority, sequence)
+        self.blocked_until = 0
+        self.requests = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.throttled = 0
+        self.max_queue_depth = 0
+
+class WebexScheduler():
+    """token bucket scheduler, see the module description
+
+    arguments:
+    rate_limits -- dict {endpoint class: (rate, burst)}, "default" is used for the other classes; default WEBEX_RATE_LIMITS env variable merged with DEFAULT_RATE_LIMITS
+    max_retries -- attempts of a request which received 429
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, rate_limits = None, max_retries = DEFAULT_RATE_LIMIT_RETRIES):
+        if rate_limits is None:
+            rate_limits = {**DEFAULT_RATE_LIMITS, **parse_rate_limits(os.getenv("WEBEX_RATE_LIMITS"))}
+        self.rate_limits = rate_limits
+        self.max_retries = max_retries
+        self._classes = {}
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def priority(self, priority):
+        """run the requests of the current thread with the priority
+
+        with scheduler.priority(PRIORITY_HIGH):
+            webex_api.messages.delete(form_id)
+        """
+        previous = getattr(self._local, "priority", PRIORITY_NORMAL)
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def current_priority(self):
+        return getattr(self._local, "priority", PRIORITY_NORMAL)
+
+    def _endpoint_class(self, name):
+        ec = self._classes.get(name)
+        if ec is None:
+            rate, burst = self.rate_limits.get(name, self.rate_limits["default"])
+            ec = self._classes[name] = EndpointClass(rate, burst)
+        return ec
+
+    def acquire(self, name, priority = PRIORITY_NORMAL):
+        """wait until a request of the endpoint class can be sent"""
+        with self._condition:
+            ec = self._endpoint_class(name)
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(ec.waiters, ticket)
+            ec.requests += 1
+            ec.max_queue_depth = max(ec.max_queue_depth, len(ec.waiters))
+            started = time.monotonic()
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None # not first in the queue, wait for a notification
+                    if ec.waiters[0] == ticket:
+                        wait = ec.blocked_until - now
+                        if wait <= 0:
+                            wait = ec.bucket.take(now)
+                            if wait == 0:
+                                break
+                    self._condition.wait(wait)
+            finally:
+                ec.waiters.remove(ticket)
+                heapq.heapify(ec.waiters)
+                self._condition.notify_all()
+            waited = time.monotonic() - started
+            if waited > 0.001:
+                ec.waits += 1
+                ec.wait_time += waited
+
+    def throttle(self, name, retry_after):
+        """block the endpoint class for retry_after seconds"""
+        with self._condition:
+            ec = self._endpoint_class(name)
+            ec.blocked_until = max(ec.blocked_until, time.monotonic() + retry_after)
+            ec.throttled += 1
+            self._condition.notify_all()
+        self.logger.warning("{} throttled for {}s".format(name, retry_after))
+
+    def request(self, session_request, method, url, erc, **kwargs):
+        """send the request by session_request (RestSession.request) when the endpoint class allows it"""
+        name = endpoint_class(url)
+        priority = self.current_priority()
+        for attempt in range(self.max_retries):
+            self.acquire(name, priority)
+            try:
+                return session_request(method, url, erc, **kwargs)
+            except RateLimitError as e:
+                self.throttle(name, e.retry_after)
+                # a streamed body (file upload) was consumed, the caller has to build it again (see poll_bot.send_file_stream())
+                if attempt + 1 >= self.max_retries or hasattr(kwargs.get("data"), "read"):
+                    raise
+
+    def install(self, webex_api):
+        """route all requests of the WebexTeamsAPI object through the scheduler"""
+        session = webex_api._session
+        session.wait_on_rate_limit = False # RateLimitError is raised to the scheduler
+        session_request = session.request
+        session.request = lambda method, url, erc, **kwargs: self.request(session_request, method, url, erc, **kwargs)
+
+    def stats(self):
+        with self._condition:
+            return {name: {
+                "queue_depth": len(ec.waiters),
+                "max_queue_depth": ec.max_queue_depth,
+                "requests": ec.requests,
+                "waits": ec.waits,
+                "wait_time": round(ec.wait_time, 3),
+                "throttled": ec.throttled
+            } for (name, ec) in self._classes.items()}
+
+def install_scheduler(webex_api, **kwargs):
+    """create a WebexScheduler and route all requests of the WebexTeamsAPI object through it, return the scheduler"""
+    scheduler = WebexScheduler(**kwargs)
+    scheduler.install(webex_api)
+    return scheduler
@@ -0,0 +1,132 @@
+"""
+HTTP transport of the Webex API calls
+The SDK sends all requests (including the file uploads through messages._session) by one
+requests.Session. install_transport() mounts connection-pooling adapters on it:
+- keep-alive connection pools per host, so the TCP and TLS sessions are reused across requests and threads
+- separate pool size for selected hosts (WEBEX_HOST_POOL_SIZES="webexapis.com=32,other.host=8")
+- connect and read timeouts instead of the SDK's single timeout
+- retries of connection errors and 502/503/504 for idempotent requests (429 is handled by webex_scheduler.py)
+- metrics of pool usage: in-flight requests, their peak and the number of requests started when all pool connections were busy
+"""
+
+import logging
+import os
+import threading
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 32
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+RETRY_BACKOFF = 0.3
+RETRY_STATUS = [502, 503, 504]
+
+logger = logging.getLogger(__name__)
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter with connect/read timeouts and per-host pool usage metrics
+
+    arguments:
+    connect_timeout, read_timeout -- seconds, replace a single number timeout passed by the caller
+    other arguments are passed to HTTPAdapter
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, connect_timeout = DEFAULT_CONNECT_TIMEOUT, read_timeout = DEFAULT_READ_TIMEOUT, **kwargs):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_maxsize = kwargs.get("pool_maxsize", DEFAULT_POOL_MAXSIZE)
+        self._stats_lock = threading.Lock()
+        self._host_stats = {}
+        super().__init__(**kwargs)
+
+    def send(self, request, stream = False, timeout = None, verify = True, cert = None, proxies = None):
+        if timeout is None or isinstance(timeout, (int, float)):
+            timeout = (self.connect_timeout, self.read_timeout)
+
+        host = urlparse(request.url).netloc
+        with self._stats_lock:
+            host_stats = self._host_stats.setdefault(host, {"requests": 0, "in_flight": 0, "max_in_flight": 0, "saturated": 0, "errors": 0})
+            host_stats["requests"] += 1
+            if host_stats["in_flight"] >= self.pool_maxsize:
+                host_stats["saturated"] += 1
+            host_stats["in_flight"] += 1
+            host_stats["max_in_flight"] = max(host_stats["max_in_flight"], host_stats["in_flight"])
+        try:
+            return super().send(request, stream = stream, timeout = timeout, verify = verify, cert = cert, proxies = proxies)
+        except Exception:
+            with self._stats_lock:
+                host_stats["errors"] += 1
+            raise
+        finally:
+            with self._stats_lock:
+                host_stats["in_flight"] -= 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {host: {**host_stats, "pool_maxsize": self.pool_maxsize} for (host, host_stats) in self._host_stats.items()}
+
+def parse_host_pool_sizes(host_pool_sizes):
+    """parse "host=size,host=size" string to a dict"""
+    sizes = {}
+    for item in (host_pool_sizes or "").split(","):
+        if "=" in item:
+            host, size = item.split("=", 1)
+            sizes[host.strip()] = int(size)
+    return sizes
+
+class WebexTransport():
+    """adapters mounted on the SDK session, see install_transport()"""
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, pool_connections = None, pool_maxsize = None, connect_timeout = None, read_timeout = None, retries = None, host_pool_sizes = None):
+        if pool_connections is None:
+            pool_connections = int(os.getenv("WEBEX_POOL_CONNECTIONS", DEFAULT_POOL_CONNECTIONS))
+        if pool_maxsize is None:
+            pool_maxsize = int(os.getenv("WEBEX_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE))
+        if connect_timeout is None:
+            connect_timeout = float(os.getenv("WEBEX_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT))
+        if read_timeout is None:
+            read_timeout = float(os.getenv("WEBEX_READ_TIMEOUT", DEFAULT_READ_TIMEOUT))
+        if retries is None:
+            retries = int(os.getenv("WEBEX_RETRIES", DEFAULT_RETRIES))
+        if host_pool_sizes is None:
+            host_pool_sizes = parse_host_pool_sizes(os.getenv("WEBEX_HOST_POOL_SIZES"))
+
+        def create_adapter(maxsize):
+            retry = Retry(total = retries, connect = retries, read = 0, status = retries,
+                status_forcelist = RETRY_STATUS, allowed_methods = Retry.DEFAULT_ALLOWED_METHODS,
+                backoff_factor = RETRY_BACKOFF, raise_on_status = False, respect_retry_after_header = False) # 429 + Retry-After is handled by the scheduler, see webex_scheduler.py
+            return PooledHTTPAdapter(connect_timeout = connect_timeout, read_timeout = read_timeout,
+                pool_connections = pool_connections, pool_maxsize = maxsize, max_retries = retry)
+
+        self.default_adapter = create_adapter(pool_maxsize)
+        self.host_adapters = {host: create_adapter(size) for (host, size) in host_pool_sizes.items()}
+
+    def mount(self, session):
+        """mount the adapters on a requests.Session"""
+        session.mount("https://", self.default_adapter)
+        session.mount("http://", self.default_adapter)
+        for (host, adapter) in self.host_adapters.items():
+            session.mount("https://{}/".format(host), adapter)
+        self.logger.debug("transport mounted, pool size {}, host pools {}".format(self.default_adapter.pool_maxsize, list(self.host_adapters.keys())))
+
+    def stats(self):
+        """pool usage per host"""
+        stats = self.default_adapter.stats()
+        for adapter in self.host_adapters.values():
+            stats.update(adapter.stats())
+        return stats
+
+def install_transport(webex_api, **kwargs):
+    """mount the pooled transport on the session shared by all calls of the WebexTeamsAPI object, return the WebexTransport
+
+    keyword arguments are passed to WebexTransport, missing ones are read from the WEBEX_* env variables
+    """
+    transport = WebexTransport(**kwargs)
+    transport.mount(webex_api._session._req_session)
+    return transport
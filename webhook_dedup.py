@@ -0,0 +1,105 @@
+"""
+Deduplication of the webhook deliveries
+Webex may deliver the same event more than once and a Lambda invocation can be retried.
+An event is identified by the webhook data id (message, attachment action or membership id)
+and the event name. It's looked up in an in-process window of recently seen events, then a marker
+record (pk = data id, sk = "DELIVERY#<event>") is created by a conditional write, which fails
+if another thread, process or Lambda invocation has already taken the event.
+If the event handling fails, the event is released (window entry and marker removed),
+so that a redelivery or a retried invocation handles it.
+The marker expires after DELIVERY_TTL_DAYS.
+"""
+
+import collections
+import logging
+import os
+import threading
+
+import lifecycle
+
+DEFAULT_DEDUP_WINDOW = 10000
+# events which legitimately repeat with the same data id (e.g. moderator flag set and cleared)
+DEDUP_EXEMPT_EVENTS = [("memberships", "updated")]
+
+class WebhookDedup():
+    """duplicate webhook detection
+
+    arguments:
+    table -- storage object for the marker records, None = in-process window only
+    window_size -- number of events kept in the in-process window, default WEBHOOK_DEDUP_WINDOW env variable
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, table = None, window_size = None):
+        if window_size is None:
+            window_size = int(os.getenv("WEBHOOK_DEDUP_WINDOW", DEFAULT_DEDUP_WINDOW))
+        self.table = table
+        self.window_size = window_size
+        self._window = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"checked": 0, "exempt": 0, "window_duplicates": 0, "stored_duplicates": 0, "released": 0}
+
+    @staticmethod
+    def delivery_key(webhook):
+        """(data id, marker sk) of the webhook"""
+        return webhook["data"]["id"], "DELIVERY#{}".format(webhook["event"])
+
+    def is_duplicate(self, webhook):
+        """return True if the event was already taken, otherwise mark it as taken"""
+        if (webhook["resource"], webhook["event"]) in DEDUP_EXEMPT_EVENTS:
+            with self._lock:
+                self._stats["exempt"] += 1
+            return False
+
+        key = self.delivery_key(webhook)
+        with self._lock:
+            self._stats["checked"] += 1
+            if key in self._window:
+                self._window.move_to_end(key)
+                self._stats["window_duplicates"] += 1
+                return True
+            self._window[key] = True
+            if len(self._window) > self.window_size:
+                self._window.popitem(last = False)
+
+        if self.table is not None and not self._put_marker(webhook, key):
+            with self._lock:
+                self._stats["stored_duplicates"] += 1
+            return True
+
+        return False
+
+    def release(self, webhook):
+        """forget the event taken by is_duplicate(), called if its handling failed"""
+        if (webhook["resource"], webhook["event"]) in DEDUP_EXEMPT_EVENTS:
+            return
+
+        key = self.delivery_key(webhook)
+        with self._lock:
+            self._window.pop(key, None)
+            self._stats["released"] += 1
+        if self.table is not None:
+            self.table.delete_db_record(*key)
+        self.logger.debug("delivery {} {} released".format(*key))
+
+    def _put_marker(self, webhook, key):
+        """create the marker record, return False if it already exists"""
+        pk, sk = key
+        marker = {"pk": pk, "sk": sk, "pvalue": "DELIVERY", "resource": webhook["resource"], **lifecycle.ttl_items("DELIVERY")}
+        if self.table.transact_write_db_records([{"put": marker, "expected": {"pk": None}}]):
+            return True
+
+        # the write also fails on a storage error, the event is handled unless the marker really exists
+        if self.table.get_db_record(pk, sk, consistent_read = True) is None:
+            self.logger.warning("delivery marker {} {} not written, handling the event".format(pk, sk))
+            return True
+        return False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["window"] = len(self._window)
+        duplicates = stats["window_duplicates"] + stats["stored_duplicates"]
+        stats["duplicates"] = duplicates
+        stats["drop_rate"] = round(duplicates / stats["checked"], 4) if stats["checked"] else 0.0
+        return stats
@@ -0,0 +1,64 @@
+"""
+Internal work queue of the webhook events
+The webhook endpoint only validates the event and puts it to the queue, the event handler runs
+in the lane of the event's Space (see lane_executor.py). Webex gets the response in a few
+milliseconds regardless of how long the handling takes.
+- the events of one Space are handled one by one in the order of arrival, Spaces run in parallel
+- each lane has a maximum backlog, an event which doesn't fit is dropped (and counted)
+- stats() reports the backlog, the time the events waited and the handling results per lane
+"""
+
+import logging
+import os
+
+from lane_executor import LaneExecutor, DEFAULT_LANES, DEFAULT_LANE_BACKLOG
+
+REQUIRED_WEBHOOK_KEYS = ["resource", "event", "data"]
+
+logger = logging.getLogger(__name__)
+
+def is_valid_webhook(webhook):
+    """check that the webhook body has the items needed by the event handler"""
+    if not isinstance(webhook, dict):
+        return False
+    if any(key not in webhook for key in REQUIRED_WEBHOOK_KEYS):
+        return False
+    data = webhook["data"]
+    return isinstance(data, dict) and "id" in data and "roomId" in data
+
+class WebhookQueue():
+    """webhook events handled in per-Space lanes
+
+    arguments:
+    handler -- function called with the webhook dict
+    lanes -- number of lanes (threads), default WEBHOOK_LANES env variable
+    backlog -- maximum number of waiting events per lane, default WEBHOOK_LANE_BACKLOG env variable
+    """
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, handler, lanes = None, backlog = None):
+        if lanes is None:
+            lanes = int(os.getenv("WEBHOOK_LANES", DEFAULT_LANES))
+        if backlog is None:
+            backlog = int(os.getenv("WEBHOOK_LANE_BACKLOG", DEFAULT_LANE_BACKLOG))
+        self.handler = handler
+        self.executor = LaneExecutor(lanes = lanes, backlog = backlog, name = "webhook_lane")
+
+    def submit(self, webhook, key = None):
+        """put the webhook to the lane of its Space (or of the key), return False if the lane is full and the webhook was dropped"""
+        if self.executor.submit(key or webhook["data"]["roomId"], self.handler, webhook):
+            return True
+
+        self.logger.error("webhook lane full, dropping {} {} event {}".format(webhook["resource"], webhook["event"], webhook["data"]["id"]))
+        return False
+
+    def submit_call(self, room_id, func, *args, **kwargs):
+        """run other work of the Space (e.g. poll end) in order with its webhook events, return False if the lane is full"""
+        return self.executor.submit(room_id, func, *args, **kwargs)
+
+    def join(self):
+        """wait until all queued webhooks are handled"""
+        self.executor.join()
+
+    def stats(self):
+        return self.executor.stats()
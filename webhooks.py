@@ -0,0 +1,178 @@
+"""
+Webhook subscriptions of the Bot
+WEBHOOK_SUBSCRIPTIONS is the set of webhooks the Bot needs, Webex filters limit the events
+sent to the Bot:
+- messages only from 1-1 Spaces and group Space messages which mention the Bot
+- all memberships events, they keep the Space rosters current (see roster.py)
+- all attachmentActions, they are created only on the Bot's cards
+Events which slip through (for example the Bot's own messages in 1-1 Spaces or events of older
+unfiltered webhooks) are dropped by early_drop_reason(), which uses only the webhook payload.
+
+reconcile_webhooks() compares the Bot's existing webhooks with the desired set by resource, event,
+filter and target URL and only creates, reactivates or deletes the differences. It runs on the
+Bot's GET request and can be run at deploy time:
+    python webhooks.py reconcile -u https://bot.example.com/
+"""
+
+import argparse
+import logging
+import sys
+import threading
+
+from webexteamssdk import WebexTeamsAPI, ApiError
+
+# (resource, event, filter)
+WEBHOOK_SUBSCRIPTIONS = [
+    ("messages", "created", "roomType=direct"),
+    ("messages", "created", "roomType=group&mentionedPeople=me"),
+    ("memberships", "created", None),
+    ("memberships", "updated", None),
+    ("memberships", "deleted", None),
+    ("attachmentActions", "created", None)
+]
+
+logger = logging.getLogger(__name__)
+
+def webhook_name(resource, event, webhook_filter = None):
+    name = "Webhook for event \"{}\" on resource \"{}\"".format(event, resource)
+    if webhook_filter:
+        name += " filtered by \"{}\"".format(webhook_filter)
+    return name
+
+def webhook_spec(webhook):
+    """(resource, event, filter, target URL) of an existing webhook"""
+    return (webhook.resource, webhook.event, webhook.filter or None, webhook.targetUrl)
+
+def reconcile_webhooks(webex_api, target_url, subscriptions = WEBHOOK_SUBSCRIPTIONS, dry_run = False):
+    """make the Bot's webhooks match the subscriptions, return dict of lists of changed webhook specs
+
+    missing webhooks are created before the obsolete ones are deleted, so no event is lost when the target URL changes
+
+    arguments:
+    webex_api -- WebexTeamsAPI object
+    target_url -- URL of the Bot
+    subscriptions -- list of (resource, event, filter)
+    dry_run -- only report the differences
+    """
+    result = {"kept": [], "created": [], "reactivated": [], "deleted": [], "failed": []}
+    desired = [(resource, event, webhook_filter or None, target_url) for (resource, event, webhook_filter) in subscriptions]
+    existing = list(webex_api.webhooks.list())
+
+    obsolete = []
+    found = set()
+    for webhook in existing:
+        spec = webhook_spec(webhook)
+        if spec in desired and spec not in found:
+            found.add(spec)
+            if webhook.status == "active":
+                result["kept"].append(spec)
+                continue
+            logger.info("reactivating webhook {} {}".format(webhook.id, spec))
+            try:
+                if not dry_run:
+                    webex_api.webhooks.update(webhook.id, name = webhook.name, targetUrl = webhook.targetUrl, status = "active")
+                result["reactivated"].append(spec)
+            except ApiError as e:
+                logger.error("webhook {} update failed: {}".format(webhook.id, e))
+                result["failed"].append(spec)
+        else:
+            obsolete.append(webhook)
+
+    for spec in desired:
+        if spec in found:
+            continue
+        resource, event, webhook_filter, url = spec
+        logger.info("creating webhook {}".format(spec))
+        try:
+            if not dry_run:
+                webex_api.webhooks.create(name = webhook_name(resource, event, webhook_filter), targetUrl = url, resource = resource, event = event, filter = webhook_filter)
+            result["created"].append(spec)
+        except ApiError as e:
+            logger.error("webhook {} create failed: {}".format(spec, e))
+            result["failed"].append(spec)
+
+    for webhook in obsolete:
+        spec = webhook_spec(webhook)
+        logger.info("deleting webhook {} {}".format(webhook.id, spec))
+        try:
+            if not dry_run:
+                webex_api.webhooks.delete(webhook.id)
+            result["deleted"].append(spec)
+        except ApiError as e:
+            logger.error("webhook {} delete failed: {}".format(webhook.id, e))
+            result["failed"].append(spec)
+
+    return result
+
+def early_drop_reason(webhook):
+    """return the reason why the event doesn't need handling, None if it has to be handled
+
+    "createdBy" of the webhook is the Bot's id, no API call is needed
+    """
+    if webhook["resource"] != "messages":
+        return None
+    bot_id = webhook.get("createdBy")
+    data = webhook["data"]
+    if bot_id is not None and bot_id in (data.get("personId"), webhook.get("actorId")):
+        return "self_authored"
+    if data.get("roomType") == "group" and bot_id is not None and bot_id not in data.get("mentionedPeople", []):
+        return "not_mentioned"
+    return None
+
+class InboundStats():
+    """counters of the received webhook events and the events dropped early"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.received = {}
+        self.dropped = {}
+
+    def count(self, webhook, drop_reason = None):
+        resource_event = "{}/{}".format(webhook["resource"], webhook["event"])
+        with self._lock:
+            self.received[resource_event] = self.received.get(resource_event, 0) + 1
+            if drop_reason is not None:
+                self.dropped[drop_reason] = self.dropped.get(drop_reason, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            received = sum(self.received.values())
+            dropped = sum(self.dropped.values())
+            return {
+                "received": dict(self.received),
+                "dropped": dict(self.dropped),
+                "drop_rate": round(dropped / received, 4) if received else 0.0,
+                "filters": ["{}/{}?{}".format(resource, event, webhook_filter) for (resource, event, webhook_filter) in WEBHOOK_SUBSCRIPTIONS if webhook_filter]
+            }
+
+def handler():
+    parser = argparse.ArgumentParser(description="list or set up the Bot's webhooks, WEBEX_TEAMS_ACCESS_TOKEN env variable is the Bot's token")
+    parser.add_argument("command", choices=["list", "reconcile"])
+    parser.add_argument("-u", "--url", help="target URL of the webhooks, default the URL of the existing webhooks")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only print the differences")
+    args = parser.parse_args()
+
+    webex_api = WebexTeamsAPI()
+    if args.command == "list":
+        for webhook in webex_api.webhooks.list():
+            print("{} {} {}/{} filter: {} -> {}".format(webhook.id, webhook.status, webhook.resource, webhook.event, webhook.filter, webhook.targetUrl))
+        return
+
+    target_url = args.url
+    if target_url is None:
+        target_urls = set(webhook.targetUrl for webhook in webex_api.webhooks.list())
+        if len(target_urls) != 1:
+            parser.error("target URL can't be determined from the existing webhooks ({}), use --url".format(", ".join(target_urls) or "none"))
+        target_url = target_urls.pop()
+
+    result = reconcile_webhooks(webex_api, target_url, dry_run = args.dry_run)
+    for (change, specs) in result.items():
+        for spec in specs:
+            print("{}: {}".format(change, spec))
+    print("reconcile{}: {}".format(" (dry run)" if args.dry_run else "", ", ".join("{} {}".format(len(specs), change) for (change, specs) in result.items())), file=sys.stderr)
+    if result["failed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    handler()